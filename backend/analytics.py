@@ -0,0 +1,140 @@
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+import attribution
+
+# group_by values for the cube: the attribution dimensions plus the date bucket
+DIMENSIONS = {'date': 'period', **attribution.DIMENSIONS}
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Filter parameter -> analytics_cube() argument
+FILTERS = {
+    'utm_source': 'p_sources',
+    'utm_medium': 'p_mediums',
+    'utm_campaign': 'p_campaigns',
+    'bucket_id': 'p_buckets',
+}
+
+MAX_LIMIT = 10000
+
+EMPTY_TOTAL = {'leads': 0, 'purchases': 0, 'attributed_purchases': 0, 'revenue': 0}
+
+
+async def cube(
+    db,
+    pg,
+    group_by: List[str],
+    granularity: str,
+    start: Optional[date],
+    end: Optional[date],
+    filters: Dict[str, Optional[List[str]]],
+    limit: int,
+) -> List[Dict[str, Any]]:
+    """The grand total row, then the groups (see analytics_cube() in the analytics_cube migration)."""
+    values = [filters.get(name) or None for name in FILTERS]
+    if pg.available:
+        return await pg.fetch(
+            'SELECT * FROM analytics_cube($1, $2, $3, $4, $5, $6, $7, $8, $9)',
+            group_by, granularity, start, end, *values, limit,
+        )
+    result = await db.execute(db.rpc('analytics_cube', {
+        'p_group_by': group_by,
+        'p_granularity': granularity,
+        'p_from': start.isoformat() if start else None,
+        'p_to': end.isoformat() if end else None,
+        **dict(zip(FILTERS.values(), values)),
+        'p_limit': limit,
+    }))
+    return result.data
+
+
+def format_cube(rows: List[Dict[str, Any]], group_by: List[str], limit: int) -> Dict[str, Any]:
+    columns = [DIMENSIONS[name] for name in group_by]
+    total = next((row for row in rows if row['is_total']), None)
+    groups = [row for row in rows if not row['is_total']]
+    return {
+        "groupBy": group_by,
+        "totals": attribution.format_row(total or EMPTY_TOTAL, []),
+        "groups": [attribution.format_row(row, columns) for row in groups[:limit]],
+        "truncated": len(groups) > limit,
+    }
+
+
+async def quiz_answer_stats(
+    db, pg, start: Optional[date], end: Optional[date], question: Optional[str], answer: Optional[str]
+) -> List[Dict[str, Any]]:
+    """Per-answer and per-question rows plus the window total (see the quiz_answer_stats migration)."""
+    if pg.available:
+        return await pg.fetch('SELECT * FROM quiz_answer_stats($1, $2, $3, $4)', start, end, question, answer)
+    result = await db.execute(db.rpc('quiz_answer_stats', {
+        'p_from': start.isoformat() if start else None,
+        'p_to': end.isoformat() if end else None,
+        'p_question': question,
+        'p_answer': answer,
+    }))
+    return result.data
+
+
+def question_order(question: str):
+    """Quiz question ids are "1", "2", ...; sort them as numbers, anything else after."""
+    return (0, int(question), '') if question.isdigit() else (1, 0, question)
+
+
+def format_answer(row: Dict[str, Any], question_sessions: int) -> Dict[str, Any]:
+    leads = int(row['leads'])
+    revenue = float(row['revenue'] or 0)
+    return {
+        "answer": row['answer'],
+        "sessions": int(row['sessions']),
+        # Of the sessions that answered the question; adds up to more than 100 for multi-select
+        "share": attribution.conversion_rate(int(row['sessions']), question_sessions),
+        "completionRate": attribution.conversion_rate(int(row['completed']), int(row['sessions'])),
+        "leads": leads,
+        "purchases": int(row['purchases']),
+        "conversionRate": attribution.conversion_rate(int(row['purchases']), leads),
+        "revenue": round(revenue, 2),
+        "revenuePerLead": round(revenue / leads, 2) if leads > 0 else 0,
+    }
+
+
+def format_quiz_answers(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Questions in quiz order, each with its drop-off from the previous one and its answers by popularity."""
+    total = next((row for row in rows if row['question'] is None), None) or {
+        'sessions': 0, 'completed': 0, 'leads': 0, 'purchases': 0, 'revenue': 0,
+    }
+    per_question = {row['question']: row for row in rows if row['question'] is not None and row['answer'] is None}
+    answers: Dict[str, List[Dict[str, Any]]] = {}
+    for row in rows:
+        if row['question'] is not None and row['answer'] is not None:
+            answers.setdefault(row['question'], []).append(row)
+
+    questions = []
+    previous = int(total['sessions'])
+    for question in sorted(per_question, key=question_order):
+        sessions = int(per_question[question]['sessions'])
+        question_answers = [format_answer(row, sessions) for row in answers.get(question, [])]
+        question_answers.sort(key=lambda item: (-item['sessions'], -item['leads'], item['answer']))
+        # Sessions that answered the previous question (or started the quiz) but not this one
+        drop_off = max(previous - sessions, 0)
+        questions.append({
+            "question": question,
+            "sessions": sessions,
+            "leads": int(per_question[question]['leads']),
+            "dropOff": drop_off,
+            "dropOffRate": attribution.conversion_rate(drop_off, previous),
+            "answers": question_answers,
+        })
+        previous = sessions
+
+    leads = int(total['leads'])
+    return {
+        "sessions": int(total['sessions']),
+        "completed": int(total['completed']),
+        "completionRate": attribution.conversion_rate(int(total['completed']), int(total['sessions'])),
+        "leads": leads,
+        "purchases": int(total['purchases']),
+        "conversionRate": attribution.conversion_rate(int(total['purchases']), leads),
+        "revenue": round(float(total['revenue'] or 0), 2),
+        "questions": questions,
+    }
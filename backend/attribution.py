@@ -0,0 +1,89 @@
+from datetime import date
+from typing import Any, Dict, List, Optional
+
+# group_by values and the attribution_rollups column each one groups by
+DIMENSIONS = {
+    'source': 'utm_source',
+    'medium': 'utm_medium',
+    'campaign': 'utm_campaign',
+    'bucket': 'bucket_id',
+}
+
+OUTPUT_NAMES = {
+    'period': 'date',
+    'utm_source': 'utmSource',
+    'utm_medium': 'utmMedium',
+    'utm_campaign': 'utmCampaign',
+    'bucket_id': 'bucketId',
+}
+
+
+def parse_group_by(value: Optional[str], dimensions: Dict[str, str] = DIMENSIONS) -> List[str]:
+    """Comma-separated dimensions, in the order given; ``campaign`` by default."""
+    if not value:
+        return ['campaign']
+    group_by: List[str] = []
+    for name in (part.strip() for part in value.split(',')):
+        if name not in dimensions:
+            raise ValueError(f"Unknown group_by '{name}' (expected {', '.join(dimensions)})")
+        if name not in group_by:
+            group_by.append(name)
+    return group_by
+
+
+async def attribution_report(
+    db, pg, group_by: List[str], start: Optional[date], end: Optional[date]
+) -> List[Dict[str, Any]]:
+    """Rollup sums per combination of the ``group_by`` dimensions, for days in ``[start, end)``."""
+    if pg.available:
+        return await pg.fetch('SELECT * FROM attribution_report($1, $2, $3)', group_by, start, end)
+    result = await db.execute(db.rpc('attribution_report', {
+        'p_group_by': group_by,
+        'p_from': start.isoformat() if start else None,
+        'p_to': end.isoformat() if end else None,
+    }))
+    return result.data
+
+
+def conversion_rate(purchases: int, leads: int) -> float:
+    return round(purchases / leads * 100, 1) if leads > 0 else 0
+
+
+def format_row(row: Dict[str, Any], columns: List[str]) -> Dict[str, Any]:
+    leads = int(row['leads'])
+    attributed = int(row['attributed_purchases'])
+    revenue = float(row['revenue'] or 0)
+    formatted: Dict[str, Any] = {OUTPUT_NAMES[column]: row[column] or None for column in columns}
+    formatted.update({
+        "leads": leads,
+        "purchases": int(row['purchases']),
+        "attributedPurchases": attributed,
+        "revenue": round(revenue, 2),
+        # Purchases attributed to these leads, not every purchase with these UTMs
+        "conversionRate": conversion_rate(attributed, leads),
+        "revenuePerLead": round(revenue / leads, 2) if leads > 0 else 0,
+    })
+    return formatted
+
+
+def format_report(rows: List[Dict[str, Any]], group_by: List[str]) -> Dict[str, Any]:
+    """Groups by revenue, highest first, plus the totals over all of them."""
+    columns = [DIMENSIONS[name] for name in group_by]
+    groups = [format_row(row, columns) for row in rows if row['leads'] or row['purchases']]
+    groups.sort(key=lambda group: (-group['revenue'], -group['leads']))
+    leads = sum(group['leads'] for group in groups)
+    purchases = sum(group['purchases'] for group in groups)
+    attributed = sum(group['attributedPurchases'] for group in groups)
+    revenue = round(sum(float(row['revenue'] or 0) for row in rows), 2)
+    return {
+        "groupBy": group_by,
+        "totals": {
+            "leads": leads,
+            "purchases": purchases,
+            "attributedPurchases": attributed,
+            "revenue": revenue,
+            "conversionRate": conversion_rate(attributed, leads),
+            "attributionRate": round(attributed / purchases * 100, 1) if purchases > 0 else 0,
+        },
+        "groups": groups,
+    }
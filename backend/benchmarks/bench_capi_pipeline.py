@@ -0,0 +1,89 @@
+"""Conversions API: one request per event vs the batching pipeline.
+
+Usage (from backend/):
+
+    python benchmarks/bench_capi_pipeline.py
+    python benchmarks/bench_capi_pipeline.py --events 20000 --latency 0.1 --failure-rate 0.2
+
+A local stub server stands in for the Graph API. "per event" posts each
+event on its own, ``--concurrency`` at a time, like sending it from the
+webhook handler would. "batched" submits every event to a
+ConversionsPipeline and waits for it to flush. With ``--failure-rate`` the
+stub answers a share of requests with 503, which the pipeline retries.
+Event building (hashing included) is timed separately.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from capi import ConversionsPipeline, GraphApiTransport, build_event  # noqa: E402
+from proxy import ProxyClient  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+
+def make_rows(count: int):
+    return [{
+        "name": f"Lead Number{i}", "email": f"Lead{i}@Example.com ", "whatsapp": f"+34 666 {i:06d}",
+        "user_agent": "Mozilla/5.0", "client_ip": "203.0.113.7", "fbclid": f"click{i}",
+        "current_url": "https://example.com/quiz", "event_type": "Purchase", "value": 15.0,
+        "currency": "USD", "transaction_id": f"tx{i}", "timestamp": "2025-09-01T10:00:00",
+    } for i in range(count)]
+
+
+async def main(args):
+    rows = make_rows(args.events)
+    start = time.perf_counter()
+    events = [build_event(row, f"purchase:{row['transaction_id']}") for row in rows]
+    elapsed = time.perf_counter() - start
+    print(f"build_event          {args.events} events in {elapsed * 1000:7.1f} ms "
+          f"({elapsed / args.events * 1e6:.1f} us/event)")
+
+    stub = await StubServer(latency=args.latency, failure_rate=args.failure_rate).start()
+    proxy = ProxyClient(max_per_host=args.concurrency)
+    transport = GraphApiTransport(proxy, '123', 'token', base_url=stub.url.rsplit('/hook', 1)[0])
+    try:
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def one(event):
+            async with semaphore:
+                await proxy.deliver(transport.url, {"data": [event], "access_token": "token"})
+
+        count = min(args.events, args.per_event_limit)
+        start = time.perf_counter()
+        await asyncio.gather(*(one(event) for event in events[:count]))
+        elapsed = time.perf_counter() - start
+        print(f"per event            {count} events in {elapsed:6.2f}s ({count / elapsed:7.0f}/s), "
+              f"{stub.requests} requests, {stub.failures} failed")
+
+        stub.requests = stub.failures = 0
+        pipeline = ConversionsPipeline(
+            transport, batch_size=args.batch_size, max_delay=0.05, max_queue=args.events, base_delay=0.05,
+        )
+        pipeline.start()
+        start = time.perf_counter()
+        for event in events:
+            pipeline.submit(event)
+        await pipeline.stop()
+        elapsed = time.perf_counter() - start
+        stats = pipeline.stats()
+        print(f"batched ({args.batch_size:4d})       {args.events} events in {elapsed:6.2f}s "
+              f"({args.events / elapsed:7.0f}/s), {stub.requests} requests, {stub.failures} failed, "
+              f"{stats['sent']} sent, {stats['dropped']} dropped")
+    finally:
+        await proxy.close()
+        await stub.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--per-event-limit', type=int, default=2000, help='events sent one by one')
+    parser.add_argument('--latency', type=float, default=0.05, help='stub response delay in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    asyncio.run(main(parser.parse_args()))
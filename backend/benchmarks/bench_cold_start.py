@@ -0,0 +1,123 @@
+"""Cold start: import-time profile of server.py and time to the first request served.
+
+Usage (from backend/):
+
+    python benchmarks/bench_cold_start.py
+    python benchmarks/bench_cold_start.py --runs 10 --top 20 --target 1.5
+
+The import profile runs ``python -X importtime -c "import server"`` and
+lists the modules server.py imports directly by cumulative time, which is
+what each one adds to startup. The cold-start measurement spawns
+``uvicorn server:app`` (the same command as in production) and times from
+spawning the process
+to the first successful ``GET /api/health`` response, polling every few
+milliseconds; the median of ``--runs`` fresh processes is reported, and
+the script exits with status 1 when it is above ``--target`` seconds.
+
+No database is needed: SUPABASE_URL points at an unused local port and
+SUPABASE_DB_URL is empty, so only startup itself is measured.
+"""
+import argparse
+import http.client
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from loadtest import BACKEND_DIR, free_port  # noqa: E402
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def server_env() -> Dict[str, str]:
+    return {
+        **os.environ,
+        'SUPABASE_URL': 'http://127.0.0.1:9',
+        'SUPABASE_SERVICE_ROLE_KEY': 'cold-start',
+        'SUPABASE_DB_URL': '',
+        'LOG_LEVEL': 'WARNING',
+    }
+
+
+def import_profile(module: str) -> Tuple[int, int, List[Tuple[str, int]]]:
+    """Microseconds to import ``module`` (cumulative and its own body) and its direct imports.
+
+    importtime prints each module after the ones it imported, indented one
+    level deeper, so the direct imports are the depth-1 lines just before
+    ``module``'s own line.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=BACKEND_DIR, env=server_env(), capture_output=True, text=True, check=True,
+    )
+    children: List[Tuple[str, int]] = []
+    for line in result.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative, indent, name = int(match.group(1)), int(match.group(2)), match.group(3), match.group(4)
+        if not indent:
+            if name == module:
+                return cumulative, self_us, children
+            children = []
+        elif len(indent) == 2:
+            children.append((name, cumulative))
+    raise RuntimeError(f"{module} not found in the importtime output")
+
+
+def first_request(timeout: float = 30.0) -> float:
+    """Seconds from spawning uvicorn to the first 200 from /api/health."""
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'server:app', '--host', '127.0.0.1', '--port', str(port),
+         '--no-access-log', '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=server_env(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+            try:
+                connection.request('GET', '/api/health')
+                if connection.getresponse().status == 200:
+                    return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.005)
+            finally:
+                connection.close()
+        raise RuntimeError(f"No response from uvicorn after {timeout}s")
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main(args) -> int:
+    total, own, children = import_profile('server')
+    print(f"import server: {total / 1000:.0f} ms ({own / 1000:.0f} ms in server.py itself)")
+    for name, cumulative in sorted(children, key=lambda item: -item[1])[:args.top]:
+        print(f"  {name:40s} {cumulative / 1000:8.1f} ms")
+
+    timings = sorted(first_request() for _ in range(args.runs))
+    median = statistics.median(timings)
+    print(f"\nfirst request served: median {median * 1000:.0f} ms, "
+          f"min {timings[0] * 1000:.0f} ms, max {timings[-1] * 1000:.0f} ms ({args.runs} runs)")
+    if args.target and median > args.target:
+        print(f"above the {args.target:g} s target")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='top-level imports to list')
+    parser.add_argument('--target', type=float, help='fail when the median first request takes longer (seconds)')
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,117 @@
+"""Streaming CSV export: throughput and peak memory for a large synthetic table.
+
+Usage (from backend/):
+
+    python benchmarks/bench_csv_export.py --rows 1000000
+    python benchmarks/bench_csv_export.py --rows 100000 --buffered
+
+Rows are generated page by page, the way iter_pages() pulls them from the
+database, and fed through export.stream_csv() with the real lead row
+formatter. ``--buffered`` also runs the previous approach (all rows in a
+list, whole CSV built in one StringIO) for comparison. Peak memory is
+measured with tracemalloc in a second, untimed pass.
+"""
+import argparse
+import asyncio
+import csv
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_SERVICE_ROLE_KEY', 'benchmark')
+
+import export  # noqa: E402
+import server  # noqa: E402
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def synthetic_lead(i: int):
+    return {
+        "id": str(uuid.UUID(int=i)),
+        "session_id": str(uuid.UUID(int=i + 1)),
+        "name": f"Lead {i}",
+        "email": f"lead{i}@example.com",
+        "whatsapp": "+34666777888",
+        "user_agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15",
+        "fbclid": "IwAR123456789",
+        "_fbc": "fb.1.1700000000000.IwAR123456789",
+        "_fbp": "fb.1.1700000000000.987654321",
+        "utm_source": "facebook",
+        "utm_medium": "cpc",
+        "utm_campaign": "moda-rentable",
+        "utm_content": "video-ad",
+        "utm_term": None,
+        "referrer": "https://facebook.com",
+        "current_url": None,
+        "quiz_answers": {"1": "marca-emergente", "3": "produccion", "4": "reducir-costos", "5": "principiante"},
+        "bucket_id": "produccion",
+        "event_type": "InitiateCheckout",
+        "value": 15.0,
+        "currency": "USD",
+        "client_ip": "203.0.113.7",
+        "timestamp": (START + timedelta(seconds=i)).isoformat(),
+        "created_at": (START + timedelta(seconds=i)).isoformat(),
+    }
+
+
+async def synthetic_pages(rows: int, page_size: int):
+    for offset in range(0, rows, page_size):
+        yield [synthetic_lead(i) for i in range(offset, min(offset + page_size, rows))]
+
+
+async def run_streaming(rows: int, page_size: int):
+    total = 0
+    async for chunk in export.stream_csv(synthetic_pages(rows, page_size), server.LEAD_CSV_FORMAT.names, server.LEAD_CSV_FORMAT.to_tuples):
+        total += len(chunk)
+    return total
+
+
+async def run_buffered(rows: int, page_size: int):
+    data = []
+    async for page in synthetic_pages(rows, page_size):
+        data.extend(page)
+    output = StringIO()
+    writer = csv.writer(output)
+    writer.writerow(server.LEAD_CSV_FORMAT.names)
+    writer.writerows(server.LEAD_CSV_FORMAT.to_tuples(data))
+    return len(output.getvalue().encode('utf-8'))
+
+
+def measure(label, coro_fn, rows, page_size, trace_memory):
+    start = time.perf_counter()
+    size = asyncio.run(coro_fn(rows, page_size))
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if trace_memory:
+        # Separate pass: tracemalloc slows allocation-heavy code down a lot
+        tracemalloc.start()
+        asyncio.run(coro_fn(rows, page_size))
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"{label:10s} {rows} rows, {size / 1e6:8.1f} MB CSV in {elapsed:6.2f}s "
+          f"({rows / elapsed:9.0f} rows/s), peak memory {peak / 1e6:8.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--page-size', type=int, default=1000)
+    parser.add_argument('--buffered', action='store_true', help='also run the old build-everything approach')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc pass')
+    args = parser.parse_args()
+
+    measure('streaming', run_streaming, args.rows, args.page_size, not args.no_memory)
+    if args.buffered:
+        measure('buffered', run_buffered, args.rows, args.page_size, not args.no_memory)
+
+
+if __name__ == '__main__':
+    main()
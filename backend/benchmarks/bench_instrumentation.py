@@ -0,0 +1,115 @@
+"""Cost of the latency instrumentation on the request path.
+
+Usage (from backend/):
+
+    python benchmarks/bench_instrumentation.py
+    python benchmarks/bench_instrumentation.py --requests 50000
+
+Times Histogram.observe() and a stage() block on their own, then sends the
+same POST with a small JSON body through two copies of one FastAPI app:
+a plain one, and one with TimedRoute and MetricsMiddleware, as server.py
+sets it up. Requests are driven straight through the ASGI interface, with
+no sockets, alternating between the two apps, so the difference between
+their medians is the instrumentation. The first 10% of requests of each
+app are discarded as warm-up.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Optional
+
+from fastapi import APIRouter, FastAPI
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import telemetry  # noqa: E402
+
+BODY = b'{"name": "Lead", "email": "lead@example.com", "transactionId": "tx-1", "value": 15.0}'
+
+
+class Payload(BaseModel):
+    name: str
+    email: str
+    transactionId: str
+    value: float = 15.0
+    utmSource: Optional[str] = None
+
+
+def build_app(instrumented: bool) -> FastAPI:
+    app = FastAPI()
+    router = APIRouter(prefix='/api', route_class=telemetry.TimedRoute if instrumented else APIRoute)
+
+    @router.post('/webhooks/purchase')
+    async def purchase(payload: Payload):
+        with telemetry.stage('db_insert'):
+            pass
+        return {"success": True, "transactionId": payload.transactionId}
+
+    app.include_router(router)
+    if instrumented:
+        app.add_middleware(telemetry.MetricsMiddleware)
+    return app
+
+
+async def drive(apps, count: int):
+    """Per-request latencies for each app, alternating between them on every request."""
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'POST',
+        'scheme': 'http', 'path': '/api/webhooks/purchase', 'raw_path': b'/api/webhooks/purchase',
+        'root_path': '', 'query_string': b'', 'server': ('test', 80), 'client': ('127.0.0.1', 1),
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(BODY)).encode())],
+    }
+
+    async def receive():
+        return {'type': 'http.request', 'body': BODY, 'more_body': False}
+
+    async def send(message):
+        pass
+
+    samples = [[] for _ in apps]
+    for i in range(count * len(apps)):
+        index = i % len(apps)
+        start = time.perf_counter()
+        await apps[index](dict(scope), receive, send)
+        samples[index].append(time.perf_counter() - start)
+    return [sorted(latencies[len(latencies) // 10:]) for latencies in samples]
+
+
+def micro(count: int):
+    histogram = telemetry.Histogram()
+    start = time.perf_counter()
+    for i in range(count):
+        histogram.observe(i * 1e-6)
+    elapsed = time.perf_counter() - start
+    print(f"Histogram.observe    {elapsed / count * 1e9:7.0f} ns")
+
+    timing = telemetry.RequestTiming('/bench')
+    token = telemetry._current_request.set(timing)
+    start = time.perf_counter()
+    for _ in range(count):
+        with telemetry.stage('db_insert'):
+            pass
+    elapsed = time.perf_counter() - start
+    telemetry._current_request.reset(token)
+    print(f"stage() block        {elapsed / count * 1e9:7.0f} ns")
+
+
+async def main(args):
+    micro(args.requests * 10)
+    # Interleaving per request keeps CPU frequency and noisy neighbours out of the difference
+    plain, instrumented = await drive([build_app(False), build_app(True)], args.requests)
+    for label, latencies in (('plain app', plain), ('instrumented app', instrumented)):
+        print(f"{label:20s} median {latencies[len(latencies) // 2] * 1e6:6.1f} us, "
+              f"p10 {latencies[len(latencies) // 10] * 1e6:6.1f} us")
+    overhead = instrumented[len(instrumented) // 2] - plain[len(plain) // 2]
+    print(f"overhead             median {overhead * 1e6:6.1f} us/request")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=20000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,100 @@
+"""JSON serialization cost of read responses: FastAPI's default path vs FastJSONResponse.
+
+Usage (from backend/):
+
+    python benchmarks/bench_json_response.py
+    python benchmarks/bench_json_response.py --rows 1000 10000 --repeat 5
+
+"default" is what FastAPI does with a returned dict or model list:
+``jsonable_encoder`` (plus ``response_model`` validation for /api/status)
+and then the stdlib encoder in JSONResponse. "fast" is the body rendered by
+FastJSONResponse, which the routes now return directly. Each timing is the
+best of ``--repeat`` runs.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_SERVICE_ROLE_KEY', 'benchmark')
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from pydantic import TypeAdapter  # noqa: E402
+from starlette.responses import JSONResponse  # noqa: E402
+
+import server  # noqa: E402
+from bench_csv_export import synthetic_lead  # noqa: E402
+from responses import FastJSONResponse  # noqa: E402
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+status_adapter = TypeAdapter(List[server.StatusCheck])
+
+
+def leads_payload(count: int):
+    leads = server.LEAD_FORMAT.to_dicts([synthetic_lead(i) for i in range(count)])
+    return {"leads": leads, "total": len(leads), "nextCursor": None}
+
+
+def status_rows(count: int):
+    return [
+        {"id": str(i), "client_name": f"client {i}", "timestamp": START + timedelta(seconds=i)}
+        for i in range(count)
+    ]
+
+
+def default_leads(payload):
+    return JSONResponse(jsonable_encoder(payload)).body
+
+
+def fast_leads(payload):
+    return FastJSONResponse(payload).body
+
+
+def default_status(rows):
+    # Route builds models, FastAPI validates them against response_model and encodes
+    models = [server.StatusCheck(**row) for row in rows]
+    return JSONResponse(jsonable_encoder(status_adapter.validate_python(models))).body
+
+
+def fast_status(rows):
+    return FastJSONResponse(rows).body
+
+
+def best_of(fn, payload, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(payload)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for count in args.rows:
+        for label, build, cases in (
+            ('/api/leads', leads_payload, (('default', default_leads), ('fast', fast_leads))),
+            ('/api/status', status_rows, (('default', default_status), ('fast', fast_status))),
+        ):
+            payload = build(count)
+            timings = {name: best_of(fn, payload, args.repeat) for name, fn in cases}
+            size = len(fast_leads(payload) if label == '/api/leads' else fast_status(payload))
+            print(
+                f"{label:12s} {count:6d} rows ({size / 1e6:5.1f} MB): "
+                + ", ".join(f"{name} {elapsed * 1000:7.1f} ms" for name, elapsed in timings.items())
+                + f"  ({timings['default'] / timings['fast']:.1f}x)"
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Logging cost per webhook on the request path: inline f-string logging vs the queued pipeline.
+
+Usage (from backend/):
+
+    python benchmarks/bench_logging.py
+    python benchmarks/bench_logging.py --calls 50000
+
+"before" is what the webhook handlers did: two f-string INFO calls, one of
+them formatting the whole payload model, written by a StreamHandler on the
+calling thread. "after" is one structured INFO call through jsonlog's
+queue handler, at several sample rates. Output goes to /dev/null. The
+per-call time is what the event loop pays; "drained" includes waiting for
+the background writer to finish formatting and writing everything.
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from jsonlog import BoundedQueueHandler, JsonFormatter, SamplingFilter  # noqa: E402
+
+
+class PurchaseWebhook(BaseModel):
+    name: str
+    email: str
+    whatsapp: Optional[str] = None
+    transactionId: str
+    userAgent: Optional[str] = None
+    utmSource: Optional[str] = None
+    utmCampaign: Optional[str] = None
+    referrer: Optional[str] = None
+    quizAnswers: Optional[Dict[str, Any]] = None
+    eventType: str = "Purchase"
+    value: float = 15.0
+    currency: str = "USD"
+
+
+WEBHOOK = PurchaseWebhook(
+    name="María García", email="maria.garcia@example.com", whatsapp="+34666777888", transactionId="HP123456789",
+    userAgent="Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15",
+    utmSource="facebook", utmCampaign="moda-rentable", referrer="https://facebook.com",
+    quizAnswers={"1": "marca-emergente", "3": "produccion", "4": "reducir-costos", "5": "principiante"},
+)
+
+
+def before(logger: logging.Logger, webhook: PurchaseWebhook):
+    logger.info(f"Purchase webhook received: {webhook.email} - Transaction: {webhook.transactionId}")
+    logger.info(f"Purchase webhook data: {webhook}")
+
+
+def after(logger: logging.Logger, webhook: PurchaseWebhook):
+    logger.info("Purchase webhook received", extra={
+        "sampled": True,
+        "email": webhook.email,
+        "transactionId": webhook.transactionId,
+        "eventType": webhook.eventType,
+        "utmSource": webhook.utmSource,
+        "status": "inserted",
+    })
+    logger.debug("Purchase webhook data: %r", webhook)
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.getLogger(name)
+    logger.handlers = [handler]
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    return logger
+
+
+def run(label: str, logger: logging.Logger, log, calls: int, listener=None):
+    start = time.perf_counter()
+    for _ in range(calls):
+        log(logger, WEBHOOK)
+    elapsed = time.perf_counter() - start
+    if listener is not None:
+        listener.stop()
+    drained = time.perf_counter() - start
+    print(f"{label:28s} {elapsed / calls * 1e6:6.2f} us/webhook on the caller, "
+          f"{drained / calls * 1e6:6.2f} us/webhook drained")
+
+
+def main(args):
+    devnull = open(os.devnull, 'w')
+
+    stream = logging.StreamHandler(devnull)
+    stream.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    run('before (inline, 2 f-strings)', make_logger('bench.before', stream), before, args.calls)
+
+    # What setup_logging() turns off
+    logging._srcfile = None
+    logging.logThreads = logging.logMultiprocessing = False
+    for rate in args.rates:
+        writer = logging.StreamHandler(devnull)
+        writer.setFormatter(JsonFormatter())
+        handler = BoundedQueueHandler(queue.Queue(maxsize=args.calls + 1))
+        handler.addFilter(SamplingFilter(rate))
+        listener = logging.handlers.QueueListener(handler.queue, writer)
+        listener.start()
+        run(f'after (queued, sample {rate:g})', make_logger(f'bench.after.{rate}', handler), after, args.calls, listener)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--rates', type=float, nargs='+', default=[1.0, 0.1])
+    main(parser.parse_args())
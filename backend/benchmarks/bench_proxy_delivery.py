@@ -0,0 +1,89 @@
+"""Queued proxy delivery against flaky and failing local stub targets.
+
+Usage (from backend/):
+
+    python benchmarks/bench_proxy_delivery.py
+    python benchmarks/bench_proxy_delivery.py --webhooks 2000 --failure-rate 0.3 --outage 2
+
+Three stub targets: "flaky" fails ``--failure-rate`` of requests with a 503,
+"outage" is down for the first ``--outage`` seconds and then recovers, and
+"rejecting" answers every request with a 400. Each webhook is submitted
+once per target to a DeliveryQueue with short retry delays. Reports how
+many deliveries ended delivered or dead, how many attempts the targets
+saw, and how long it took to drain. Dead letters are kept in memory.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from delivery import DeliveryQueue  # noqa: E402
+from proxy import ProxyClient  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+
+async def main(args):
+    stubs = {
+        'flaky': await StubServer(latency=args.latency, failure_rate=args.failure_rate).start(),
+        'outage': await StubServer(latency=args.latency).start(),
+        'rejecting': await StubServer(latency=args.latency, failure_rate=1.0, failure_status=400).start(),
+    }
+    stubs['outage'].down = True
+    dead_letters = []
+
+    async def dead_letter(delivery):
+        dead_letters.append(delivery)
+
+    proxy = ProxyClient(timeout=5.0, max_per_host=args.workers)
+    queue = DeliveryQueue(
+        proxy,
+        dead_letter,
+        workers=args.workers,
+        max_attempts=args.max_attempts,
+        base_delay=args.base_delay,
+        max_delay=args.max_delay,
+        max_pending=args.webhooks * len(stubs),
+        breaker_threshold=5,
+        breaker_reset=args.breaker_reset,
+    )
+    queue.start()
+
+    start = time.perf_counter()
+    asyncio.get_running_loop().call_later(args.outage, setattr, stubs['outage'], 'down', False)
+    deliveries = {name: [] for name in stubs}
+    for i in range(args.webhooks):
+        for name, stub in stubs.items():
+            deliveries[name].append(queue.submit(stub.url, {"webhook": i}))
+    while queue.pending:
+        await asyncio.sleep(0.05)
+    elapsed = time.perf_counter() - start
+
+    for name, stub in stubs.items():
+        statuses = [d['status'] for d in deliveries[name]]
+        attempts = sum(d['attempts'] for d in deliveries[name])
+        print(f"{name:10s} delivered {statuses.count('delivered'):5d}, dead {statuses.count('dead'):5d}, "
+              f"{attempts} attempts ({stub.requests} requests seen, {stub.failures} failed)")
+    print(f"drained {queue.stats()['delivered'] + queue.stats()['dead']} deliveries in {elapsed:.2f}s, "
+          f"{queue.retried} retries, {len(dead_letters)} dead letters")
+
+    await queue.stop()
+    await proxy.close()
+    for stub in stubs.values():
+        await stub.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--webhooks', type=int, default=500)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--latency', type=float, default=0.01, help='stub response delay in seconds')
+    parser.add_argument('--failure-rate', type=float, default=0.3)
+    parser.add_argument('--outage', type=float, default=1.0, help='seconds the outage target is down')
+    parser.add_argument('--max-attempts', type=int, default=6)
+    parser.add_argument('--base-delay', type=float, default=0.05)
+    parser.add_argument('--max-delay', type=float, default=1.0)
+    parser.add_argument('--breaker-reset', type=float, default=0.5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+"""Webhook proxy: client per request vs the pooled ProxyClient, and fan-out.
+
+Usage (from backend/):
+
+    python benchmarks/bench_proxy_fanout.py
+    python benchmarks/bench_proxy_fanout.py --requests 1000 --targets 5 --latency 0.05
+
+Starts ``--targets`` local stub servers. "per-request client" is the
+previous proxy: a new httpx.AsyncClient (and so a new connection) for
+every webhook. "pooled" sends the same webhooks through one ProxyClient.
+"fan-out" delivers each webhook to all stub targets concurrently, and
+"fan-out sequential" does the same one target after another for
+comparison. Latency is per webhook, i.e. until every target has answered.
+Stubs run in the same process, so at high --concurrency the numbers are
+CPU-bound rather than network-bound. The stub speaks plain HTTP/1.1, so
+HTTP/2 is not exercised.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from proxy import ProxyClient  # noqa: E402
+from stub_server import StubServer  # noqa: E402
+
+PAYLOAD = {
+    "name": "Lead", "email": "lead@example.com", "whatsapp": "+34666777888",
+    "utmSource": "facebook", "quizAnswers": {"1": "marca-emergente", "3": "produccion"},
+}
+
+
+async def run_concurrently(count: int, concurrency: int, send):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await send()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(count)))
+    return time.perf_counter() - start, latencies
+
+
+def report(label: str, count: int, timing, stubs):
+    elapsed, latencies = timing
+    latencies.sort()
+    connections = sum(stub.connections for stub in stubs)
+    requests = sum(stub.requests for stub in stubs)
+    print(f"{label:20s} {count} webhooks in {elapsed:6.2f}s ({count / elapsed:5.0f}/s), "
+          f"latency p50 {latencies[len(latencies) // 2] * 1000:6.1f} ms "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:6.1f} ms, "
+          f"{requests} target requests over {connections} new connections")
+    for stub in stubs:
+        stub.connections = stub.requests = 0
+
+
+async def main(args):
+    stubs = [await StubServer(latency=args.latency).start() for _ in range(args.targets)]
+    target = stubs[0].url
+    targets = [{'url': stub.url, 'timeout': args.timeout} for stub in stubs]
+
+    async def per_request_client():
+        async with httpx.AsyncClient(timeout=args.timeout) as client:
+            await client.post(target, json=PAYLOAD)
+
+    timing = await run_concurrently(args.requests, args.concurrency, per_request_client)
+    report('per-request client', args.requests, timing, stubs)
+
+    proxy = ProxyClient(timeout=args.timeout, max_per_host=args.concurrency)
+    try:
+        timing = await run_concurrently(args.requests, args.concurrency, lambda: proxy.post(target, PAYLOAD))
+        report('pooled', args.requests, timing, stubs)
+
+        async def sequential():
+            for t in targets:
+                await proxy.deliver(t['url'], PAYLOAD, t['timeout'])
+
+        count = max(args.requests // args.targets, 1)
+        timing = await run_concurrently(count, args.concurrency, lambda: proxy.fan_out(targets, PAYLOAD))
+        report('fan-out', count, timing, stubs)
+        timing = await run_concurrently(count, args.concurrency, sequential)
+        report('fan-out sequential', count, timing, stubs)
+    finally:
+        await proxy.close()
+        for stub in stubs:
+            await stub.stop()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=5)
+    parser.add_argument('--targets', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.05, help='stub response delay in seconds')
+    parser.add_argument('--timeout', type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
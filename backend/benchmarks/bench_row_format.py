@@ -0,0 +1,134 @@
+"""Row formatting: per-row cost of the compiled RowFormat vs hand-written per-row dicts.
+
+Usage (from backend/):
+
+    python benchmarks/bench_row_format.py
+    python benchmarks/bench_row_format.py --rows 10000 100000 --repeat 5
+
+Formats synthetic lead rows into the /api/leads JSON shape and the CSV
+export records. The "per-row" baseline is the formatter the routes used
+before RowFormat: one function call per row, an isinstance check per quiz
+answer and a datetime.utcnow() fallback evaluated for every row. Each
+timing is the best of ``--repeat`` runs with the garbage collector off.
+"""
+import argparse
+import gc
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_SERVICE_ROLE_KEY', 'benchmark')
+
+import server  # noqa: E402
+from bench_csv_export import synthetic_lead  # noqa: E402
+
+
+def per_row_lead(lead):
+    quiz_answers = lead.get('quiz_answers', {}) or {}
+    return {
+        "id": lead.get("session_id", lead.get("id", "")),
+        "name": lead.get("name", "Sin nombre"),
+        "email": lead.get("email", "sin-email@ejemplo.com"),
+        "whatsapp": lead.get("whatsapp"),
+        "businessType": quiz_answers.get("1", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
+        "mainCost": quiz_answers.get("3", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
+        "objective": quiz_answers.get("4", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
+        "aiUsage": quiz_answers.get("5", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
+        "stage": "lead_capture",
+        "createdAt": lead.get("created_at", datetime.utcnow().isoformat()),
+        "ip": lead.get("client_ip"),
+        "userAgent": lead.get("user_agent"),
+        "utmSource": lead.get("utm_source"),
+        "utmMedium": lead.get("utm_medium"),
+        "utmCampaign": lead.get("utm_campaign"),
+        "utmContent": lead.get("utm_content"),
+        "utmTerm": lead.get("utm_term"),
+        "fbclid": lead.get("fbclid"),
+        "_fbc": lead.get("_fbc"),
+        "_fbp": lead.get("_fbp"),
+        "referrer": lead.get("referrer"),
+        "currentUrl": lead.get("current_url"),
+        "sessionId": lead.get("session_id"),
+    }
+
+
+def per_row_lead_csv(lead):
+    quiz_answers = lead.get("quiz_answers", {}) or {}
+    return [
+        lead.get("name", ""),
+        lead.get("email", ""),
+        lead.get("whatsapp", "N/A"),
+        quiz_answers.get("1", "N/A") if isinstance(quiz_answers, dict) else "N/A",
+        quiz_answers.get("3", "N/A") if isinstance(quiz_answers, dict) else "N/A",
+        quiz_answers.get("4", "N/A") if isinstance(quiz_answers, dict) else "N/A",
+        quiz_answers.get("5", "N/A") if isinstance(quiz_answers, dict) else "N/A",
+        "Captura de Lead",
+        lead.get("created_at", "N/A"),
+        lead.get("client_ip", "N/A"),
+        lead.get("user_agent", "N/A"),
+        lead.get("session_id", "N/A"),
+        lead.get("referrer", "N/A"),
+        lead.get("current_url", "N/A"),
+        lead.get("utm_source", "N/A"),
+        lead.get("utm_medium", "N/A"),
+        lead.get("utm_campaign", "N/A"),
+        lead.get("utm_content", "N/A"),
+        lead.get("utm_term", "N/A"),
+        lead.get("fbclid", "N/A"),
+        lead.get("_fbc", "N/A"),
+        lead.get("_fbp", "N/A"),
+        "N/A",
+        lead.get("value", "N/A"),
+        lead.get("currency", "N/A"),
+        lead.get("timestamp", "N/A"),
+    ]
+
+
+CASES = [
+    ('json per-row', lambda rows: [per_row_lead(row) for row in rows]),
+    ('json compiled', server.LEAD_FORMAT.to_dicts),
+    ('json 3 fields', lambda rows: server.LEAD_FORMAT.to_dicts(rows, ['name', 'email', 'utmSource'])),
+    ('csv per-row', lambda rows: [per_row_lead_csv(row) for row in rows]),
+    ('csv compiled', server.LEAD_CSV_FORMAT.to_tuples),
+]
+
+
+def best_of(fn, rows, repeat: int) -> float:
+    best = float('inf')
+    for _ in range(repeat):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            fn(rows)
+            best = min(best, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # Same output from both implementations before timing anything
+    sample = [synthetic_lead(i) for i in range(100)]
+    assert server.LEAD_FORMAT.to_dicts(sample) == [per_row_lead(row) for row in sample]
+    assert [list(record) for record in server.LEAD_CSV_FORMAT.to_tuples(sample)] == [per_row_lead_csv(row) for row in sample]
+
+    for count in args.rows:
+        rows = [synthetic_lead(i) for i in range(count)]
+        for label, fn in CASES:
+            elapsed = best_of(fn, rows, args.repeat)
+            print(f"{label:14s} {count:7d} rows in {elapsed * 1000:8.1f} ms ({elapsed / count * 1e6:5.2f} us/row)")
+        print()
+
+
+if __name__ == '__main__':
+    main()
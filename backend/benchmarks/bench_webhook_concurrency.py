@@ -0,0 +1,79 @@
+"""Concurrent webhook throughput: blocking client calls vs. Database.execute().
+
+Usage (from backend/):
+
+    python benchmarks/bench_webhook_concurrency.py --requests 200 --latency 0.05
+
+"before" runs every PostgREST call inline on the event loop, which is what
+the routes did when they called ``query.execute()`` directly. "after" uses
+the bounded executor from database.py.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_SERVICE_ROLE_KEY', 'benchmark')
+
+import httpx  # noqa: E402
+
+import server  # noqa: E402
+from database import Database  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase  # noqa: E402
+
+
+class InlineDatabase(Database):
+    """Old behaviour: the blocking call runs on the event loop thread."""
+
+    async def execute(self, query):
+        return query.execute()
+
+
+LEAD = {
+    "name": "Benchmark Lead",
+    "email": "bench@example.com",
+    "utmSource": "facebook",
+    "quizAnswers": {"1": "marca-emergente", "3": "produccion"},
+    "bucketId": "produccion",
+}
+
+
+async def run(db, requests: int):
+    server.db = db
+    transport = httpx.ASGITransport(app=server.app)
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*[
+            client.post('/api/webhooks/lead-capture', json=LEAD) for _ in range(requests)
+        ])
+        elapsed = time.perf_counter() - start
+    ok = sum(1 for r in responses if r.status_code == 200 and r.json().get('success'))
+    return elapsed, ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated PostgREST latency (s)')
+    parser.add_argument('--concurrency', type=int, default=16, help='Database max_concurrency')
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    fake = FakeSupabase(latency=args.latency)
+    for label, db in (
+        ('before (inline)', InlineDatabase(fake, max_concurrency=1)),
+        (f'after (executor, {args.concurrency})', Database(fake, max_concurrency=args.concurrency)),
+    ):
+        elapsed, ok = asyncio.run(run(db, args.requests))
+        db.close()
+        print(f"{label:28s} {args.requests} requests in {elapsed:6.2f}s "
+              f"-> {args.requests / elapsed:8.1f} req/s ({ok} ok)")
+
+
+if __name__ == '__main__':
+    main()
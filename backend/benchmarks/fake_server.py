@@ -0,0 +1,67 @@
+"""server.app backed by FakeSupabase, for load tests without a database.
+
+Usage (from backend/):
+
+    uvicorn benchmarks.fake_server:app --port 8010
+
+FAKE_SUPABASE_LATENCY is the simulated PostgREST round trip in seconds
+(default 0.02). FAKE_SEED_LEADS / FAKE_SEED_PURCHASES rows are created at
+startup so listings and exports have data to page through. The asyncpg
+pool is disabled and every query goes through the fake client, unless
+FAKE_SERVER_DB_URL points at a real Postgres for the asyncpg paths.
+"""
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ.setdefault('SUPABASE_URL', 'http://localhost:54321')
+os.environ.setdefault('SUPABASE_SERVICE_ROLE_KEY', 'benchmark')
+os.environ['SUPABASE_DB_URL'] = os.environ.get('FAKE_SERVER_DB_URL', '')
+
+import server  # noqa: E402
+from database import Database  # noqa: E402
+from benchmarks.fake_supabase import FakeSupabase  # noqa: E402
+
+START = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def seed(fake: FakeSupabase, leads: int, purchases: int):
+    for table, count, extra in (
+        ('lead_webhooks', leads, {
+            "quiz_answers": {"1": "marca-emergente", "3": "produccion", "4": "reducir-costos"},
+            "bucket_id": "produccion", "event_type": "InitiateCheckout",
+        }),
+        ('purchase_webhooks', purchases, {"event_type": "Purchase", "payment_method": "hotmart"}),
+    ):
+        rows = fake.tables.setdefault(table, [])
+        for i in range(count):
+            created_at = (START + timedelta(seconds=i)).isoformat()
+            row = {
+                "id": fake.next_id(),
+                "session_id": f"seed-{table}-{i}",
+                "name": f"Seed {i}",
+                "email": f"seed{i}@example.com",
+                "whatsapp": "+34666777888",
+                "user_agent": "Mozilla/5.0",
+                "utm_source": ("facebook", "instagram", "google")[i % 3],
+                "utm_medium": "cpc",
+                "utm_campaign": f"campaign-{i % 5}",
+                "value": 15.0,
+                "currency": "USD",
+                "client_ip": "203.0.113.7",
+                "timestamp": created_at,
+                "created_at": created_at,
+                **extra,
+            }
+            if table == 'purchase_webhooks':
+                row["transaction_id"] = f"seed-tx-{i}"
+            rows.append(row)
+
+
+fake = FakeSupabase(latency=float(os.environ.get('FAKE_SUPABASE_LATENCY', '0.02')))
+seed(fake, int(os.environ.get('FAKE_SEED_LEADS', '5000')), int(os.environ.get('FAKE_SEED_PURCHASES', '1000')))
+server.db = Database(fake, max_concurrency=int(os.environ.get('SUPABASE_MAX_CONCURRENCY', '16')))
+
+app = server.app
@@ -0,0 +1,127 @@
+"""In-process stand-in for the supabase client used by the benchmarks.
+
+Mimics the small part of the supabase-py query builder that server.py uses
+and sleeps for a configurable latency inside ``execute()`` to simulate the
+PostgREST round trip. The sleep is a blocking ``time.sleep`` on purpose: the
+real client blocks the calling thread in the same way.
+
+Selects return rows newest first and honour ``eq``/``gte``/``lt``/``ilike``
+(prefix patterns only) and the keyset ``or_`` filter from export.py, so
+listings and exports paginate as they would against PostgREST. Other
+filters are accepted and ignored.
+"""
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+
+class FakeResult:
+    def __init__(self, data, count=None):
+        self.data = data
+        self.count = count
+
+
+# export.keyset_filter()
+KEYSET = re.compile(r'created_at\.lt\."(?P<created_at>[^"]+)",and\(created_at\.eq\."[^"]+",id\.lt\.(?P<id>[^)]+)\)')
+
+
+class FakeQuery:
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.op = 'select'
+        self.payload = None
+        self.count = None
+        self.limit_n = None
+        self.filters = []
+        self.cursor = None
+
+    def select(self, *columns, count=None, head=None):
+        self.op = 'select'
+        self.count = count
+        return self
+
+    def insert(self, json, **kwargs):
+        self.op = 'insert'
+        self.payload = json
+        return self
+
+    def upsert(self, json, **kwargs):
+        return self.insert(json)
+
+    def order(self, *args, **kwargs):
+        return self
+
+    def limit(self, n, **kwargs):
+        self.limit_n = n
+        return self
+
+    def eq(self, column, value):
+        self.filters.append(lambda row: row.get(column) == value)
+        return self
+
+    def gte(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] >= value)
+        return self
+
+    def lt(self, column, value):
+        self.filters.append(lambda row: row.get(column) is not None and row[column] < value)
+        return self
+
+    def ilike(self, column, pattern):
+        prefix = pattern.rstrip('%').replace('\\', '').lower()
+        self.filters.append(lambda row: (row.get(column) or '').lower().startswith(prefix))
+        return self
+
+    def or_(self, expression, **kwargs):
+        match = KEYSET.fullmatch(expression)
+        if match:
+            self.cursor = (match['created_at'], match['id'])
+        return self
+
+    def __getattr__(self, name):
+        # range/neq/... filters are accepted and ignored
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        time.sleep(self.client.latency)
+        rows = self.client.tables.setdefault(self.table, [])
+        if self.op == 'insert':
+            batch = self.payload if isinstance(self.payload, list) else [self.payload]
+            # Queries run on executor threads; ids and timestamps must follow insertion order
+            with self.client.lock:
+                now = datetime.now(timezone.utc).isoformat()
+                inserted = [{'id': self.client.next_id(), 'created_at': now, **row} for row in batch]
+                rows.extend(inserted)
+            return FakeResult(inserted)
+        # Rows are stored in (created_at, id) order, so reversed is the keyset order
+        data = rows[::-1]
+        if self.cursor:
+            data = [row for row in data if (row['created_at'], row['id']) < self.cursor]
+        if self.filters:
+            data = [row for row in data if all(check(row) for check in self.filters)]
+        if self.limit_n is not None:
+            data = data[:self.limit_n]
+        return FakeResult(data, count=len(rows) if self.count else None)
+
+
+class FakeSupabase:
+    def __init__(self, latency: float = 0.05):
+        self.latency = latency
+        self.tables = {}
+        self.lock = threading.Lock()
+        self._ids = 0
+
+    def next_id(self) -> str:
+        # Increasing ids keep insertion order equal to (created_at, id) order
+        self._ids += 1
+        return str(uuid.UUID(int=self._ids))
+
+    def table(self, name: str):
+        return FakeQuery(self, name)
+
+    def rpc(self, fn: str, params=None):
+        # Functions return no rows
+        return FakeQuery(self, f'rpc:{fn}')
@@ -0,0 +1,265 @@
+"""Load test: concurrent traffic against the webhook, listing, metrics and export endpoints.
+
+Usage (from backend/):
+
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --concurrency 50 --duration 15 --latency 0.05
+    python benchmarks/loadtest.py --scenarios lead_capture,leads --label pg-pool
+    python benchmarks/loadtest.py --compare benchmarks/results/loadtest-20250910-101500.json
+    python benchmarks/loadtest.py --base-url http://127.0.0.1:8001
+
+Without ``--base-url`` it boots ``benchmarks.fake_server:app`` under uvicorn
+in a subprocess, backed by FakeSupabase with ``--latency`` seconds per
+PostgREST call, so it runs offline and gives the same numbers on the same
+machine. With ``--base-url`` it drives a server that is already running,
+e.g. one pointed at a local Supabase/Postgres.
+
+Each scenario runs on its own for ``--duration`` seconds (after
+``--warmup``) with ``--concurrency`` requests in flight. p50/p90/p99 are
+exact, from every request's latency. Results are written to
+``benchmarks/results/`` as JSON; ``--compare`` prints the change against
+an earlier file and exits with status 1 when any scenario's p99 or
+requests/sec got worse by more than ``--max-regression``.
+
+The load generator shares the machine with the server, so at high
+concurrency the client's own CPU use shows up in the numbers.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+LEAD = {
+    "name": "Load Test",
+    "email": "load@example.com",
+    "whatsapp": "+34666777888",
+    "userAgent": "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X)",
+    "utmSource": "facebook",
+    "utmCampaign": "moda-rentable",
+    "quizAnswers": {"1": "marca-emergente", "3": "produccion", "4": "reducir-costos"},
+    "bucketId": "produccion",
+}
+
+_transactions = itertools.count()
+
+
+def purchase_body() -> Dict[str, Any]:
+    # Unique per request so no purchase is answered as a duplicate
+    return {**LEAD, "transactionId": f"load-{os.getpid()}-{time.time_ns()}-{next(_transactions)}"}
+
+
+# name -> (method, path, body factory)
+SCENARIOS: Dict[str, tuple] = {
+    'lead_capture': ('POST', '/api/webhooks/lead-capture', lambda: LEAD),
+    'purchase': ('POST', '/api/webhooks/purchase', purchase_body),
+    'leads': ('GET', '/api/leads?limit=100', None),
+    'purchases': ('GET', '/api/purchases?limit=100', None),
+    'metrics': ('GET', '/api/metrics', None),
+    'export_leads_csv': ('GET', '/api/export-leads-csv', None),
+}
+
+
+def percentile(latencies: List[float], q: float) -> float:
+    return latencies[min(int(len(latencies) * q), len(latencies) - 1)] if latencies else 0.0
+
+
+async def run_scenario(
+    client: httpx.AsyncClient, method: str, path: str, body: Optional[Callable[[], Any]],
+    concurrency: int, duration: float, warmup: float,
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+    recording = False
+
+    async def worker(deadline: float):
+        nonlocal errors
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body() if body else None)
+                ok = response.is_success and (method == 'GET' or response.json().get('success', True))
+            except (httpx.HTTPError, ValueError):
+                ok = False
+            if recording:
+                latencies.append(time.perf_counter() - start)
+                errors += not ok
+
+    if warmup > 0:
+        await asyncio.gather(*(worker(time.perf_counter() + warmup) for _ in range(concurrency)))
+    recording = True
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(start + duration) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p90_ms": round(percentile(latencies, 0.90) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(args) -> tuple:
+    port = free_port()
+    env = {
+        **os.environ,
+        'FAKE_SUPABASE_LATENCY': str(args.latency),
+        'FAKE_SEED_LEADS': str(args.seed_leads),
+        'FAKE_SEED_PURCHASES': str(args.seed_purchases),
+    }
+    log = open(args.server_log, 'w') if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'benchmarks.fake_server:app',
+         '--host', '127.0.0.1', '--port', str(port), '--no-access-log', '--log-level', 'warning'],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    return process, f'http://127.0.0.1:{port}'
+
+
+async def wait_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while True:
+            try:
+                if (await client.get('/api/health')).is_success:
+                    return
+            except httpx.HTTPError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"Server at {base_url} not ready after {timeout}s")
+            await asyncio.sleep(0.2)
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(scenarios: Dict[str, Dict[str, Any]]):
+    print(f"{'scenario':18s} {'requests':>9s} {'errors':>7s} {'req/s':>9s} {'p50 ms':>9s} {'p90 ms':>9s} "
+          f"{'p99 ms':>9s} {'max ms':>9s}")
+    for name, result in scenarios.items():
+        print(f"{name:18s} {result['requests']:9d} {result['errors']:7d} {result['rps']:9.1f} "
+              f"{result['p50_ms']:9.2f} {result['p90_ms']:9.2f} {result['p99_ms']:9.2f} {result['max_ms']:9.2f}")
+
+
+def compare(report: Dict[str, Any], baseline_path: Path, max_regression: float) -> bool:
+    """Print the change against ``baseline_path``; False when something regressed."""
+    baseline = json.loads(baseline_path.read_text())
+    print(f"\nvs {baseline_path.name} ({baseline.get('revision') or 'unknown revision'}, "
+          f"{baseline.get('label') or 'no label'}):")
+    changed = [key for key, value in report['config'].items() if baseline['config'].get(key) != value]
+    if changed:
+        print(f"warning: runs differ in {', '.join(changed)}; the comparison may not be meaningful")
+    current = report['scenarios']
+    passed = True
+    for name, result in current.items():
+        before = baseline['scenarios'].get(name)
+        if before is None:
+            print(f"{name:18s} not in baseline")
+            continue
+        rps_change = result['rps'] / before['rps'] - 1 if before['rps'] else 0.0
+        p99_change = result['p99_ms'] / before['p99_ms'] - 1 if before['p99_ms'] else 0.0
+        regressed = rps_change < -max_regression or p99_change > max_regression
+        passed = passed and not regressed
+        print(f"{name:18s} req/s {before['rps']:9.1f} -> {result['rps']:9.1f} ({rps_change:+6.1%})   "
+              f"p99 {before['p99_ms']:8.2f} -> {result['p99_ms']:8.2f} ms ({p99_change:+6.1%})"
+              f"{'   REGRESSION' if regressed else ''}")
+    return passed
+
+
+async def main(args) -> int:
+    names = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)} (choose from {', '.join(SCENARIOS)})")
+
+    process = None
+    base_url = args.base_url
+    if base_url is None:
+        process, base_url = start_server(args)
+    try:
+        await wait_ready(base_url)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+            scenarios = {}
+            for name in names:
+                method, path, body = SCENARIOS[name]
+                scenarios[name] = await run_scenario(
+                    client, method, path, body, args.concurrency, args.duration, args.warmup,
+                )
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    print_results(scenarios)
+    report = {
+        "label": args.label,
+        "revision": git_revision(),
+        "timestamp": datetime.now().isoformat(timespec='seconds'),
+        "config": {
+            "baseUrl": args.base_url,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "warmup": args.warmup,
+            "latency": None if args.base_url else args.latency,
+            "seedLeads": None if args.base_url else args.seed_leads,
+            "seedPurchases": None if args.base_url else args.seed_purchases,
+            "python": sys.version.split()[0],
+        },
+        "scenarios": scenarios,
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"loadtest-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + '\n')
+    print(f"\nResults written to {output}")
+
+    if args.compare and not compare(report, Path(args.compare), args.max_regression):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', help='drive an already running server instead of the fake one')
+    parser.add_argument('--scenarios', help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', type=int, default=20)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=1.0, help='unrecorded seconds before each scenario')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--latency', type=float, default=0.02, help='fake PostgREST latency in seconds')
+    parser.add_argument('--seed-leads', type=int, default=5000)
+    parser.add_argument('--seed-purchases', type=int, default=1000)
+    parser.add_argument('--server-log', help='write the fake server output to this file')
+    parser.add_argument('--label', help='free-form note stored with the results')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/loadtest-<time>.json)')
+    parser.add_argument('--compare', help='earlier results file to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='allowed relative p99/req/s regression')
+    sys.exit(asyncio.run(main(parser.parse_args())))
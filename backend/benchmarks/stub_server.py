@@ -0,0 +1,64 @@
+"""Minimal keep-alive HTTP/1.1 server standing in for external webhook targets.
+
+Every request is answered after ``latency`` seconds; with ``failure_rate``
+a share of requests get ``failure_status`` (503 by default) instead of a
+200. Set ``down`` to answer every request with a failure. Counts
+connections and requests so benchmarks can show connection reuse.
+"""
+import asyncio
+import random
+
+
+class StubServer:
+    def __init__(self, latency: float = 0.02, failure_rate: float = 0.0, failure_status: int = 503, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.failure_status = failure_status
+        self.down = False
+        self.random = random.Random(seed)
+        self.connections = 0
+        self.requests = 0
+        self.failures = 0
+        self._server = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f'http://{host}:{port}/hook'
+
+    async def start(self, host: str = '127.0.0.1', port: int = 0):
+        self._server = await asyncio.start_server(self._handle, host, port, backlog=1024)
+        return self
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                length = 0
+                for line in head.split(b'\r\n')[1:]:
+                    name, _, value = line.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value)
+                if length:
+                    await reader.readexactly(length)
+                self.requests += 1
+                await asyncio.sleep(self.latency)
+                if self.down or self.random.random() < self.failure_rate:
+                    self.failures += 1
+                    status, body = f'{self.failure_status} Failed'.encode(), b'{"ok":false}'
+                else:
+                    status, body = b'200 OK', b'{"ok":true}'
+                writer.write(
+                    b'HTTP/1.1 ' + status + b'\r\nContent-Type: application/json\r\n'
+                    b'Content-Length: ' + str(len(body)).encode() + b'\r\n\r\n' + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
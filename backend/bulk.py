@@ -0,0 +1,137 @@
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, AsyncIterator, Dict, List, Sequence, Tuple, Type, Union
+
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+try:
+    import orjson
+    loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    import json
+    loads = json.loads
+    JSONDecodeError = json.JSONDecodeError
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines')
+
+# Webhook row columns that are timestamptz in the database; the rows carry ISO strings
+TIMESTAMP_COLUMNS = {'timestamp', 'created_at'}
+# ...and decimal ones, which the rows carry as floats
+NUMERIC_COLUMNS = {'value'}
+
+# A validated payload, or the validation errors for that item
+Item = Union[BaseModel, List[Dict[str, Any]]]
+
+
+class MalformedBody(Exception):
+    """The request body is not a JSON array or NDJSON."""
+
+
+class TooManyItems(Exception):
+    """The request carries more items than one batch may hold."""
+
+
+class BodyTooLarge(Exception):
+    """The request body is larger than one batch may be."""
+
+
+def is_ndjson(content_type: str) -> bool:
+    return content_type.split(';', 1)[0].strip().lower() in NDJSON_TYPES
+
+
+def error_details(error: ValidationError) -> List[Dict[str, Any]]:
+    return [
+        {"loc": '.'.join(str(part) for part in detail['loc']), "msg": detail['msg']}
+        for detail in error.errors(include_url=False)
+    ]
+
+
+async def limit_body(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[bytes]:
+    """Pass the body through, raising BodyTooLarge as soon as more than ``max_bytes`` have arrived."""
+    received = 0
+    async for chunk in chunks:
+        received += len(chunk)
+        if received > max_bytes:
+            raise BodyTooLarge(f"At most {max_bytes} bytes per batch")
+        yield chunk
+
+
+async def read_body(chunks: AsyncIterator[bytes], max_bytes: int) -> bytes:
+    return b''.join([chunk async for chunk in limit_body(chunks, max_bytes)])
+
+
+def validate_array(model: Type[BaseModel], adapter: TypeAdapter, body: bytes, max_items: int) -> List[Item]:
+    """Validate a JSON array of payloads.
+
+    The array is parsed once and its length checked before any item is
+    validated. The whole list is then validated in one pass by pydantic-core;
+    only when some item is invalid is it validated again item by item, so
+    each one gets its own result.
+    """
+    try:
+        raw_items = loads(body)
+    except (JSONDecodeError, ValueError) as e:
+        raise MalformedBody(f"Invalid JSON: {e}")
+    if not isinstance(raw_items, list):
+        raise MalformedBody("Expected a JSON array of webhook payloads")
+    if len(raw_items) > max_items:
+        raise TooManyItems(f"At most {max_items} items per batch")
+    try:
+        return adapter.validate_python(raw_items)
+    except ValidationError:
+        pass
+    results: List[Item] = []
+    for raw in raw_items:
+        try:
+            results.append(model.model_validate(raw))
+        except ValidationError as e:
+            results.append(error_details(e))
+    return results
+
+
+async def iter_ndjson(chunks: AsyncIterator[bytes], model: Type[BaseModel], max_items: int) -> AsyncIterator[Item]:
+    """Validate NDJSON payloads line by line as the body streams in. Blank lines are skipped."""
+    buffer = b''
+    count = 0
+    async for chunk in chunks:
+        buffer += chunk
+        lines = buffer.split(b'\n')
+        buffer = lines.pop()
+        for line in lines:
+            if not line.strip():
+                continue
+            count += 1
+            if count > max_items:
+                raise TooManyItems(f"At most {max_items} items per batch")
+            yield validate_line(model, line)
+    if buffer.strip():
+        if count + 1 > max_items:
+            raise TooManyItems(f"At most {max_items} items per batch")
+        yield validate_line(model, buffer)
+
+
+def validate_line(model: Type[BaseModel], line: bytes) -> Item:
+    try:
+        return model.model_validate_json(line)
+    except ValidationError as e:
+        return error_details(e)
+
+
+def copy_records(rows: Sequence[Dict[str, Any]], columns: Sequence[str]) -> List[Tuple[Any, ...]]:
+    """Rows as tuples in ``columns`` order, with the values COPY expects."""
+    timestamps = [index for index, column in enumerate(columns) if column in TIMESTAMP_COLUMNS]
+    numerics = [index for index, column in enumerate(columns) if column in NUMERIC_COLUMNS]
+    records = []
+    for row in rows:
+        record = [row[column] for column in columns]
+        for index in timestamps:
+            if isinstance(record[index], str):
+                parsed = datetime.fromisoformat(record[index])
+                record[index] = parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+        # Through str, so 19.99 is stored as 19.99 like PostgREST does, not as its binary expansion
+        for index in numerics:
+            if isinstance(record[index], float):
+                record[index] = Decimal(str(record[index]))
+        records.append(tuple(record))
+    return records
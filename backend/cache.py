@@ -0,0 +1,74 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional, Tuple
+
+
+class CachedValue:
+    """Caches the result of an async loader for ``ttl`` seconds.
+
+    Concurrent callers that miss the cache share a single load, so a burst
+    of dashboard refreshes turns into one database query. ``invalidate()``
+    drops the cached value; the next ``get()`` reloads it.
+    """
+
+    def __init__(self, loader: Callable[[], Awaitable[Any]], ttl: float = 5.0):
+        self.loader = loader
+        self.ttl = ttl
+        self._value: Any = None
+        self._expires_at = 0.0
+        self._loading: Optional[asyncio.Future] = None
+        self._generation = 0
+
+    async def get(self) -> Any:
+        if time.monotonic() < self._expires_at:
+            return self._value
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(self._load())
+        return await asyncio.shield(self._loading)
+
+    async def _load(self) -> Any:
+        generation = self._generation
+        try:
+            value = await self.loader()
+        finally:
+            self._loading = None
+        # Don't cache a value that was invalidated while it was loading
+        if generation == self._generation:
+            self._value = value
+            self._expires_at = time.monotonic() + self.ttl
+        return value
+
+    def invalidate(self):
+        self._generation += 1
+        self._expires_at = 0.0
+
+
+class CachedValues:
+    """A ``CachedValue`` per set of arguments, for loaders that take some.
+
+    ``get(*args)`` caches ``loader(*args)`` for ``ttl`` seconds. At most
+    ``max_entries`` argument sets are kept, the least recently used are
+    dropped first. ``invalidate()`` drops them all.
+    """
+
+    def __init__(self, loader: Callable[..., Awaitable[Any]], ttl: float = 5.0, max_entries: int = 256):
+        self.loader = loader
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[Hashable, ...], CachedValue]" = OrderedDict()
+
+    async def get(self, *args: Hashable) -> Any:
+        entry = self._entries.get(args)
+        if entry is None:
+            entry = CachedValue(lambda: self.loader(*args), ttl=self.ttl)
+            self._entries[args] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(args)
+        return await entry.get()
+
+    def invalidate(self):
+        # Loads in flight finish for their callers but are not kept
+        self._entries.clear()
@@ -0,0 +1,247 @@
+import asyncio
+import hashlib
+import logging
+import re
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from delivery import RETRYABLE_STATUS
+from ingestion import QueueFull
+
+logger = logging.getLogger(__name__)
+
+# Events per Conversions API request allowed by Meta
+MAX_BATCH_SIZE = 1000
+
+NON_DIGITS = re.compile(r'\D')
+
+
+@lru_cache(maxsize=10000)
+def sha256_hex(normalized: str) -> str:
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+def hash_field(value: Optional[str]) -> Optional[str]:
+    """Normalize (trim, lowercase) and SHA-256 a PII value, as Meta requires."""
+    if not value:
+        return None
+    normalized = value.strip().lower()
+    return sha256_hex(normalized) if normalized else None
+
+
+def hash_phone(value: Optional[str]) -> Optional[str]:
+    # Digits only, country code included
+    digits = NON_DIGITS.sub('', value or '')
+    return sha256_hex(digits) if digits else None
+
+
+def event_time(row: Dict[str, Any]) -> int:
+    timestamp = row.get('timestamp')
+    if timestamp:
+        value = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    return int(time.time())
+
+
+def click_id(row: Dict[str, Any], at: int) -> Optional[str]:
+    # Without the _fbc cookie, build it from the fbclid the visitor arrived with
+    if row.get('_fbc'):
+        return row['_fbc']
+    if row.get('fbclid'):
+        return f"fb.1.{at * 1000}.{row['fbclid']}"
+    return None
+
+
+def build_event(row: Dict[str, Any], event_id: str) -> Dict[str, Any]:
+    """Conversions API event for a lead or purchase webhook row.
+
+    PII is hashed here, once, so retries resend the same payload. ``event_id``
+    lets Meta drop duplicates of the same conversion (retried webhooks,
+    retried requests, or the browser pixel sending the same id).
+    """
+    at = event_time(row)
+    first_name, _, last_name = (row.get('name') or '').strip().partition(' ')
+    user_data = {
+        "em": hash_field(row.get('email')),
+        "ph": hash_phone(row.get('whatsapp')),
+        "fn": hash_field(first_name),
+        "ln": hash_field(last_name),
+        "client_ip_address": row.get('client_ip'),
+        "client_user_agent": row.get('user_agent'),
+        "fbc": click_id(row, at),
+        "fbp": row.get('_fbp'),
+    }
+    custom_data = {"value": row.get('value'), "currency": row.get('currency')}
+    if row.get('transaction_id'):
+        custom_data["order_id"] = row['transaction_id']
+    event = {
+        "event_name": row.get('event_type'),
+        "event_time": at,
+        "event_id": event_id,
+        "action_source": "website",
+        "event_source_url": row.get('current_url'),
+        "user_data": {key: value for key, value in user_data.items() if value},
+        "custom_data": {key: value for key, value in custom_data.items() if value is not None},
+    }
+    return {key: value for key, value in event.items() if value is not None}
+
+
+class TransportError(Exception):
+    def __init__(self, message: str, retryable: bool = True):
+        super().__init__(message)
+        self.retryable = retryable
+
+
+class GraphApiTransport:
+    """Sends event batches to the Graph API ``/{pixel_id}/events`` endpoint.
+
+    ``base_url`` can point at a local stand-in for testing. Transports only
+    need an ``async send(events)`` that raises TransportError on failure.
+    """
+
+    def __init__(
+        self,
+        proxy,
+        pixel_id: str,
+        access_token: str,
+        api_version: str = 'v21.0',
+        base_url: str = 'https://graph.facebook.com',
+        test_event_code: Optional[str] = None,
+        timeout: float = 10.0,
+    ):
+        self.proxy = proxy
+        self.url = f"{base_url.rstrip('/')}/{api_version}/{pixel_id}/events"
+        self.access_token = access_token
+        self.test_event_code = test_event_code
+        self.timeout = timeout
+
+    async def send(self, events: List[Dict[str, Any]]):
+        payload = {"data": events, "access_token": self.access_token}
+        if self.test_event_code:
+            payload["test_event_code"] = self.test_event_code
+        try:
+            response = await self.proxy.post(self.url, payload, self.timeout)
+        except httpx.HTTPError as e:
+            raise TransportError(str(e) or type(e).__name__)
+        if response.is_success:
+            return
+        retryable = response.status_code in RETRYABLE_STATUS
+        raise TransportError(f"Conversions API responded {response.status_code}: {response.text[:200]}", retryable)
+
+
+class ConversionsPipeline:
+    """Batches conversion events and sends them through a transport.
+
+    Events are collected by one background task and sent when a batch
+    reaches ``batch_size`` events or ``max_delay`` seconds after its first
+    event, whichever comes first. Retryable failures are retried with
+    backoff up to ``max_attempts``; a batch that is rejected or runs out of
+    attempts is dropped and logged, since these events are best-effort and
+    must never hold up ingestion. ``stop()`` flushes what is queued.
+    """
+
+    def __init__(
+        self,
+        transport,
+        batch_size: int = MAX_BATCH_SIZE,
+        max_delay: float = 2.0,
+        max_queue: int = 10000,
+        max_attempts: int = 5,
+        base_delay: float = 1.0,
+        drain_timeout: float = 10.0,
+    ):
+        self.transport = transport
+        self.batch_size = min(batch_size, MAX_BATCH_SIZE)
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.drain_timeout = drain_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self._closed = False
+        self.sent = 0
+        self.batches = 0
+        self.dropped = 0
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, event: Dict[str, Any]):
+        if self._closed:
+            raise QueueFull("Conversions queue is shutting down")
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            raise QueueFull("Conversions queue is full")
+
+    async def stop(self):
+        self._closed = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Conversions queue drain timed out with {self._queue.qsize()} events pending")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._send(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _send(self, batch: List[Dict[str, Any]]):
+        delay = self.base_delay
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                await self.transport.send(batch)
+                self.sent += len(batch)
+                self.batches += 1
+                return
+            except TransportError as e:
+                if not e.retryable or attempt == self.max_attempts:
+                    logger.error(f"Dropping {len(batch)} conversion events after {attempt} attempts: {e}")
+                    break
+                logger.warning(f"Sending {len(batch)} conversion events failed, retrying in {delay}s: {e}")
+            except Exception as e:
+                logger.error(f"Dropping {len(batch)} conversion events: {e}")
+                break
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 60.0)
+        self.dropped += len(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self._queue.qsize(),
+            "sent": self.sent,
+            "batches": self.batches,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,193 @@
+import asyncio
+import json
+import zlib
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Any, AsyncIterator, Dict, List
+
+Row = Dict[str, Any]
+
+# format -> (media type, file extension)
+FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+    'ndjson.gz': ('application/gzip', 'ndjson.gz'),
+}
+
+# Exported columns per table as (name, logical type), in output order
+COMMON_COLUMNS = [
+    ('id', 'string'), ('session_id', 'string'),
+    ('name', 'string'), ('email', 'string'), ('whatsapp', 'string'),
+]
+TRACKING_COLUMNS = [
+    ('user_agent', 'string'), ('fbclid', 'string'), ('_fbc', 'string'), ('_fbp', 'string'),
+    ('utm_source', 'string'), ('utm_medium', 'string'), ('utm_campaign', 'string'),
+    ('utm_content', 'string'), ('utm_term', 'string'),
+    ('referrer', 'string'), ('current_url', 'string'),
+    ('quiz_answers', 'answers'),
+]
+EVENT_COLUMNS = [
+    ('event_type', 'string'), ('value', 'money'), ('currency', 'string'),
+]
+TIME_COLUMNS = [
+    ('client_ip', 'string'), ('timestamp', 'timestamp'), ('created_at', 'timestamp'),
+]
+
+COLUMNS = {
+    'lead_webhooks': COMMON_COLUMNS + TRACKING_COLUMNS + [('bucket_id', 'string')] + EVENT_COLUMNS + TIME_COLUMNS,
+    'purchase_webhooks': (
+        COMMON_COLUMNS + [('transaction_id', 'string'), ('order_id', 'string')]
+        + TRACKING_COLUMNS + EVENT_COLUMNS + [('payment_method', 'string')] + TIME_COLUMNS
+    ),
+}
+
+CENT = Decimal('0.01')
+
+
+def _pa():
+    # pyarrow is only needed for parquet/arrow, so import it on first use
+    import pyarrow
+    return pyarrow
+
+
+def arrow_type(kind: str):
+    pa = _pa()
+    return {
+        'string': pa.string(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'money': pa.decimal128(12, 2),
+        # Multi-select answers are lists; they are kept as JSON text
+        'answers': pa.map_(pa.string(), pa.string()),
+    }[kind]
+
+
+def schema(table: str):
+    pa = _pa()
+    return pa.schema([(name, arrow_type(kind)) for name, kind in COLUMNS[table]])
+
+
+def _money(value) -> Any:
+    if value is None:
+        return None
+    return Decimal(str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def _answers(value) -> Any:
+    if not isinstance(value, dict):
+        return None
+    return [(str(k), v if isinstance(v, str) or v is None else json.dumps(v, ensure_ascii=False)) for k, v in value.items()]
+
+
+def to_record_batch(table: str, rows: List[Row]):
+    """Build one Arrow record batch from a page of rows, column by column."""
+    pa = _pa()
+    arrays = []
+    for name, kind in COLUMNS[table]:
+        values = [row.get(name) for row in rows]
+        if kind == 'string':
+            arrays.append(pa.array([None if v is None else str(v) for v in values], pa.string()))
+        elif kind == 'timestamp':
+            # PostgREST and PgPool both return ISO-8601 strings; Arrow parses them natively
+            arrays.append(pa.array(values, pa.string()).cast(arrow_type('timestamp')))
+        elif kind == 'money':
+            arrays.append(pa.array([_money(v) for v in values], arrow_type('money')))
+        elif kind == 'answers':
+            arrays.append(pa.array([_answers(v) for v in values], arrow_type('answers')))
+    return pa.RecordBatch.from_arrays(arrays, schema=schema(table))
+
+
+class ChunkSink:
+    """Write-only file object that hands written bytes back to the streamer."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+async def _row_groups(pages: AsyncIterator[List[Row]], row_group_size: int) -> AsyncIterator[List[Row]]:
+    # Merge small (PostgREST-capped) pages into row groups of a useful size
+    group: List[Row] = []
+    async for page in pages:
+        group.extend(page)
+        if len(group) >= row_group_size:
+            yield group
+            group = []
+    if group:
+        yield group
+
+
+async def stream_arrow(
+    pages: AsyncIterator[List[Row]], table: str, fmt: str, row_group_size: int = 20000
+) -> AsyncIterator[bytes]:
+    """Stream pages as Parquet (one row group per group) or an Arrow IPC stream."""
+    pa = _pa()
+    sink = ChunkSink()
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(sink, schema(table), compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(sink, schema(table))
+
+    def write_group(group):
+        batch = to_record_batch(table, group)
+        if fmt == 'parquet':
+            writer.write_batch(batch, row_group_size=len(group))
+        else:
+            writer.write_batch(batch)
+
+    async for group in _row_groups(pages, row_group_size):
+        # Conversion and compression are CPU bound; keep them off the event loop
+        await asyncio.to_thread(write_group, group)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _json_row(table: str, row: Row) -> Dict[str, Any]:
+    out = {}
+    for name, kind in COLUMNS[table]:
+        value = row.get(name)
+        if kind == 'money' and value is not None:
+            value = float(_money(value))
+        out[name] = value
+    return out
+
+
+async def stream_ndjson_gz(pages: AsyncIterator[List[Row]], table: str) -> AsyncIterator[bytes]:
+    """Stream pages as gzip-compressed newline-delimited JSON."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    async for page in pages:
+        lines = ''.join(
+            json.dumps(_json_row(table, row), ensure_ascii=False, separators=(',', ':')) + '\n'
+            for row in page
+        )
+        chunk = compressor.compress(lines.encode('utf-8'))
+        if chunk:
+            yield chunk
+    yield compressor.flush()
+
+
+def stream_export(pages: AsyncIterator[List[Row]], table: str, fmt: str, row_group_size: int = 20000):
+    if fmt == 'ndjson.gz':
+        return stream_ndjson_gz(pages, table)
+    return stream_arrow(pages, table, fmt, row_group_size)
@@ -0,0 +1,211 @@
+import asyncio
+import fcntl
+import logging
+import os
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Leadership:
+    """Elects one worker process to run the singleton background jobs.
+
+    With a Postgres DSN the leader is whoever holds a session-level
+    advisory lock (``pg_try_advisory_lock(key)``) on a dedicated
+    connection, which works across hosts; the lock goes away with the
+    connection, so another worker takes over within ``check_interval``
+    seconds of the leader dying. Without a DSN the leader holds an
+    exclusive ``flock`` on ``lock_path``, which only covers the workers of
+    one host. Jobs must still tolerate running twice: after a lost
+    connection the old leader finds out at its next check, by which time
+    a new one may have started.
+
+    The DSN has to be a session connection (direct, or the pooler on port
+    5432): the transaction pooler does not keep session locks.
+    """
+
+    def __init__(self, dsn: Optional[str], key: int, lock_path: str, check_interval: float = 5.0):
+        self.dsn = dsn
+        self.key = key
+        self.lock_path = lock_path
+        self.check_interval = check_interval
+        self.is_leader = False
+        self._conn = None
+        self._lock_file = None
+        self._task = None
+
+    async def start(self):
+        # First attempt before returning, so a single worker is leader from the start
+        await self._check()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.is_leader = False
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.check_interval)
+            await self._check()
+
+    async def _check(self):
+        was_leader = self.is_leader
+        try:
+            if self.dsn:
+                self.is_leader = await self._check_advisory_lock()
+            else:
+                self.is_leader = self._check_file_lock()
+        except Exception as e:
+            logger.error(f"Leader check failed: {e}")
+            self.is_leader = False
+            if self._conn is not None:
+                conn, self._conn = self._conn, None
+                conn.terminate()
+        if self.is_leader != was_leader:
+            logger.info(f"Worker {os.getpid()} {'is now' if self.is_leader else 'is no longer'} the leader")
+
+    async def _check_advisory_lock(self) -> bool:
+        import asyncpg
+
+        if self._conn is None or self._conn.is_closed():
+            self._conn = await asyncpg.connect(self.dsn, statement_cache_size=0)
+            self.is_leader = False
+        if self.is_leader:
+            # The lock lives as long as the session; a failing query means it is gone
+            await self._conn.fetchval('SELECT 1')
+            return True
+        return await self._conn.fetchval('SELECT pg_try_advisory_lock($1)', self.key)
+
+    def _check_file_lock(self) -> bool:
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+
+class Invalidations:
+    """Cache invalidation shared by all worker processes.
+
+    ``publish(name)`` runs the callbacks registered under ``name`` in this
+    process right away and, with a Postgres DSN, sends ``NOTIFY`` on
+    ``channel`` so the other workers run theirs. Notifications are
+    coalesced: each name is sent at most once per ``flush_interval``,
+    however many writes happen in between. A dedicated connection LISTENs
+    for the other workers' notifications; while it is down caches are only
+    bounded by their TTL, and everything is invalidated on reconnect in
+    case a notification was missed. The connection is pinged every
+    ``keepalive`` seconds when idle so a dead one is noticed. Without a DSN
+    only the local callbacks run.
+    """
+
+    def __init__(
+        self,
+        dsn: Optional[str],
+        channel: str = 'cache_invalidation',
+        flush_interval: float = 0.1,
+        keepalive: float = 30.0,
+    ):
+        self.dsn = dsn
+        self.channel = channel
+        self.flush_interval = flush_interval
+        self.keepalive = keepalive
+        self._callbacks: Dict[str, List[Callable[[], None]]] = {}
+        self._outgoing: set = set()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._conn = None
+        self._task = None
+        self.received = 0
+
+    def register(self, name: str, callback: Callable[[], None]):
+        self._callbacks.setdefault(name, []).append(callback)
+
+    def publish(self, name: str):
+        self._invalidate(name)
+        if self._task is not None:
+            self._outgoing.add(name)
+            self._wakeup.set()
+
+    def _invalidate(self, name: str):
+        for callback in self._callbacks.get(name, ()):
+            callback()
+
+    def _on_notification(self, conn, pid: int, channel: str, payload: str):
+        # Our own notifications come back too; those are already applied
+        if pid != conn.get_server_pid():
+            self.received += 1
+            self._invalidate(payload)
+
+    async def start(self):
+        if self.dsn and self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            await conn.close()
+
+    async def _flush(self):
+        outgoing, self._outgoing = self._outgoing, set()
+        try:
+            for name in outgoing:
+                await self._conn.execute('SELECT pg_notify($1, $2)', self.channel, name)
+        except Exception:
+            # Sent again after reconnecting
+            self._outgoing |= outgoing
+            raise
+
+    async def _run(self):
+        import asyncpg
+
+        delay = 1.0
+        while True:
+            try:
+                self._conn = await asyncpg.connect(self.dsn, statement_cache_size=0)
+                await self._conn.add_listener(self.channel, self._on_notification)
+                delay = 1.0
+                for name in self._callbacks:
+                    self._invalidate(name)
+                while True:
+                    try:
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=self.keepalive)
+                    except asyncio.TimeoutError:
+                        await self._conn.execute('SELECT 1')
+                        continue
+                    self._wakeup.clear()
+                    await self._flush()
+                    await asyncio.sleep(self.flush_interval)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Cache invalidation connection failed, reconnecting in {delay}s: {e}")
+                if self._conn is not None:
+                    conn, self._conn = self._conn, None
+                    conn.terminate()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
@@ -0,0 +1,240 @@
+import asyncio
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from telemetry import registry
+
+db_calls = registry.counter('db_calls_total', 'Database calls by client and outcome', ('client', 'outcome'))
+db_duration = registry.histogram('db_call_duration_seconds', 'Database call duration, waiting for a slot included', ('client',))
+
+
+class Database:
+    """Runs supabase-py queries off the event loop.
+
+    The supabase client is synchronous: ``query.execute()`` blocks for the
+    whole PostgREST round trip. Routes build their query as usual and hand it
+    to ``await db.execute(query)``, which runs it on a bounded thread pool.
+    At most ``max_concurrency`` calls are in flight; the rest wait in the
+    executor queue instead of blocking the loop.
+
+    Pass either a ready ``client`` or a ``factory`` that builds one. With a
+    factory the client is created on first use, or ahead of it by
+    ``connect()``, so importing the app doesn't pay for supabase-py.
+    """
+
+    def __init__(self, client=None, max_concurrency: int = 16, factory: Optional[Callable[[], Any]] = None):
+        if client is None and factory is None:
+            raise ValueError("Database needs a client or a factory")
+        self._client = client
+        self._factory = factory
+        self._lock = threading.Lock()
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency,
+            thread_name_prefix='supabase',
+        )
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory()
+        return self._client
+
+    async def connect(self):
+        """Create the client on the executor, off the event loop."""
+        if self._client is None:
+            await asyncio.get_running_loop().run_in_executor(self._executor, lambda: self.client)
+
+    def table(self, name: str):
+        return self.client.table(name)
+
+    def rpc(self, fn: str, params: Optional[Dict[str, Any]] = None):
+        return self.client.rpc(fn, params or {})
+
+    _ok = db_calls.labels('postgrest', 'ok')
+    _error = db_calls.labels('postgrest', 'error')
+    _duration = db_duration.labels('postgrest')
+
+    async def execute(self, query):
+        loop = asyncio.get_running_loop()
+        started = time.perf_counter()
+        try:
+            result = await loop.run_in_executor(self._executor, query.execute)
+        except Exception:
+            self._error.inc()
+            raise
+        finally:
+            self._duration.observe(time.perf_counter() - started)
+        self._ok.inc()
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+def to_json_value(value: Any) -> Any:
+    """Convert asyncpg values to what PostgREST would have returned in JSON."""
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def record_to_dict(record) -> Dict[str, Any]:
+    return {key: to_json_value(value) for key, value in record.items()}
+
+
+class PgPool:
+    """Application-wide asyncpg pool for direct SQL on the hot read paths.
+
+    Only used when ``SUPABASE_DB_URL`` is configured; otherwise ``available``
+    stays False and callers fall back to the PostgREST client. Queries go
+    through ``Connection.fetch``, which prepares each statement once per
+    connection and keeps it in asyncpg's statement cache. Rows come back
+    shaped like PostgREST JSON (ISO timestamps, numeric as float, uuid as
+    str), so callers don't care which path served them.
+    """
+
+    def __init__(
+        self,
+        dsn: Optional[str],
+        min_size: int = 1,
+        max_size: int = 10,
+        statement_cache_size: int = 100,
+        acquire_timeout: float = 5.0,
+        command_timeout: float = 10.0,
+        max_inactive_connection_lifetime: float = 300.0,
+    ):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.statement_cache_size = statement_cache_size
+        self.acquire_timeout = acquire_timeout
+        self.command_timeout = command_timeout
+        self.max_inactive_connection_lifetime = max_inactive_connection_lifetime
+        self.pool = None
+
+    @property
+    def available(self) -> bool:
+        return self.pool is not None
+
+    async def open(self):
+        if not self.dsn or self.pool is not None:
+            return
+        # Imported here so deployments without SUPABASE_DB_URL never load it
+        import asyncpg
+
+        self.pool = await asyncpg.create_pool(
+            self.dsn,
+            min_size=self.min_size,
+            max_size=self.max_size,
+            statement_cache_size=self.statement_cache_size,
+            command_timeout=self.command_timeout,
+            max_inactive_connection_lifetime=self.max_inactive_connection_lifetime,
+            init=self._init_connection,
+        )
+
+    async def close(self):
+        if self.pool is not None:
+            pool, self.pool = self.pool, None
+            await pool.close()
+
+    @staticmethod
+    async def _init_connection(conn):
+        # Return json/jsonb columns as Python objects, like PostgREST does. The
+        # codecs use the binary format so COPY, which only speaks binary, can
+        # write these columns too; binary jsonb is a version byte and the text.
+        await conn.set_type_codec(
+            'json', encoder=lambda value: json.dumps(value).encode(), decoder=json.loads,
+            schema='pg_catalog', format='binary',
+        )
+        await conn.set_type_codec(
+            'jsonb', encoder=lambda value: b'\x01' + json.dumps(value).encode(),
+            decoder=lambda data: json.loads(data[1:]), schema='pg_catalog', format='binary',
+        )
+
+    _ok = db_calls.labels('asyncpg', 'ok')
+    _error = db_calls.labels('asyncpg', 'error')
+    _duration = db_duration.labels('asyncpg')
+
+    async def _run(self, work: Callable[[Any], Awaitable[Any]]):
+        started = time.perf_counter()
+        try:
+            async with self.pool.acquire(timeout=self.acquire_timeout) as conn:
+                result = await work(conn)
+        except Exception:
+            self._error.inc()
+            raise
+        finally:
+            self._duration.observe(time.perf_counter() - started)
+        self._ok.inc()
+        return result
+
+    async def fetch(self, query: str, *args) -> List[Dict[str, Any]]:
+        rows = await self._run(lambda conn: conn.fetch(query, *args))
+        return [record_to_dict(row) for row in rows]
+
+    async def fetchrow(self, query: str, *args) -> Optional[Dict[str, Any]]:
+        row = await self._run(lambda conn: conn.fetchrow(query, *args))
+        return record_to_dict(row) if row is not None else None
+
+    async def copy_upsert(
+        self,
+        table: str,
+        columns: Sequence[str],
+        records: Sequence[tuple],
+        conflict_column: str,
+        returning: str,
+    ) -> List[Any]:
+        """Bulk insert ``records`` with COPY, skipping rows that conflict on ``conflict_column``.
+
+        COPY can't skip conflicting rows, so the records are copied into a
+        temporary table and moved over with ``INSERT ... SELECT ... ON
+        CONFLICT DO NOTHING``, in one transaction. Values must already have
+        the column types (datetimes for timestamps, dicts for jsonb).
+        Returns the ``returning`` column of the rows actually inserted.
+        """
+        staging = f'bulk_{table}'
+        column_list = ', '.join(f'"{column}"' for column in columns)
+
+        async def work(conn):
+            async with conn.transaction():
+                await conn.execute(
+                    f'CREATE TEMPORARY TABLE "{staging}" (LIKE "{table}" INCLUDING DEFAULTS) ON COMMIT DROP'
+                )
+                await conn.copy_records_to_table(staging, records=records, columns=list(columns))
+                return await conn.fetch(
+                    f'INSERT INTO "{table}" ({column_list}) SELECT {column_list} FROM "{staging}" '
+                    f'ON CONFLICT ("{conflict_column}") DO NOTHING RETURNING "{returning}"'
+                )
+
+        rows = await self._run(work)
+        return [row[0] for row in rows]
+
+    async def health(self) -> Dict[str, Any]:
+        if self.pool is None:
+            return {"enabled": bool(self.dsn), "healthy": False}
+        try:
+            async with self.pool.acquire(timeout=self.acquire_timeout) as conn:
+                await conn.fetchval('SELECT 1')
+            healthy = True
+        except Exception:
+            healthy = False
+        return {
+            "enabled": True,
+            "healthy": healthy,
+            "size": self.pool.get_size(),
+            "idle": self.pool.get_idle_size(),
+            "maxSize": self.max_size,
+        }
@@ -0,0 +1,38 @@
+import time
+from collections import OrderedDict
+
+
+class DedupeCache:
+    """In-process LRU set of recently seen idempotency keys with a TTL.
+
+    ``add()`` is O(1): it returns False when the key was already seen within
+    ``ttl`` seconds, otherwise records it and returns True. The oldest keys
+    are evicted once ``max_size`` is reached. The cache only short-circuits
+    the common retry case; the unique constraint in the database remains the
+    source of truth.
+    """
+
+    def __init__(self, max_size: int = 100000, ttl: float = 86400.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, key: str) -> bool:
+        now = time.monotonic()
+        expires_at = self._entries.get(key)
+        if expires_at is not None and expires_at > now:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return False
+        self._entries[key] = now + self.ttl
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        return True
+
+    def discard(self, key: str):
+        self._entries.pop(key, None)
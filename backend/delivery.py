@@ -0,0 +1,311 @@
+import asyncio
+import logging
+import random
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from ingestion import QueueFull
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying; any other non-2xx response is final
+RETRYABLE_STATUS = {408, 425, 429, 500, 502, 503, 504}
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat() if timestamp is not None else None
+
+
+class CircuitBreaker:
+    """Per-target breaker: stop calling a target that keeps failing.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    deliveries to that target wait instead of being attempted. Once
+    ``reset_timeout`` seconds have passed a single trial delivery is let
+    through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def retry_in(self) -> float:
+        """Seconds until a delivery may be attempted, 0 if it may go now."""
+        state = self.state
+        if state == 'closed':
+            return 0.0
+        if state == 'half_open' and not self._trial_running:
+            self._trial_running = True
+            return 0.0
+        if state == 'half_open':
+            # Check back soon: the trial delivery decides what happens next
+            return min(self.reset_timeout, 1.0)
+        return self.opened_at + self.reset_timeout - time.monotonic()
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._trial_running or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._trial_running = False
+
+
+class DeliveryQueue:
+    """Background delivery of proxied webhooks with retries.
+
+    ``submit()`` records a delivery and returns it straight away; a pool of
+    ``workers`` tasks sends it with ``proxy.deliver()``. Failed attempts
+    (network errors, timeouts, 5xx/429) are retried with exponential backoff
+    and full jitter, up to ``max_attempts``. Each target has a
+    CircuitBreaker, so a target that is down is not hammered: its deliveries
+    wait for the breaker instead of using up attempts. Deliveries that run
+    out of attempts, get a non-retryable response, or are still pending at
+    shutdown are handed to ``dead_letter`` to be stored.
+
+    The most recent ``history`` deliveries are kept in memory for
+    ``get()``.
+    """
+
+    def __init__(
+        self,
+        proxy,
+        dead_letter: Callable[[Dict[str, Any]], Awaitable[None]],
+        workers: int = 4,
+        max_attempts: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 300.0,
+        max_pending: int = 10000,
+        breaker_threshold: int = 5,
+        breaker_reset: float = 30.0,
+        history: int = 10000,
+        drain_timeout: float = 10.0,
+    ):
+        self.proxy = proxy
+        self.dead_letter = dead_letter
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        self.history = history
+        self.drain_timeout = drain_timeout
+
+        self._ready: asyncio.Queue = asyncio.Queue()
+        self._scheduled: Dict[str, asyncio.TimerHandle] = {}
+        self._in_flight: Dict[str, Dict[str, Any]] = {}
+        self._deliveries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._tasks: List[asyncio.Task] = []
+        self._closed = False
+        self.pending = 0
+        self.delivered = 0
+        self.retried = 0
+        self.dead = 0
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _check_room(self, count: int):
+        if self._closed:
+            raise QueueFull("Delivery queue is shutting down")
+        if self.pending + count > self.max_pending:
+            raise QueueFull("Delivery queue is full")
+
+    def submit(self, target_url: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        self._check_room(1)
+        now = time.time()
+        delivery = {
+            "id": str(uuid.uuid4()),
+            "target_url": target_url,
+            "payload": payload,
+            "timeout": timeout,
+            "status": "pending",
+            "attempts": 0,
+            "last_status_code": None,
+            "last_error": None,
+            "next_attempt_at": now,
+            "created_at": now,
+            "updated_at": now,
+        }
+        self._remember(delivery)
+        self.pending += 1
+        self._ready.put_nowait(delivery)
+        return delivery
+
+    def submit_all(
+        self, targets: Sequence[Tuple[str, Optional[float]]], payload: Dict[str, Any]
+    ) -> List[Dict[str, Any]]:
+        """Submit ``payload`` to every (url, timeout) target, or to none when they don't all fit.
+
+        A fan-out rejected halfway would be delivered twice to the first
+        targets when the caller retries it.
+        """
+        self._check_room(len(targets))
+        return [self.submit(url, payload, timeout) for url, timeout in targets]
+
+    def get(self, delivery_id: str) -> Optional[Dict[str, Any]]:
+        return self._deliveries.get(delivery_id)
+
+    def describe(self, delivery: Dict[str, Any]) -> Dict[str, Any]:
+        """Public view of a delivery, without its payload."""
+        return {
+            "id": delivery['id'],
+            "targetUrl": delivery['target_url'],
+            "status": delivery['status'],
+            "attempts": delivery['attempts'],
+            "lastStatusCode": delivery['last_status_code'],
+            "lastError": delivery['last_error'],
+            "nextAttemptAt": _iso(delivery['next_attempt_at']),
+            "createdAt": _iso(delivery['created_at']),
+            "updatedAt": _iso(delivery['updated_at']),
+        }
+
+    def _remember(self, delivery: Dict[str, Any]):
+        self._deliveries[delivery['id']] = delivery
+        # Drop the oldest finished deliveries; pending ones are never dropped
+        for _ in range(len(self._deliveries)):
+            if len(self._deliveries) <= self.history:
+                break
+            oldest_id, oldest = next(iter(self._deliveries.items()))
+            if oldest['status'] in ('delivered', 'dead'):
+                del self._deliveries[oldest_id]
+            else:
+                self._deliveries.move_to_end(oldest_id)
+
+    def _breaker(self, target_url: str) -> CircuitBreaker:
+        breaker = self._breakers.get(target_url)
+        if breaker is None:
+            breaker = self._breakers[target_url] = CircuitBreaker(self.breaker_threshold, self.breaker_reset)
+        return breaker
+
+    def backoff(self, attempts: int) -> float:
+        # Full jitter: spreads retries from many deliveries over the window
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+
+    def _schedule(self, delivery: Dict[str, Any], delay: float, status: str):
+        delivery.update({"status": status, "next_attempt_at": time.time() + delay, "updated_at": time.time()})
+        loop = asyncio.get_running_loop()
+        self._scheduled[delivery['id']] = loop.call_later(delay, self._requeue, delivery)
+
+    def _requeue(self, delivery: Dict[str, Any]):
+        self._scheduled.pop(delivery['id'], None)
+        self._ready.put_nowait(delivery)
+
+    async def _worker(self):
+        while True:
+            delivery = await self._ready.get()
+            self._in_flight[delivery['id']] = delivery
+            try:
+                await self._attempt(delivery)
+            except Exception as e:
+                logger.error(f"Delivery {delivery['id']} to {delivery['target_url']} crashed: {e}")
+                await self._finish(delivery, 'dead')
+            finally:
+                self._in_flight.pop(delivery['id'], None)
+                self._ready.task_done()
+
+    async def _attempt(self, delivery: Dict[str, Any]):
+        breaker = self._breaker(delivery['target_url'])
+        wait = breaker.retry_in()
+        if wait > 0:
+            self._schedule(delivery, wait, 'waiting_circuit')
+            return
+
+        delivery.update({"status": "delivering", "updated_at": time.time()})
+        delivery['attempts'] += 1
+        result = await self.proxy.deliver(delivery['target_url'], delivery['payload'], delivery['timeout'])
+        status_code = result.get('status_code')
+        error = result.get('error')
+        if error is None and not result['success']:
+            error = f"Target responded {status_code}"
+        delivery.update({"last_status_code": status_code, "last_error": error})
+
+        if result['success']:
+            breaker.record_success()
+            await self._finish(delivery, 'delivered')
+            return
+        if status_code is not None and status_code not in RETRYABLE_STATUS:
+            # The target answered and rejected the payload; retrying won't help
+            breaker.record_success()
+            await self._finish(delivery, 'dead')
+            return
+
+        breaker.record_failure()
+        if delivery['attempts'] >= self.max_attempts:
+            await self._finish(delivery, 'dead')
+            return
+        self.retried += 1
+        self._schedule(delivery, self.backoff(delivery['attempts']), 'retrying')
+
+    async def _finish(self, delivery: Dict[str, Any], status: str):
+        delivery.update({"status": status, "next_attempt_at": None, "updated_at": time.time()})
+        self.pending = max(self.pending - 1, 0)
+        if status == 'delivered':
+            self.delivered += 1
+            return
+        self.dead += 1
+        try:
+            await self.dead_letter(delivery)
+        except Exception as e:
+            logger.error(f"Could not store dead letter {delivery['id']} for {delivery['target_url']}: {e}")
+
+    async def stop(self):
+        """Stop accepting deliveries, let due ones run, dead-letter the rest."""
+        self._closed = True
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Delivery queue drain timed out with {self._ready.qsize()} deliveries due")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+        # Attempts cut short by the cancellation above are not known to have arrived
+        leftovers = list(self._in_flight.values())
+        self._in_flight = {}
+        while not self._ready.empty():
+            leftovers.append(self._ready.get_nowait())
+        for delivery_id, handle in list(self._scheduled.items()):
+            handle.cancel()
+            leftovers.append(self._deliveries[delivery_id])
+        self._scheduled = {}
+        for delivery in leftovers:
+            if delivery['status'] in ('delivered', 'dead'):
+                continue
+            delivery['last_error'] = delivery['last_error'] or 'Not delivered before shutdown'
+            await self._finish(delivery, 'dead')
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pending": self.pending,
+            "due": self._ready.qsize(),
+            "scheduled": len(self._scheduled),
+            "delivered": self.delivered,
+            "retried": self.retried,
+            "dead": self.dead,
+            "openCircuits": sorted(url for url, breaker in self._breakers.items() if breaker.state != 'closed'),
+        }
@@ -0,0 +1,126 @@
+import csv
+from datetime import datetime
+from io import StringIO
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import uuid
+
+Row = Dict[str, Any]
+
+# Keyset order shared by every export: newest first, id breaks ties.
+# created_at is nullable and NULLs sort first under DESC.
+KEYSET_ORDER = 'created_at DESC, id DESC'
+
+# (created_at, id) of the last row seen; created_at is None for rows without one
+Cursor = Tuple[Optional[str], str]
+
+
+def keyset_filter(cursor: Cursor) -> str:
+    """PostgREST ``or`` filter for rows strictly after ``cursor`` in KEYSET_ORDER."""
+    created_at, row_id = cursor
+    if created_at is None:
+        return f'created_at.not.is.null,id.lt.{row_id}'
+    return f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{row_id})'
+
+
+# (column, operator, value) with operator one of FILTER_OPERATORS
+Filter = Tuple[str, str, Any]
+
+FILTER_OPERATORS = {'eq': '=', 'gte': '>=', 'lt': '<', 'ilike': 'ILIKE'}
+
+
+def like_prefix(prefix: str) -> str:
+    """LIKE pattern matching values that start with ``prefix`` literally."""
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+async def fetch_page(
+    db,
+    pg,
+    table: str,
+    page_size: int,
+    cursor: Optional[Cursor] = None,
+    columns: str = '*',
+    filters: Sequence[Filter] = (),
+) -> List[Row]:
+    """One page of ``table`` in KEYSET_ORDER, starting strictly after ``cursor``.
+
+    Column names in ``columns`` and ``filters`` are interpolated into the
+    query, so they must come from a fixed list, never from the request.
+    """
+    if pg.available:
+        conditions = []
+        args: List[Any] = []
+        for column, op, value in filters:
+            args.append(value)
+            conditions.append(f'{column} {FILTER_OPERATORS[op]} ${len(args)}')
+        if cursor is not None and cursor[0] is None:
+            args.append(uuid.UUID(cursor[1]))
+            conditions.append(f'(created_at IS NOT NULL OR id < ${len(args)})')
+        elif cursor is not None:
+            args.extend([datetime.fromisoformat(cursor[0]), uuid.UUID(cursor[1])])
+            conditions.append(f'(created_at, id) < (${len(args) - 1}, ${len(args)})')
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ''
+        args.append(page_size)
+        return await pg.fetch(
+            f'SELECT {columns} FROM {table} {where}ORDER BY {KEYSET_ORDER} LIMIT ${len(args)}', *args
+        )
+
+    query = (
+        db.table(table).select(columns)
+        .order('created_at', desc=True)
+        .order('id', desc=True)
+        .limit(page_size)
+    )
+    for column, op, value in filters:
+        if isinstance(value, datetime):
+            value = value.isoformat()
+        query = getattr(query, op)(column, value)
+    if cursor is not None:
+        query = query.or_(keyset_filter(cursor))
+    return (await db.execute(query)).data
+
+
+def next_cursor(rows: List[Row]) -> Optional[Cursor]:
+    if not rows:
+        return None
+    last = rows[-1]
+    return (last['created_at'], last['id'])
+
+
+async def iter_pages(
+    db, pg, table: str, page_size: int = 1000, columns: str = '*', filters: Sequence[Filter] = ()
+) -> AsyncIterator[List[Row]]:
+    """Yield every row of ``table`` in pages, keyset-paginated on (created_at, id).
+
+    Each page is a single indexed range query, so memory stays at one page
+    and no page is truncated by PostgREST's max-rows cap. Iteration stops
+    at the first empty page rather than trusting the page size.
+    """
+    cursor: Optional[Cursor] = None
+    while True:
+        rows = await fetch_page(db, pg, table, page_size, cursor, columns, filters)
+        if not rows:
+            return
+        yield rows
+        cursor = next_cursor(rows)
+
+
+async def stream_csv(
+    pages: AsyncIterator[List[Row]],
+    headers: Iterable[str],
+    format_rows: Callable[[List[Row]], Iterable[Sequence[Any]]],
+) -> AsyncIterator[bytes]:
+    """Encode pages of rows as CSV, yielding one chunk per page.
+
+    ``format_rows`` turns a whole page into CSV records in one call.
+    """
+    buffer = StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(headers)
+    yield buffer.getvalue().encode('utf-8')
+    async for page in pages:
+        buffer.seek(0)
+        buffer.truncate(0)
+        writer.writerows(format_rows(page))
+        yield buffer.getvalue().encode('utf-8')
@@ -0,0 +1,137 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+Row = Dict[str, Any]
+
+# Compiled formatters kept per RowFormat (one per projection and shape)
+MAX_COMPILED = 64
+
+
+class Column:
+    """Output field taken from a table column.
+
+    ``source`` is a column name, or a tuple of names meaning "the first one
+    present in the row". ``default`` is used when the column is missing from
+    the row; a callable default is evaluated once per batch. ``convert`` is
+    applied to the value.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        source: Union[str, Tuple[str, ...]],
+        default: Any = None,
+        convert: Optional[Callable[[Any], Any]] = None,
+    ):
+        self.name = name
+        self.sources = (source,) if isinstance(source, str) else tuple(source)
+        self.default = default
+        self.convert = convert
+
+    @property
+    def columns(self) -> Tuple[str, ...]:
+        return self.sources
+
+
+class Answer:
+    """Output field taken from ``quiz_answers[question]``."""
+
+    def __init__(self, name: str, question: str, default: Any = None):
+        self.name = name
+        self.question = question
+        self.default = default
+
+    columns = ('quiz_answers',)
+
+
+class Constant:
+    def __init__(self, name: str, value: Any):
+        self.name = name
+        self.value = value
+
+    columns = ()
+
+
+Field = Union[Column, Answer, Constant]
+
+
+class RowFormat:
+    """Declarative mapping from table rows to API objects or CSV records.
+
+    The field list is compiled once into a plain Python loop with every
+    column lookup, default and quiz answer inlined, and that function
+    formats a whole page per call. ``quiz_answers`` is type-checked once per
+    row however many answers are read from it, and callable defaults (such
+    as "now") are evaluated once per page rather than once per row.
+    """
+
+    def __init__(self, fields: Sequence[Field]):
+        self.fields = list(fields)
+        self.by_name = {field.name: field for field in self.fields}
+        if len(self.by_name) != len(self.fields):
+            raise ValueError("Duplicate field names")
+        self._compiled: Dict[Tuple[str, Tuple[str, ...]], Callable[[List[Row]], list]] = {}
+
+    @property
+    def names(self) -> List[str]:
+        return [field.name for field in self.fields]
+
+    def columns(self, names: Optional[Sequence[str]] = None) -> List[str]:
+        """Table columns needed to build ``names`` (all fields by default)."""
+        columns: List[str] = []
+        for name in names or self.names:
+            for column in self.by_name[name].columns:
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    def to_dicts(self, rows: List[Row], names: Optional[Sequence[str]] = None) -> List[Dict[str, Any]]:
+        return self._formatter('dict', names)(rows)
+
+    def to_tuples(self, rows: List[Row], names: Optional[Sequence[str]] = None) -> List[tuple]:
+        return self._formatter('tuple', names)(rows)
+
+    def _formatter(self, shape: str, names: Optional[Sequence[str]]):
+        key = (shape, tuple(names or self.names))
+        formatter = self._compiled.get(key)
+        if formatter is None:
+            if len(self._compiled) >= MAX_COMPILED:
+                self._compiled.clear()
+            formatter = self._compiled[key] = self._compile(shape, [self.by_name[name] for name in key[1]])
+        return formatter
+
+    @staticmethod
+    def _compile(shape: str, fields: List[Field]):
+        namespace: Dict[str, Any] = {}
+        setup: List[str] = []
+        items: List[str] = []
+        for i, field in enumerate(fields):
+            if isinstance(field, Constant):
+                namespace[f'v{i}'] = field.value
+                expr = f'v{i}'
+            elif isinstance(field, Answer):
+                namespace[f'd{i}'] = field.default
+                expr = f'(answers.get({field.question!r}, d{i}) if answers.__class__ is dict else d{i})'
+            else:
+                if callable(field.default):
+                    namespace[f'make_d{i}'] = field.default
+                    setup.append(f'    d{i} = make_d{i}()')
+                else:
+                    namespace[f'd{i}'] = field.default
+                expr = f'd{i}'
+                for source in reversed(field.sources):
+                    expr = f'row.get({source!r}, {expr})'
+                if field.convert is not None:
+                    namespace[f'convert{i}'] = field.convert
+                    expr = f'convert{i}({expr})'
+            items.append(f'{field.name!r}: {expr}' if shape == 'dict' else expr)
+
+        if shape == 'dict':
+            record = '{' + ', '.join(items) + '}'
+        else:
+            record = '(' + ', '.join(items) + (',)' if len(items) == 1 else ')')
+        lines = ['def format_rows(rows):', *setup, '    out = []', '    append = out.append', '    for row in rows:']
+        if any(isinstance(field, Answer) for field in fields):
+            lines.append("        answers = row.get('quiz_answers')")
+        lines += [f'        append({record})', '    return out']
+        exec('\n'.join(lines), namespace)
+        return namespace['format_rows']
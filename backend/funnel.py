@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+# Funnel stages in order, as stored in the funnel_rollups table
+FUNNEL_STAGES = ('visitors', 'quiz_started', 'quiz_completed', 'leads', 'purchases')
+
+GRANULARITIES = {
+    'hour': timedelta(hours=1),
+    'day': timedelta(days=1),
+}
+
+# Range used when only one bound (or only the granularity) is given
+DEFAULT_SPAN = {
+    'hour': timedelta(days=2),
+    'day': timedelta(days=90),
+}
+
+# Keeps range queries within one PostgREST page
+MAX_RANGE_BUCKETS = 1000
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def truncate(value: datetime, granularity: str) -> datetime:
+    value = value.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        value = value.replace(hour=0)
+    return value
+
+
+def resolve_range(granularity: str, start: Optional[datetime], end: Optional[datetime]):
+    """Fill in missing bounds and reject ranges with too many buckets.
+
+    ``start`` is rounded down to its bucket so the bucket containing it is
+    included; ``end`` is exclusive.
+    """
+    end = as_utc(end) or datetime.now(timezone.utc)
+    start = truncate(as_utc(start) or end - DEFAULT_SPAN[granularity], granularity)
+    if start >= end:
+        raise ValueError("'from' must be before 'to'")
+    if (end - start) / GRANULARITIES[granularity] > MAX_RANGE_BUCKETS:
+        raise ValueError(f"Range too large for granularity '{granularity}' (max {MAX_RANGE_BUCKETS} buckets)")
+    return start, end
+
+
+async def funnel_totals(db, pg) -> Dict[str, int]:
+    """All-time funnel totals, summed from the daily buckets."""
+    if pg.available:
+        row = await pg.fetchrow("SELECT * FROM funnel_rollup_totals('day')")
+    else:
+        result = await db.execute(db.rpc('funnel_rollup_totals', {'p_granularity': 'day'}))
+        row = result.data[0] if result.data else None
+    return {stage: int(row[stage]) if row else 0 for stage in FUNNEL_STAGES}
+
+
+async def funnel_series(db, pg, granularity: str, start: datetime, end: datetime) -> List[Dict[str, Any]]:
+    """Buckets of the given granularity with ``start <= bucket_start < end``."""
+    columns = 'bucket_start, ' + ', '.join(FUNNEL_STAGES)
+    if pg.available:
+        return await pg.fetch(
+            f'SELECT {columns} FROM funnel_rollups '
+            'WHERE granularity = $1 AND bucket_start >= $2 AND bucket_start < $3 '
+            'ORDER BY bucket_start',
+            granularity, start, end,
+        )
+    result = await db.execute(
+        db.table('funnel_rollups')
+        .select(columns.replace(' ', ''))
+        .eq('granularity', granularity)
+        .gte('bucket_start', start.isoformat())
+        .lt('bucket_start', end.isoformat())
+        .order('bucket_start')
+    )
+    return result.data
+
+
+def sum_buckets(buckets: List[Dict[str, Any]]) -> Dict[str, int]:
+    return {stage: sum(int(bucket[stage]) for bucket in buckets) for stage in FUNNEL_STAGES}
+
+
+def format_metrics(totals: Dict[str, int]) -> Dict[str, Any]:
+    """Shape funnel totals the way the admin panel expects them."""
+    leads = totals['leads']
+    purchases = totals['purchases']
+    return {
+        "totalVisitors": totals['visitors'],
+        "leadsGenerated": leads,
+        "purchases": purchases,
+        "conversionRate": round(purchases / leads * 100, 1) if leads > 0 else 0,
+        "quizStarts": totals['quiz_started'],
+        "quizCompletions": totals['quiz_completed'],
+        # The diagnosis is shown right after the lead form, and the lead
+        # webhook is the InitiateCheckout event
+        "diagnosisViewed": leads,
+        "checkoutClicks": leads,
+    }
+
+
+def format_bucket(bucket: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "bucketStart": bucket['bucket_start'],
+        "visitors": int(bucket['visitors']),
+        "quizStarts": int(bucket['quiz_started']),
+        "quizCompletions": int(bucket['quiz_completed']),
+        "leads": int(bucket['leads']),
+        "purchases": int(bucket['purchases']),
+    }
@@ -0,0 +1,38 @@
+"""Gunicorn settings for running the API with several worker processes.
+
+    cd backend
+    gunicorn -c gunicorn.conf.py server:app
+
+Each worker is a uvicorn event loop that runs the app's lifespan on its own:
+database pools, background writers and the log writer thread all belong to
+one process. Singleton jobs run only on the elected leader (see
+coordination.Leadership) and cache invalidations are shared through
+Postgres LISTEN/NOTIFY.
+"""
+import multiprocessing
+import os
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '8001')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', str(multiprocessing.cpu_count())))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# Importing once in the master shares the code pages between workers and
+# speeds up restarts; off by default so a worker crash on import is not fatal
+# to the master. Everything created at import time is fork-safe either way.
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() == 'true'
+
+# Shutdown waits for the ingestion queue, spool and proxy deliveries to drain
+# (WEBHOOK_DRAIN_TIMEOUT defaults to 30 s), so give workers longer than that
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', '45'))
+timeout = int(os.environ.get('WORKER_TIMEOUT', '60'))
+keepalive = int(os.environ.get('KEEPALIVE', '5'))
+
+# Restart workers now and then so slow leaks can't build up; the jitter keeps
+# them from all restarting at once
+max_requests = int(os.environ.get('MAX_REQUESTS', '0'))
+max_requests_jitter = max_requests // 10
+
+accesslog = None
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+
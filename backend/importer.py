@@ -0,0 +1,350 @@
+"""Import historical leads or purchases from CSV or NDJSON files.
+
+    cd backend
+    python importer.py leads old-funnel.csv
+    python importer.py purchases hotmart.ndjson.gz --jobs 8 --chunk-size 5000
+
+Each record has the fields of the lead-capture or purchase webhook payload
+(``name``, ``email``, ``utmSource``, ``transactionId``...) and goes through
+the same model and row mapping as the webhook, plus an optional
+``timestamp`` (ISO 8601) that becomes the row's ``timestamp`` and
+``created_at`` so the rollups count it on its original date. CSV cells that
+are empty are left out, and ``quizAnswers`` is a JSON object in a CSV cell.
+
+The file is read as a stream and loaded in chunks of ``--chunk-size``
+records with COPY (see PgPool.copy_upsert), ``--jobs`` chunks at a time.
+Purchases are idempotent on ``transactionId``; leads get an idempotency key
+derived from ``--source`` and the record number, so importing the same file
+twice inserts nothing new. Progress goes to a checkpoint file after every
+chunk that completes the file up to that point; after a failure or ^C, the
+same command resumes from there. No Conversions API events are sent.
+"""
+import asyncio
+import csv
+import gzip
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from enum import Enum
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import typer
+from dotenv import load_dotenv
+from pydantic import ValidationError
+
+import bulk
+from database import PgPool
+from webhooks import LeadCaptureWebhook, PurchaseWebhook, build_lead_row, build_purchase_row
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+# Unique columns that make the inserts idempotent, as in server.CONFLICT_KEYS
+CONFLICT_KEYS = {
+    'lead_webhooks': 'idempotency_key',
+    'purchase_webhooks': 'transaction_id',
+}
+
+# Channel and name of the metric totals cache in server.py (coordination.Invalidations)
+INVALIDATION_CHANNEL = 'cache_invalidation'
+
+
+class Kind(str, Enum):
+    leads = 'leads'
+    purchases = 'purchases'
+
+
+class Format(str, Enum):
+    csv = 'csv'
+    ndjson = 'ndjson'
+
+
+class InvalidRecord(Exception):
+    def __init__(self, errors: List[Dict[str, Any]]):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def detect_format(path: Path) -> Format:
+    suffixes = [suffix.lower() for suffix in path.suffixes if suffix.lower() != '.gz']
+    if suffixes and suffixes[-1] == '.csv':
+        return Format.csv
+    if suffixes and suffixes[-1] in ('.ndjson', '.jsonl', '.json'):
+        return Format.ndjson
+    raise typer.BadParameter(f"Can't tell the format of {path.name}; pass --format", param_hint='--format')
+
+
+def read_records(raw, path: Path, fmt: Format) -> Iterator[Any]:
+    """Records of the file, one at a time; ``raw`` is the open binary file (gzip is decompressed here)."""
+    stream = gzip.GzipFile(fileobj=raw) if path.suffix.lower() == '.gz' else raw
+    if fmt is Format.csv:
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+        for record in csv.DictReader(text):
+            yield {key: value for key, value in record.items() if key and value not in ('', None)}
+    else:
+        for line in stream:
+            if line.strip():
+                try:
+                    yield bulk.loads(line)
+                except (bulk.JSONDecodeError, ValueError) as e:
+                    yield InvalidRecord([{"loc": "", "msg": f"Invalid JSON: {e}"}])
+
+
+def parse_timestamp(value: Any) -> datetime:
+    try:
+        parsed = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise InvalidRecord([{"loc": "timestamp", "msg": "Expected an ISO 8601 date and time"}])
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def build_row(kind: Kind, record: Any, number: int, source: str) -> Dict[str, Any]:
+    """The table row for one record, mapped like the webhooks do; raises InvalidRecord."""
+    if isinstance(record, InvalidRecord):
+        raise record
+    if not isinstance(record, dict):
+        raise InvalidRecord([{"loc": "", "msg": "Expected an object"}])
+    try:
+        if kind is Kind.leads:
+            if isinstance(record.get('quizAnswers'), str):
+                record['quizAnswers'] = json.loads(record['quizAnswers'])
+            key = hashlib.sha256(f"import|{source}|{number}".encode()).hexdigest()
+            row = build_lead_row(LeadCaptureWebhook.model_validate(record), key)
+        else:
+            row = build_purchase_row(PurchaseWebhook.model_validate(record))
+    except ValidationError as e:
+        raise InvalidRecord(bulk.error_details(e))
+    except ValueError as e:
+        raise InvalidRecord([{"loc": "quizAnswers", "msg": f"Invalid JSON: {e}"}])
+    if record.get('timestamp'):
+        row['timestamp'] = parse_timestamp(record['timestamp'])
+    row['created_at'] = row['timestamp']
+    return row
+
+
+class Checkpoint:
+    """How many records of a file are imported, kept in a small JSON file.
+
+    Chunks finish out of order when several load at once; ``records`` only
+    moves past a chunk once every chunk before it is done, so resuming never
+    skips a record (chunks done beyond it are loaded again, as duplicates).
+    """
+
+    def __init__(self, path: Optional[Path], kind: Kind, source: str):
+        self.path = path
+        self.state = {"kind": kind.value, "source": source, "records": 0, "inserted": 0, "duplicates": 0, "invalid": 0}
+        self._done: Dict[int, Dict[str, int]] = {}
+        self._next = 0
+
+    def load(self) -> bool:
+        try:
+            state = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return False
+        if (state.get('kind'), state.get('source')) != (self.state['kind'], self.state['source']):
+            raise typer.BadParameter(
+                f"{self.path} belongs to an import of {state.get('kind')} from {state.get('source')}; "
+                f"pass --restart to start over", param_hint='--checkpoint',
+            )
+        self.state.update(state)
+        return True
+
+    def complete(self, sequence: int, end: int, counts: Dict[str, int]):
+        self._done[sequence] = {"records": end, **counts}
+        advanced = False
+        while self._next in self._done:
+            done = self._done.pop(self._next)
+            self.state['records'] = done.pop('records')
+            for name, value in done.items():
+                self.state[name] += value
+            self._next += 1
+            advanced = True
+        if advanced and self.path is not None:
+            temporary = self.path.with_name(self.path.name + '.tmp')
+            temporary.write_text(json.dumps(self.state))
+            os.replace(temporary, self.path)
+
+    def remove(self):
+        if self.path is not None:
+            self.path.unlink(missing_ok=True)
+
+
+class Progress:
+    def __init__(self, total_bytes: int, interval: float, skipped: int):
+        self.total_bytes = total_bytes
+        self.skipped = skipped
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last = self.started
+        self._tty = sys.stderr.isatty()
+
+    def show(self, records: int, position: int, counts: Dict[str, int], final: bool = False):
+        now = time.monotonic()
+        if not final and now - self._last < self.interval:
+            return
+        self._last = now
+        elapsed = max(now - self.started, 1e-9)
+        percent = f"{100 * position / self.total_bytes:5.1f}%  " if self.total_bytes else ""
+        line = (f"{percent}{records:,} records  {(records - self.skipped) / elapsed:,.0f}/s  "
+                f"inserted {counts['inserted']:,}  duplicates {counts['duplicates']:,}  invalid {counts['invalid']:,}")
+        if self._tty:
+            typer.echo(f"\r{line}\033[K", err=True, nl=final)
+        else:
+            typer.echo(line, err=True)
+
+
+async def load_chunk(pg: PgPool, table: str, rows: List[Dict[str, Any]], retries: int) -> int:
+    """COPY one chunk; returns how many rows were new. Retries cover deadlocks between chunks."""
+    columns = list(rows[0])
+    records = bulk.copy_records(rows, columns)
+    for attempt in range(retries + 1):
+        try:
+            return len(await pg.copy_upsert(table, columns, records, CONFLICT_KEYS[table], 'session_id'))
+        except Exception as e:
+            if attempt == retries:
+                raise
+            delay = 2 ** attempt
+            typer.echo(f"\nChunk of {len(rows)} rows failed ({e}), retrying in {delay}s", err=True)
+            await asyncio.sleep(delay)
+
+
+async def run_import(
+    kind: Kind, path: Path, fmt: Format, dsn: Optional[str], source: str, checkpoint: Checkpoint,
+    chunk_size: int, jobs: int, retries: int, rejects: Optional[Path], progress_interval: float,
+):
+    table = 'lead_webhooks' if kind is Kind.leads else 'purchase_webhooks'
+    skip = checkpoint.state['records']
+    counts = {name: checkpoint.state[name] for name in ('inserted', 'duplicates', 'invalid')}
+    pg = PgPool(dsn, min_size=1, max_size=jobs, statement_cache_size=0, command_timeout=600) if dsn else None
+    if pg is not None:
+        await pg.open()
+    queue: asyncio.Queue = asyncio.Queue(maxsize=jobs * 2)
+    progress = Progress(path.stat().st_size, progress_interval, skip)
+    reject_file = rejects.open('a') if rejects else None
+
+    async def worker():
+        while True:
+            sequence, end, rows, invalid = await queue.get()
+            try:
+                inserted = await load_chunk(pg, table, rows, retries) if rows and pg is not None else 0
+                duplicates = len(rows) - inserted if pg is not None else 0
+                counts['inserted'] += inserted
+                counts['duplicates'] += duplicates
+                checkpoint.complete(sequence, end, {"inserted": inserted, "duplicates": duplicates, "invalid": invalid})
+            finally:
+                queue.task_done()
+
+    async def put(chunk: Tuple[int, int, List[Dict[str, Any]], int]):
+        # Surface a worker failure instead of waiting on a queue nobody drains
+        put_task = asyncio.ensure_future(queue.put(chunk))
+        done, _ = await asyncio.wait([put_task, *workers], return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            if task is not put_task:
+                put_task.cancel()
+                task.result()
+
+    workers = [asyncio.create_task(worker()) for _ in range(jobs)]
+    try:
+        with path.open('rb') as raw:
+            number = 0
+            sequence = 0
+            rows: List[Dict[str, Any]] = []
+            invalid = 0
+            for record in read_records(raw, path, fmt):
+                number += 1
+                if number <= skip:
+                    continue
+                try:
+                    rows.append(build_row(kind, record, number, source))
+                except InvalidRecord as e:
+                    invalid += 1
+                    counts['invalid'] += 1
+                    if reject_file is not None:
+                        reject_file.write(json.dumps({"record": number, "errors": e.errors}) + '\n')
+                if number - skip - sequence * chunk_size == chunk_size:
+                    await put((sequence, number, rows, invalid))
+                    sequence += 1
+                    rows, invalid = [], 0
+                progress.show(number, raw.tell(), counts)
+            if number > skip + sequence * chunk_size:
+                await put((sequence, number, rows, invalid))
+            await asyncio.wait([asyncio.ensure_future(queue.join()), *workers], return_when=asyncio.FIRST_COMPLETED)
+            for task in workers:
+                if task.done():
+                    task.result()
+            progress.show(number, progress.total_bytes, counts, final=True)
+        if pg is not None:
+            # Let running servers drop their cached totals (see coordination.Invalidations)
+            await pg.fetch('SELECT pg_notify($1, $2)', INVALIDATION_CHANNEL, 'metric_totals')
+        return number, counts
+    finally:
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if reject_file is not None:
+            reject_file.close()
+        if pg is not None:
+            await pg.close()
+
+
+app = typer.Typer(add_completion=False, help=__doc__.split('\n\n')[0])
+
+
+@app.command()
+def main(
+    kind: Kind = typer.Argument(..., help="What the file holds"),
+    path: Path = typer.Argument(..., exists=True, dir_okay=False, help=".csv or .ndjson/.jsonl, optionally .gz"),
+    fmt: Optional[Format] = typer.Option(None, '--format', help="Default: from the file extension"),
+    dsn: Optional[str] = typer.Option(None, envvar='SUPABASE_DB_URL', help="Postgres to load into"),
+    source: Optional[str] = typer.Option(
+        None, help="Names the file in lead idempotency keys and the checkpoint. Default: the file name"
+    ),
+    chunk_size: int = typer.Option(5000, min=1, help="Records per COPY"),
+    jobs: int = typer.Option(4, min=1, help="Chunks loading at the same time"),
+    retries: int = typer.Option(3, min=0, help="Retries per chunk before giving up"),
+    checkpoint_path: Optional[Path] = typer.Option(None, '--checkpoint', help="Default: <file>.checkpoint"),
+    restart: bool = typer.Option(False, help="Ignore the checkpoint and start from the first record"),
+    rejects: Optional[Path] = typer.Option(None, help="Append invalid records' numbers and errors here (NDJSON)"),
+    dry_run: bool = typer.Option(False, help="Only validate; nothing is written to the database"),
+    progress_interval: float = typer.Option(1.0, help="Seconds between progress lines"),
+):
+    """Import historical leads or purchases from a CSV or NDJSON file."""
+    if not dsn and not dry_run:
+        raise typer.BadParameter("Set SUPABASE_DB_URL or pass --dsn", param_hint='--dsn')
+    fmt = fmt or detect_format(path)
+    source = source or path.name
+    checkpoint = Checkpoint(
+        None if dry_run else checkpoint_path or path.with_name(path.name + '.checkpoint'), kind, source
+    )
+    if restart:
+        checkpoint.remove()
+    elif checkpoint.path is not None and checkpoint.load():
+        typer.echo(f"Resuming after record {checkpoint.state['records']:,} ({checkpoint.path})", err=True)
+
+    started = time.monotonic()
+    try:
+        records, counts = asyncio.run(run_import(
+            kind, path, fmt, None if dry_run else dsn, source, checkpoint,
+            chunk_size, jobs, retries, rejects, progress_interval,
+        ))
+    except KeyboardInterrupt:
+        typer.echo(f"\nInterrupted; run the same command to resume from {checkpoint.path}", err=True)
+        raise typer.Exit(130)
+    except Exception as e:
+        typer.echo(f"\nImport failed: {e}\nRun the same command to resume from {checkpoint.path}", err=True)
+        raise typer.Exit(1)
+    if not dry_run:
+        checkpoint.remove()
+    typer.echo(
+        f"{records:,} records in {time.monotonic() - started:.1f}s: {counts['inserted']:,} inserted, "
+        f"{counts['duplicates']:,} duplicates, {counts['invalid']:,} invalid"
+    )
+
+
+if __name__ == '__main__':
+    app()
@@ -0,0 +1,112 @@
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+InsertBatch = Callable[[str, List[Dict[str, Any]]], Awaitable[None]]
+
+
+class QueueFull(Exception):
+    """Raised by BatchWriter.submit() when the ingestion queue is at capacity."""
+
+
+class BatchWriter:
+    """Write-behind queue for webhook rows.
+
+    Webhook handlers ``submit()`` a ready-to-insert row and return right away.
+    A single background task collects rows into batches and hands each table's
+    rows to ``insert_batch`` in one multi-row insert. A batch is flushed when it
+    reaches ``max_batch`` rows or ``max_delay`` seconds after its first row,
+    whichever comes first.
+
+    Failed batches are retried with backoff rather than dropped. ``stop()``
+    refuses new rows and flushes everything already accepted.
+    """
+
+    def __init__(
+        self,
+        insert_batch: InsertBatch,
+        max_batch: int = 500,
+        max_delay: float = 0.2,
+        max_queue: int = 10000,
+        drain_timeout: float = 30.0,
+    ):
+        self.insert_batch = insert_batch
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.drain_timeout = drain_timeout
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self._task = None
+        self._closed = False
+        self.rows_written = 0
+        self.batches_written = 0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, table: str, row: Dict[str, Any]):
+        if self._closed:
+            raise QueueFull("Ingestion queue is shutting down")
+        try:
+            self._queue.put_nowait((table, row))
+        except asyncio.QueueFull:
+            raise QueueFull("Ingestion queue is full")
+
+    async def stop(self):
+        self._closed = True
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=self.drain_timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Ingestion queue drain timed out with {self.depth} rows pending")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _next_batch(self) -> List[Tuple[str, Dict[str, Any]]]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            by_table: Dict[str, List[Dict[str, Any]]] = {}
+            for table, row in batch:
+                by_table.setdefault(table, []).append(row)
+            for table, rows in by_table.items():
+                await self._write(table, rows)
+            for _ in batch:
+                self._queue.task_done()
+
+    async def _write(self, table: str, rows: List[Dict[str, Any]]):
+        delay = 0.5
+        while True:
+            try:
+                await self.insert_batch(table, rows)
+                self.rows_written += len(rows)
+                self.batches_written += 1
+                return
+            except Exception as e:
+                logger.error(f"Batch insert of {len(rows)} rows into {table} failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
@@ -0,0 +1,26 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+async def run_periodically(
+    name: str,
+    interval: float,
+    job: Callable[[], Awaitable[None]],
+    when: Optional[Callable[[], bool]] = None,
+):
+    """Run ``job`` every ``interval`` seconds until cancelled; errors are logged, not raised.
+
+    With ``when``, runs are skipped while it returns False (e.g. on workers
+    that are not the leader).
+    """
+    while True:
+        await asyncio.sleep(interval)
+        if when is not None and not when():
+            continue
+        try:
+            await job()
+        except Exception as e:
+            logger.error(f"Periodic job {name} failed: {e}")
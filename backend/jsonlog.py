@@ -0,0 +1,223 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+# Attributes every LogRecord has; anything else came from ``extra=`` and is
+# written out as a field
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'sampled'}
+
+# Fields that hold personal data, by the names used in payloads and rows
+PII_FIELDS = {
+    'email', 'name', 'whatsapp', 'phone', 'client_ip', 'clientIP', 'user_agent', 'userAgent',
+    'fbclid', '_fbc', '_fbp', 'fbc', 'fbp',
+}
+PHONE_FIELDS = {'whatsapp', 'phone'}
+
+EMAIL_PATTERN = re.compile(r'([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9.-]+\.[A-Za-z]{2,})')
+# International numbers as the frontend sends them (+E164, maybe with separators),
+# and any value labelled as a phone in a repr or message ('whatsapp': '...', phone=...)
+PHONE_PATTERN = re.compile(r'\+\d[\d ().-]{6,}\d')
+LABELLED_PHONE_PATTERN = re.compile(r"""(\b(?:whatsapp|phone)['"]?\s*[:=]\s*['"]?)([^'",\s)}\]]+)""")
+
+
+def mask_email(value: str) -> str:
+    return EMAIL_PATTERN.sub(r'\1***@\2', value) if '@' in value else value
+
+
+def mask_phone(value: str) -> str:
+    return '***' + re.sub(r'\D', '', value)[-2:]
+
+
+def mask_text(value: str) -> str:
+    """Mask emails and phone numbers in free text: messages, exceptions, stack traces."""
+    value = mask_email(value)
+    value = LABELLED_PHONE_PATTERN.sub(lambda match: match.group(1) + mask_phone(match.group(2)), value)
+    return PHONE_PATTERN.sub(lambda match: mask_phone(match.group()), value)
+
+
+def redact(key: str, value: Any) -> Any:
+    """Mask ``value`` if ``key`` names a personal-data field.
+
+    Emails keep their first letter and domain and phone numbers their last
+    two digits, enough to tell records apart while debugging.
+    """
+    if isinstance(value, dict):
+        return {k: redact(k, v) for k, v in value.items()}
+    if value is None or key not in PII_FIELDS:
+        return value
+    text = str(value)
+    if key == 'email':
+        return mask_email(text)
+    if key in PHONE_FIELDS:
+        return mask_phone(text)
+    return '[redacted]'
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, process id, message and ``extra`` fields.
+
+    PII fields are redacted, and emails and phone numbers in the message,
+    exception and stack trace are masked.
+    """
+
+    def formatException(self, ei) -> str:
+        return mask_text(super().formatException(ei))
+
+    def formatStack(self, stack_info: str) -> str:
+        return mask_text(super().formatStack(stack_info))
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "message": mask_text(record.getMessage()),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = redact(key, value)
+        if getattr(record, 'sampled', False):
+            entry["sampleRate"] = record.sampled
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry["stack"] = self.formatStack(record.stack_info)
+        if orjson is not None:
+            return orjson.dumps(entry, default=str, option=orjson.OPT_NON_STR_KEYS).decode()
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    """The previous plain-text format, with the same redaction as JsonFormatter."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = mask_text(super().formatMessage(record))
+        fields = {key: redact(key, value) for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES}
+        return f"{line} {json.dumps(fields, default=str, ensure_ascii=False)}" if fields else line
+
+    def formatException(self, ei) -> str:
+        return mask_text(super().formatException(ei))
+
+    def formatStack(self, stack_info: str) -> str:
+        return mask_text(super().formatStack(stack_info))
+
+
+class SamplingFilter(logging.Filter):
+    """Keep a share of the high-volume INFO records.
+
+    Only records logged with ``extra={"sampled": True}`` are sampled;
+    warnings and errors always pass. Kept records carry the rate so counts
+    can be scaled back up.
+    """
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO or getattr(record, 'sampled', False) is not True:
+            return True
+        if self.rate < 1.0 and random.random() >= self.rate:
+            return False
+        record.sampled = self.rate
+        return True
+
+
+class BoundedQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the background writer without formatting them.
+
+    The stock QueueHandler formats the message on the calling thread so
+    the record can be pickled; here the listener is in the same process, so
+    formatting (and redaction) is left to it. Args must therefore not be
+    mutated after the call. When the queue is full the record is dropped
+    and counted instead of blocking the event loop.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_handler: Optional[BoundedQueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def _restart_after_fork():
+    # Only the forking thread survives in the child, so the writer thread is
+    # gone and the queue's lock may be held by it: start over with a new
+    # queue and thread (e.g. gunicorn --preload forks after importing the app)
+    if _handler is None or _listener is None:
+        return
+    _handler.queue = _listener.queue = queue.Queue(maxsize=_handler.queue.maxsize)
+    _listener._thread = None
+    _listener.start()
+
+
+def setup_logging(
+    level: str = 'INFO',
+    json_output: bool = True,
+    sample_rate: float = 1.0,
+    queue_size: int = 10000,
+    stream=None,
+) -> BoundedQueueHandler:
+    """Route the root logger through a queue to a background writer thread.
+
+    Logging calls only build the record and enqueue it; formatting,
+    redaction and the write happen on the listener thread, which is
+    flushed at exit. Safe to call more than once: later calls return the
+    handler installed by the first. Forked children get their own writer
+    thread.
+    """
+    global _handler, _listener
+    if _handler is not None:
+        return _handler
+    # Neither formatter prints the caller's file/line or thread, so skip
+    # collecting them for every record (see "Optimization" in the logging
+    # HOWTO). The process id stays: it tells workers apart, and gunicorn's
+    # own log format formats it with %d.
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logMultiprocessing = False
+    writer = logging.StreamHandler(stream or sys.stderr)
+    writer.setFormatter(JsonFormatter() if json_output else TextFormatter())
+    handler = BoundedQueueHandler(queue.Queue(maxsize=queue_size))
+    handler.addFilter(SamplingFilter(sample_rate))
+    listener = logging.handlers.QueueListener(handler.queue, writer, respect_handler_level=False)
+    listener.start()
+    atexit.register(listener.stop)
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level.upper())
+    _handler = handler
+    _listener = listener
+    os.register_at_fork(after_in_child=_restart_after_fork)
+    return handler
@@ -0,0 +1,57 @@
+import base64
+from datetime import datetime
+import json
+from typing import List, Optional, Tuple
+import uuid
+
+# Columns every listing query selects, whatever the projection: they make up the cursor
+CURSOR_COLUMNS = ('created_at', 'id')
+
+MAX_LIMIT = 1000
+
+
+def encode_cursor(cursor: Optional[Tuple[Optional[str], str]]) -> Optional[str]:
+    """Opaque, URL-safe token for a (created_at, id) keyset position."""
+    if cursor is None:
+        return None
+    raw = json.dumps(list(cursor), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token: Optional[str]) -> Optional[Tuple[Optional[str], str]]:
+    """The (created_at, id) position of ``token``, re-serialized from the parsed values.
+
+    Both end up in a PostgREST filter string, so anything that is not a
+    timestamp (or null, for rows without one) and a UUID is rejected with
+    ValueError.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        created_at, row_id = json.loads(raw)
+        if created_at is not None:
+            created_at = datetime.fromisoformat(created_at).isoformat()
+        return created_at, str(uuid.UUID(row_id))
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_fields(fields: Optional[str], row_format) -> Tuple[List[str], str]:
+    """Resolve a ``fields=a,b`` projection to output fields and a column list.
+
+    Without ``fields`` all fields of ``row_format`` are returned. Raises
+    ValueError for unknown fields.
+    """
+    if fields:
+        requested = [name.strip() for name in fields.split(',') if name.strip()]
+        unknown = [name for name in requested if name not in row_format.by_name]
+        if unknown:
+            raise ValueError(
+                f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(row_format.names)}"
+            )
+    else:
+        requested = row_format.names
+    columns = list(CURSOR_COLUMNS)
+    columns += [column for column in row_format.columns(requested) if column not in columns]
+    return requested, ','.join(columns)
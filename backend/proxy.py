@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlsplit
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def valid_target(url: Any) -> bool:
+    return isinstance(url, str) and (url.startswith('http://') or url.startswith('https://'))
+
+
+def parse_targets(value: Optional[str], default_timeout: float) -> List[Dict[str, Any]]:
+    """Fan-out targets from the environment.
+
+    Either a comma-separated list of URLs, or a JSON list of
+    ``{"url": ..., "timeout": seconds}`` objects for per-target timeouts.
+    Raises ValueError on anything that is not an http(s) URL.
+    """
+    value = (value or '').strip()
+    if not value:
+        return []
+    if value.startswith('['):
+        entries = json.loads(value)
+    else:
+        entries = [{'url': url.strip()} for url in value.split(',') if url.strip()]
+    targets = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {'url': entry}
+        if not valid_target(entry.get('url')):
+            raise ValueError(f"Invalid proxy target URL: {entry.get('url')!r}")
+        targets.append({'url': entry['url'], 'timeout': float(entry.get('timeout', default_timeout))})
+    return targets
+
+
+class ProxyClient:
+    """Long-lived HTTP clients for forwarding webhooks to external targets.
+
+    Each target host gets its own pooled ``httpx.AsyncClient``, kept for the
+    life of the app, so connections (and TLS sessions) are reused instead of
+    being set up per request. HTTP/2 is negotiated with targets that support
+    it when the ``h2`` package is installed. A host's pool holds at most
+    ``max_per_host`` connections, so a slow target can't starve the others;
+    separate pools also keep httpx's pool bookkeeping, which grows with
+    connections x waiting requests, small. At most ``max_hosts`` pools are
+    kept; the least recently used one is closed to make room.
+    """
+
+    def __init__(
+        self,
+        timeout: float = 10.0,
+        max_per_host: int = 10,
+        max_keepalive_per_host: Optional[int] = None,
+        keepalive_expiry: float = 30.0,
+        max_hosts: int = 32,
+        http2: bool = True,
+    ):
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self.max_keepalive_per_host = max_keepalive_per_host or max_per_host
+        self.keepalive_expiry = keepalive_expiry
+        self.max_hosts = max_hosts
+        self.http2 = http2 and HTTP2_AVAILABLE
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._evicted: Dict[httpx.AsyncClient, asyncio.Task] = {}
+
+    async def close(self):
+        for task in self._evicted.values():
+            task.cancel()
+        clients = list(self._clients.values()) + list(self._evicted)
+        self._clients, self._evicted = {}, {}
+        await asyncio.gather(*(client.aclose() for client in clients))
+
+    def _client_for(self, url: str) -> httpx.AsyncClient:
+        parts = urlsplit(url)
+        host = f'{parts.scheme}://{parts.netloc}'
+        client = self._clients.pop(host, None)
+        if client is None:
+            if len(self._clients) >= self.max_hosts:
+                evicted = self._clients.pop(next(iter(self._clients)))
+                self._evicted[evicted] = asyncio.create_task(self._close_later(evicted))
+            client = httpx.AsyncClient(
+                http2=self.http2,
+                timeout=self.timeout,
+                limits=httpx.Limits(
+                    max_connections=self.max_per_host,
+                    max_keepalive_connections=self.max_keepalive_per_host,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                headers={'Content-Type': 'application/json'},
+            )
+        # Re-inserting keeps the dict in least- to most-recently-used order
+        self._clients[host] = client
+        return client
+
+    async def _close_later(self, client: httpx.AsyncClient):
+        # Give requests still running on an evicted pool time to finish
+        await asyncio.sleep(self.timeout)
+        self._evicted.pop(client, None)
+        await client.aclose()
+
+    async def post(self, url: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> httpx.Response:
+        return await self._client_for(url).post(url, json=payload, timeout=timeout or self.timeout)
+
+    async def deliver(self, url: str, payload: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """POST ``payload`` to ``url`` and report the outcome instead of raising.
+
+        ``timeout`` covers the whole delivery, including waiting for a
+        connection slot.
+        """
+        timeout = timeout or self.timeout
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"target_url": url}
+        try:
+            response = await asyncio.wait_for(self.post(url, payload, timeout), timeout)
+            result.update({
+                "success": response.is_success,
+                "status_code": response.status_code,
+                "response_text": response.text[:200] if response.text else None,
+            })
+        except asyncio.TimeoutError:
+            result.update({"success": False, "error": f"Timed out after {timeout}s"})
+        except Exception as e:
+            result.update({"success": False, "error": str(e) or type(e).__name__})
+        result["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        return result
+
+    async def fan_out(self, targets: List[Dict[str, Any]], payload: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Deliver one payload to every target concurrently, one result per target."""
+        return list(await asyncio.gather(
+            *(self.deliver(target['url'], payload, target.get('timeout')) for target in targets)
+        ))
@@ -0,0 +1,43 @@
+import json
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any
+
+from starlette.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is in requirements.txt
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if isinstance(value, datetime):
+        # Same shape as orjson with OPT_UTC_Z (and as Pydantic)
+        return value.isoformat().replace('+00:00', 'Z')
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSON response for read endpoints that return trusted rows.
+
+    Return it directly from a route, ``return FastJSONResponse(content)``, so
+    FastAPI skips ``jsonable_encoder`` and ``response_model`` validation and the
+    content is encoded in one pass by orjson. The content must be plain dicts,
+    lists and scalars; datetimes, Decimals and UUIDs are handled too. Falls back
+    to the stdlib encoder when orjson is not installed.
+    """
+
+    def render(self, content: Any) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, default=_default, option=orjson.OPT_UTC_Z)
+        return json.dumps(
+            content, default=_default, ensure_ascii=False, allow_nan=False, separators=(',', ':')
+        ).encode('utf-8')
@@ -1,17 +1,45 @@
-from fastapi import FastAPI, APIRouter, Request
-from fastapi.responses import Response
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field
+from contextlib import asynccontextmanager
+from pydantic import BaseModel, Field, TypeAdapter
 from typing import List, Optional, Dict, Any
 import uuid
-from datetime import datetime
-from supabase import create_client, Client
-import asyncpg
+import hashlib
+import hmac
+import time
+from datetime import date, datetime, timezone
 import json
+import asyncio
+import tempfile
+
+import analytics
+import attribution
+import bulk
+import columnar
+import export
+import funnel
+import listing
+import telemetry
+from cache import CachedValue, CachedValues
+from capi import ConversionsPipeline, GraphApiTransport, build_event
+from coordination import Invalidations, Leadership
+from database import Database, PgPool
+from dedupe import DedupeCache
+from delivery import DeliveryQueue
+from formatting import Answer, Column, Constant, RowFormat
+from jsonlog import setup_logging
+from ingestion import BatchWriter, QueueFull
+from jobs import run_periodically
+from proxy import ProxyClient, parse_targets, valid_target
+from responses import FastJSONResponse
+from spool import Spool
+from telemetry import MetricsMiddleware, TimedRoute, stage
+from webhooks import LeadCaptureWebhook, PurchaseWebhook, build_lead_row, build_purchase_row
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -19,16 +47,264 @@ load_dotenv(ROOT_DIR / '.env')
 # Supabase connection
 supabase_url = os.environ['SUPABASE_URL']
 supabase_key = os.environ['SUPABASE_SERVICE_ROLE_KEY']
-supabase: Client = create_client(supabase_url, supabase_key)
+
+def create_supabase_client():
+    # supabase-py and its auth/storage/realtime clients take ~0.4 s to import,
+    # so this happens after startup instead of when the app is imported
+    from supabase import create_client
+    return create_client(supabase_url, supabase_key)
+
+# All PostgREST calls go through db.execute() so they never block the event loop
+db = Database(factory=create_supabase_client, max_concurrency=int(os.environ.get('SUPABASE_MAX_CONCURRENCY', '16')))
 
 # PostgreSQL connection for direct queries (optional, for better performance)
 DATABASE_URL = os.environ.get('SUPABASE_DB_URL')
 
+# Pooled asyncpg connections for the hot read paths; unused without SUPABASE_DB_URL.
+# Set DB_STATEMENT_CACHE_SIZE=0 when connecting through the transaction pooler (port 6543).
+pg = PgPool(
+    DATABASE_URL,
+    min_size=int(os.environ.get('DB_POOL_MIN_SIZE', '1')),
+    max_size=int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+    statement_cache_size=int(os.environ.get('DB_STATEMENT_CACHE_SIZE', '100')),
+    acquire_timeout=float(os.environ.get('DB_ACQUIRE_TIMEOUT', '5')),
+    command_timeout=float(os.environ.get('DB_COMMAND_TIMEOUT', '10')),
+)
+
+# Several worker processes (gunicorn -c gunicorn.conf.py): one elected worker
+# runs the singleton jobs, and cache invalidations reach every worker through
+# LISTEN/NOTIFY. Both need a session connection, so set COORDINATION_DB_URL
+# when SUPABASE_DB_URL goes through the transaction pooler.
+COORDINATION_DB_URL = os.environ.get('COORDINATION_DB_URL') or DATABASE_URL
+leadership = Leadership(
+    COORDINATION_DB_URL,
+    key=int(os.environ.get('LEADER_LOCK_KEY', '720200001')),
+    lock_path=os.environ.get('LEADER_LOCK_FILE', os.path.join(tempfile.gettempdir(), 'aura-backend-leader.lock')),
+    check_interval=float(os.environ.get('LEADER_CHECK_INTERVAL', '5')),
+)
+invalidations = Invalidations(COORDINATION_DB_URL)
+
+# Webhook ingestion: "direct" inserts each row before responding, "batched"
+# acknowledges immediately and writes rows in multi-row batches in the background,
+# "spool" writes rows to a local append-only spool first and replays it into
+# the database in bulk (survives database outages and restarts).
+WEBHOOK_INGESTION_MODE = os.environ.get('WEBHOOK_INGESTION_MODE', 'direct')
+batch_writer: Optional[BatchWriter] = None
+spool: Optional[Spool] = None
+
+# Recently seen purchase transaction ids / lead idempotency keys. Retries are
+# answered from here without a database round trip; the unique constraints in
+# the database catch whatever the cache has evicted.
+dedupe_cache = DedupeCache(
+    max_size=int(os.environ.get('DEDUPE_CACHE_SIZE', '100000')),
+    ttl=float(os.environ.get('DEDUPE_TTL_SECONDS', '86400')),
+)
+LEAD_DEDUPE_WINDOW_SECONDS = int(os.environ.get('LEAD_DEDUPE_WINDOW_SECONDS', '600'))
+
+# /api/metrics totals: leads and purchases come from the trigger-maintained
+# webhook_counters table, the rest of the funnel from the daily funnel_rollups
+async def load_webhook_counters() -> Dict[str, int]:
+    if pg.available:
+        rows = await pg.fetch('SELECT name, value FROM webhook_counters')
+    else:
+        result = await db.execute(db.table('webhook_counters').select('name,value'))
+        rows = result.data
+    return {row['name']: int(row['value']) for row in rows}
+
+async def load_metric_totals() -> Dict[str, int]:
+    totals = await funnel.funnel_totals(db, pg)
+    counts = await load_webhook_counters()
+    totals['leads'] = counts.get('leads', 0)
+    totals['purchases'] = counts.get('purchases', 0)
+    return totals
+
+# Cached briefly and invalidated whenever any worker writes webhook rows
+metric_totals = CachedValue(load_metric_totals, ttl=float(os.environ.get('METRICS_CACHE_TTL', '5')))
+invalidations.register('metric_totals', metric_totals.invalidate)
+
+# /api/attribution reports, per group_by/range; the rollups behind them change with the same writes
+attribution_reports = CachedValues(
+    lambda group_by, start, end: attribution.attribution_report(db, pg, list(group_by), start, end),
+    ttl=float(os.environ.get('ATTRIBUTION_CACHE_TTL', '30')),
+)
+invalidations.register('metric_totals', attribution_reports.invalidate)
+
+# /api/analytics/cube results, per query; same invalidation as the attribution reports
+analytics_cubes = CachedValues(
+    lambda group_by, granularity, start, end, filters, limit: analytics.cube(
+        db, pg, list(group_by), granularity, start, end, {name: list(values) for name, values in filters}, limit
+    ),
+    ttl=float(os.environ.get('ANALYTICS_CACHE_TTL', '30')),
+)
+invalidations.register('metric_totals', analytics_cubes.invalidate)
+
+# /api/analytics/quiz results, per window and segment. quiz_tracking is written
+# by the frontend straight to Supabase, so only the TTL bounds how stale the
+# session counts get; lead writes clear it like the other metrics.
+quiz_answer_stats = CachedValues(
+    lambda start, end, question, answer: analytics.quiz_answer_stats(db, pg, start, end, question, answer),
+    ttl=float(os.environ.get('QUIZ_ANALYTICS_CACHE_TTL', '60')),
+)
+invalidations.register('metric_totals', quiz_answer_stats.invalidate)
+
+async def reconcile_webhook_counters():
+    if pg.available:
+        corrected = await pg.fetch('SELECT * FROM reconcile_webhook_counters()')
+    else:
+        result = await db.execute(db.rpc('reconcile_webhook_counters'))
+        corrected = result.data or []
+    for row in corrected:
+        logger.warning(f"Corrected drift in webhook counter {row['name']}: now {row['value']}")
+    invalidations.publish('metric_totals')
+
+# Seconds between counter reconciliations; 0 disables the job
+METRICS_RECONCILE_INTERVAL = float(os.environ.get('METRICS_RECONCILE_INTERVAL', '3600'))
+
+# Shared HTTP client for /api/proxy-webhook
+PROXY_TIMEOUT = float(os.environ.get('PROXY_TIMEOUT', '10'))
+proxy_client = ProxyClient(
+    timeout=PROXY_TIMEOUT,
+    max_per_host=int(os.environ.get('PROXY_MAX_CONNECTIONS_PER_HOST', '10')),
+    http2=os.environ.get('PROXY_HTTP2', 'true').lower() == 'true',
+)
+# Targets a payload is fanned out to when it has no _target_url
+PROXY_FANOUT_TARGETS = parse_targets(os.environ.get('PROXY_WEBHOOK_TARGETS'), PROXY_TIMEOUT)
+
+# direct: deliver while the caller waits; queued: accept with 202 and deliver
+# in the background with retries
+PROXY_DELIVERY_MODE = os.environ.get('PROXY_DELIVERY_MODE', 'direct')
+delivery_queue: Optional[DeliveryQueue] = None
+
+async def store_dead_letter(delivery: Dict[str, Any]):
+    await db.execute(db.table('proxy_dead_letters').upsert({
+        'id': delivery['id'],
+        'target_url': delivery['target_url'],
+        'payload': delivery['payload'],
+        'attempts': delivery['attempts'],
+        'last_status_code': delivery['last_status_code'],
+        'last_error': delivery['last_error'],
+        'created_at': datetime.fromtimestamp(delivery['created_at'], timezone.utc).isoformat(),
+    }, returning='minimal'))
+
+# Meta Conversions API: lead and purchase events are sent server-side in
+# batches when a pixel id and access token are configured
+CAPI_PIXEL_ID = os.environ.get('CAPI_PIXEL_ID')
+CAPI_ACCESS_TOKEN = os.environ.get('CAPI_ACCESS_TOKEN')
+conversions: Optional[ConversionsPipeline] = None
+
+def submit_conversion(row: Dict[str, Any], event_id: str):
+    if conversions is None:
+        return
+    try:
+        conversions.submit(build_event(row, event_id))
+    except Exception as e:
+        # Conversions are best-effort; never fail the webhook over them
+        logger.warning(f"Conversion event {event_id} not queued: {e}")
+
+async def connect_supabase():
+    try:
+        await db.connect()
+    except Exception as e:
+        logger.error(f"Could not create the Supabase client: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global batch_writer, spool, delivery_queue, conversions
+    # Serve requests while the Supabase client is built; the first query
+    # waits for it only if it isn't ready yet
+    connect_task = asyncio.create_task(connect_supabase())
+    try:
+        await pg.open()
+    except Exception as e:
+        logger.error(f"Could not open Postgres pool, falling back to PostgREST: {e}")
+    await leadership.start()
+    await invalidations.start()
+    if WEBHOOK_INGESTION_MODE == 'batched':
+        batch_writer = BatchWriter(
+            insert_rows,
+            max_batch=int(os.environ.get('WEBHOOK_BATCH_SIZE', '500')),
+            max_delay=int(os.environ.get('WEBHOOK_BATCH_INTERVAL_MS', '200')) / 1000,
+            max_queue=int(os.environ.get('WEBHOOK_QUEUE_SIZE', '10000')),
+            drain_timeout=float(os.environ.get('WEBHOOK_DRAIN_TIMEOUT', '30')),
+        )
+        batch_writer.start()
+    elif WEBHOOK_INGESTION_MODE == 'spool':
+        spool = Spool(
+            os.environ.get('WEBHOOK_SPOOL_DIR', str(ROOT_DIR / 'spool')),
+            insert_rows,
+            fsync=os.environ.get('SPOOL_FSYNC', 'always'),
+            fsync_interval=int(os.environ.get('SPOOL_FSYNC_INTERVAL_MS', '100')) / 1000,
+            segment_bytes=int(os.environ.get('SPOOL_SEGMENT_BYTES', str(16 * 1024 * 1024))),
+            replay_batch=int(os.environ.get('SPOOL_REPLAY_BATCH', '500')),
+            # Segments left behind by stopped workers are replayed by the leader
+            may_adopt=lambda: leadership.is_leader,
+        )
+        await spool.open()
+    if PROXY_DELIVERY_MODE == 'queued':
+        delivery_queue = DeliveryQueue(
+            proxy_client,
+            store_dead_letter,
+            workers=int(os.environ.get('PROXY_DELIVERY_WORKERS', '4')),
+            max_attempts=int(os.environ.get('PROXY_DELIVERY_MAX_ATTEMPTS', '6')),
+            base_delay=float(os.environ.get('PROXY_RETRY_BASE_DELAY', '1')),
+            max_delay=float(os.environ.get('PROXY_RETRY_MAX_DELAY', '300')),
+            max_pending=int(os.environ.get('PROXY_DELIVERY_QUEUE_SIZE', '10000')),
+            breaker_threshold=int(os.environ.get('PROXY_BREAKER_THRESHOLD', '5')),
+            breaker_reset=float(os.environ.get('PROXY_BREAKER_RESET', '30')),
+        )
+        delivery_queue.start()
+    if CAPI_PIXEL_ID and CAPI_ACCESS_TOKEN:
+        conversions = ConversionsPipeline(
+            GraphApiTransport(
+                proxy_client,
+                CAPI_PIXEL_ID,
+                CAPI_ACCESS_TOKEN,
+                api_version=os.environ.get('CAPI_API_VERSION', 'v21.0'),
+                base_url=os.environ.get('CAPI_BASE_URL', 'https://graph.facebook.com'),
+                test_event_code=os.environ.get('CAPI_TEST_EVENT_CODE'),
+            ),
+            batch_size=int(os.environ.get('CAPI_BATCH_SIZE', '1000')),
+            max_delay=int(os.environ.get('CAPI_BATCH_INTERVAL_MS', '2000')) / 1000,
+            max_queue=int(os.environ.get('CAPI_QUEUE_SIZE', '10000')),
+            max_attempts=int(os.environ.get('CAPI_MAX_ATTEMPTS', '5')),
+        )
+        conversions.start()
+    reconcile_task = None
+    if METRICS_RECONCILE_INTERVAL > 0:
+        reconcile_task = asyncio.create_task(run_periodically(
+            'reconcile_webhook_counters', METRICS_RECONCILE_INTERVAL, reconcile_webhook_counters,
+            when=lambda: leadership.is_leader,
+        ))
+    yield
+    connect_task.cancel()
+    if reconcile_task is not None:
+        reconcile_task.cancel()
+    if batch_writer is not None:
+        # Flush every accepted row before the database clients go away
+        await batch_writer.stop()
+        batch_writer = None
+    if spool is not None:
+        await spool.close()
+        spool = None
+    if delivery_queue is not None:
+        # Undelivered webhooks end up in proxy_dead_letters, so this goes before db.close()
+        await delivery_queue.stop()
+        delivery_queue = None
+    if conversions is not None:
+        # Sends through proxy_client, so flush before it is closed
+        await conversions.stop()
+        conversions = None
+    await proxy_client.close()
+    await invalidations.stop()
+    await leadership.stop()
+    await pg.close()
+    db.close()
+
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+api_router = APIRouter(prefix="/api", route_class=TimedRoute)
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -39,214 +315,254 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
-class LeadCaptureWebhook(BaseModel):
-    name: str
-    email: str
-    whatsapp: Optional[str] = None
-    userAgent: Optional[str] = None
-    fbclid: Optional[str] = None
-    _fbc: Optional[str] = None
-    _fbp: Optional[str] = None
-    utmSource: Optional[str] = None
-    utmMedium: Optional[str] = None
-    utmCampaign: Optional[str] = None
-    utmContent: Optional[str] = None
-    utmTerm: Optional[str] = None
-    referrer: Optional[str] = None
-    quizAnswers: Optional[Dict[str, Any]] = None
-    bucketId: Optional[str] = None
-    eventType: str = "InitiateCheckout"
-    value: float = 15.0
-    currency: str = "USD"
-    client_ip: Optional[str] = None
-
-class PurchaseWebhook(BaseModel):
-    name: str
-    email: str
-    whatsapp: Optional[str] = None
-    transactionId: str
-    orderId: Optional[str] = None
-    userAgent: Optional[str] = None
-    fbclid: Optional[str] = None
-    _fbc: Optional[str] = None
-    _fbp: Optional[str] = None
-    utmSource: Optional[str] = None
-    utmMedium: Optional[str] = None
-    utmCampaign: Optional[str] = None
-    eventType: str = "Purchase"
-    value: float = 15.0
-    currency: str = "USD"
-    paymentMethod: str = "hotmart"
-    client_ip: Optional[str] = None
-
-# Helper function to get database connection
-async def get_db_connection():
-    if DATABASE_URL:
-        return await asyncpg.connect(DATABASE_URL)
-    return None
-
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
     return {"message": "Hello World"}
 
+@api_router.get("/health")
+async def health():
+    return {
+        "status": "ok",
+        "worker": {"pid": os.getpid(), "leader": leadership.is_leader},
+        "postgres": await pg.health(),
+        "ingestionMode": WEBHOOK_INGESTION_MODE,
+        "spool": spool.stats() if spool is not None else None,
+        "proxyDeliveries": delivery_queue.stats() if delivery_queue is not None else None,
+        "conversions": conversions.stats() if conversions is not None else None,
+    }
+
+# Prometheus scrape endpoint; set INTERNAL_METRICS_TOKEN to require
+# "Authorization: Bearer <token>"
+INTERNAL_METRICS_TOKEN = os.environ.get('INTERNAL_METRICS_TOKEN')
+
+telemetry.registry.gauge_callback(
+    'webhook_queue_depth', 'Webhook rows accepted but not yet written',
+    lambda: batch_writer.depth if batch_writer is not None else spool.pending_records if spool is not None else None,
+)
+telemetry.registry.gauge_callback(
+    'worker_is_leader', 'Whether this worker runs the singleton background jobs',
+    lambda: int(leadership.is_leader),
+)
+telemetry.registry.gauge_callback(
+    'proxy_deliveries_pending', 'Proxied webhooks not yet delivered or dead-lettered',
+    lambda: delivery_queue.pending if delivery_queue is not None else None,
+)
+telemetry.registry.gauge_callback(
+    'conversions_pending', 'Conversions API events waiting to be sent',
+    lambda: conversions.stats()['pending'] if conversions is not None else None,
+)
+
+@api_router.get("/internal/metrics", include_in_schema=False)
+async def internal_metrics(request: Request):
+    if INTERNAL_METRICS_TOKEN:
+        expected = f"Bearer {INTERNAL_METRICS_TOKEN}"
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(telemetry.registry.render(), media_type=telemetry.CONTENT_TYPE)
+
 @api_router.post("/status", response_model=StatusCheck)
 async def create_status_check(input: StatusCheckCreate):
     try:
         status_obj = StatusCheck(**input.dict())
-        result = supabase.table('status_checks').insert({
+        result = await db.execute(db.table('status_checks').insert({
             'id': status_obj.id,
             'client_name': status_obj.client_name,
             'timestamp': status_obj.timestamp.isoformat()
-        }).execute()
+        }))
         
         if result.data:
             return status_obj
         else:
             raise Exception("Failed to insert status check")
     except Exception as e:
-        print(f"Error creating status check: {e}")
+        logger.exception("Error creating status check: %s", e)
         raise
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
     try:
-        result = supabase.table('status_checks').select('*').order('created_at', desc=True).limit(1000).execute()
+        result = await db.execute(db.table('status_checks').select('*').order('created_at', desc=True).limit(1000))
         
-        status_checks = []
-        for status_check in result.data:
-            status_checks.append(StatusCheck(
-                id=status_check['id'],
-                client_name=status_check['client_name'],
-                timestamp=datetime.fromisoformat(status_check['timestamp'].replace('Z', '+00:00'))
-            ))
+        # Rows come from our own table, so they are serialized as-is rather
+        # than validated into StatusCheck models first
+        status_checks = [
+            {
+                "id": status_check['id'],
+                "client_name": status_check['client_name'],
+                "timestamp": datetime.fromisoformat(status_check['timestamp'].replace('Z', '+00:00')),
+            }
+            for status_check in result.data
+        ]
         
-        return status_checks
+        return FastJSONResponse(status_checks)
     except Exception as e:
-        print(f"Error getting status checks: {e}")
+        logger.exception("Error getting status checks: %s", e)
         return []
 
+def utc_now_iso() -> str:
+    return datetime.utcnow().isoformat()
+
+# Tracking fields shared by the leads and purchases listings
+TRACKING_FIELDS = [
+    Column("ip", "client_ip"),
+    Column("userAgent", "user_agent"),
+    Column("utmSource", "utm_source"),
+    Column("utmMedium", "utm_medium"),
+    Column("utmCampaign", "utm_campaign"),
+    Column("utmContent", "utm_content"),
+    Column("utmTerm", "utm_term"),
+    # Facebook tracking
+    Column("fbclid", "fbclid"),
+    Column("_fbc", "_fbc"),
+    Column("_fbp", "_fbp"),
+    # Additional data
+    Column("referrer", "referrer"),
+    Column("currentUrl", "current_url"),
+    Column("sessionId", "session_id"),
+]
+
+def contact_fields(stage: str) -> list:
+    return [
+        Column("id", ("session_id", "id"), ""),
+        Column("name", "name", "Sin nombre"),
+        Column("email", "email", "sin-email@ejemplo.com"),
+        Column("whatsapp", "whatsapp"),
+        Answer("businessType", "1", "sin-especificar"),
+        Answer("mainCost", "3", "sin-especificar"),
+        Answer("objective", "4", "sin-especificar"),
+        Answer("aiUsage", "5", "sin-especificar"),
+        Constant("stage", stage),
+        Column("createdAt", "created_at", utc_now_iso),
+    ]
+
+# Map webhook rows to the format the admin panel expects
+LEAD_FORMAT = RowFormat(contact_fields("lead_capture") + TRACKING_FIELDS)
+
+PURCHASE_FORMAT = RowFormat(contact_fields("purchased") + [
+    Column("transactionId", "transaction_id"),
+    Column("amount", "value", 15.0, float),
+] + TRACKING_FIELDS)
+
+def listing_filters(
+    utm_source: Optional[str],
+    utm_campaign: Optional[str],
+    email: Optional[str],
+    from_: Optional[datetime],
+    to: Optional[datetime],
+    bucket_id: Optional[str] = None,
+) -> List[export.Filter]:
+    filters: List[export.Filter] = []
+    if utm_source:
+        filters.append(('utm_source', 'eq', utm_source))
+    if utm_campaign:
+        filters.append(('utm_campaign', 'eq', utm_campaign))
+    if bucket_id:
+        filters.append(('bucket_id', 'eq', bucket_id))
+    if email:
+        filters.append(('email', 'ilike', export.like_prefix(email)))
+    if from_ is not None:
+        filters.append(('created_at', 'gte', funnel.as_utc(from_)))
+    if to is not None:
+        filters.append(('created_at', 'lt', funnel.as_utc(to)))
+    return filters
+
+async def list_page(table: str, row_format: RowFormat, fields, cursor, limit, filters):
+    """One page of formatted rows plus the cursor for the next page."""
+    try:
+        requested, columns = listing.parse_fields(fields, row_format)
+        position = listing.decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rows = await export.fetch_page(db, pg, table, limit, position, columns, filters)
+    items = row_format.to_dicts(rows, requested)
+    # A short page is the last one
+    next_cursor = listing.encode_cursor(export.next_cursor(rows)) if len(rows) == limit else None
+    return items, next_cursor
+
 @api_router.get("/leads")
-async def get_leads():
+async def get_leads(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=listing.MAX_LIMIT),
+    fields: Optional[str] = None,
+    utm_source: Optional[str] = None,
+    utm_campaign: Optional[str] = None,
+    bucket_id: Optional[str] = None,
+    email: Optional[str] = Query(None, description="Email prefix"),
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+):
+    """Newest leads first, ``limit`` per page. Pass ``nextCursor`` back as ``cursor`` for the next page."""
     try:
-        # Get data from lead_webhooks table
-        result = supabase.table('lead_webhooks').select('*').order('created_at', desc=True).limit(100).execute()
-        
-        leads = []
-        for lead in result.data:
-            # Map webhook data to expected frontend format
-            quiz_answers = lead.get('quiz_answers', {}) or {}
-            
-            formatted_lead = {
-                "id": lead.get("session_id", lead.get("id", "")),
-                "name": lead.get("name", "Sin nombre"),
-                "email": lead.get("email", "sin-email@ejemplo.com"),
-                "whatsapp": lead.get("whatsapp"),
-                "businessType": quiz_answers.get("1", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
-                "mainCost": quiz_answers.get("3", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
-                "objective": quiz_answers.get("4", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
-                "aiUsage": quiz_answers.get("5", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
-                "stage": "lead_capture",  # Default from lead-capture webhook
-                "createdAt": lead.get("created_at", datetime.utcnow().isoformat()),
-                # Complete tracking data
-                "ip": lead.get("client_ip"),
-                "userAgent": lead.get("user_agent"),
-                "utmSource": lead.get("utm_source"),
-                "utmMedium": lead.get("utm_medium"),
-                "utmCampaign": lead.get("utm_campaign"),
-                "utmContent": lead.get("utm_content"),
-                "utmTerm": lead.get("utm_term"),
-                # Facebook tracking
-                "fbclid": lead.get("fbclid"),
-                "_fbc": lead.get("_fbc"),
-                "_fbp": lead.get("_fbp"),
-                # Additional data
-                "referrer": lead.get("referrer"),
-                "currentUrl": lead.get("current_url"),
-                "sessionId": lead.get("session_id")
-            }
-            leads.append(formatted_lead)
-        
-        return {"leads": leads, "total": len(leads)}
+        filters = listing_filters(utm_source, utm_campaign, email, from_, to, bucket_id)
+        leads, next_cursor = await list_page(
+            'lead_webhooks', LEAD_FORMAT, fields, cursor, limit, filters
+        )
+        return FastJSONResponse({"leads": leads, "total": len(leads), "nextCursor": next_cursor})
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error getting leads: {e}")
-        return {"leads": [], "total": 0, "error": str(e)}
+        logger.exception("Error getting leads: %s", e)
+        return {"leads": [], "total": 0, "nextCursor": None, "error": str(e)}
 
 @api_router.get("/purchases")
-async def get_purchases():
+async def get_purchases(
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=listing.MAX_LIMIT),
+    fields: Optional[str] = None,
+    utm_source: Optional[str] = None,
+    utm_campaign: Optional[str] = None,
+    email: Optional[str] = Query(None, description="Email prefix"),
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+):
+    """Newest purchases first, ``limit`` per page. Pass ``nextCursor`` back as ``cursor`` for the next page."""
     try:
-        # Get data from purchase_webhooks table
-        result = supabase.table('purchase_webhooks').select('*').order('created_at', desc=True).limit(100).execute()
-        
-        purchases = []
-        for purchase in result.data:
-            quiz_answers = purchase.get('quiz_answers', {}) or {}
-            
-            formatted_purchase = {
-                "id": purchase.get("session_id", purchase.get("id", "")),
-                "name": purchase.get("name", "Sin nombre"),
-                "email": purchase.get("email", "sin-email@ejemplo.com"),
-                "whatsapp": purchase.get("whatsapp"),
-                "businessType": quiz_answers.get("1", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
-                "mainCost": quiz_answers.get("3", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
-                "objective": quiz_answers.get("4", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
-                "aiUsage": quiz_answers.get("5", "sin-especificar") if isinstance(quiz_answers, dict) else "sin-especificar",
-                "stage": "purchased",
-                "createdAt": purchase.get("created_at", datetime.utcnow().isoformat()),
-                "transactionId": purchase.get("transaction_id"),
-                "amount": float(purchase.get("value", 15.0)),
-                # Complete tracking data
-                "ip": purchase.get("client_ip"),
-                "userAgent": purchase.get("user_agent"),
-                "utmSource": purchase.get("utm_source"),
-                "utmMedium": purchase.get("utm_medium"),
-                "utmCampaign": purchase.get("utm_campaign"),
-                "utmContent": purchase.get("utm_content"),
-                "utmTerm": purchase.get("utm_term"),
-                # Facebook tracking
-                "fbclid": purchase.get("fbclid"),
-                "_fbc": purchase.get("_fbc"),
-                "_fbp": purchase.get("_fbp"),
-                # Additional data
-                "referrer": purchase.get("referrer"),
-                "currentUrl": purchase.get("current_url"),
-                "sessionId": purchase.get("session_id")
-            }
-            purchases.append(formatted_purchase)
-        
-        return {"purchases": purchases, "total": len(purchases)}
+        filters = listing_filters(utm_source, utm_campaign, email, from_, to)
+        purchases, next_cursor = await list_page(
+            'purchase_webhooks', PURCHASE_FORMAT, fields, cursor, limit, filters
+        )
+        return FastJSONResponse({"purchases": purchases, "total": len(purchases), "nextCursor": next_cursor})
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error getting purchases: {e}")
-        return {"purchases": [], "total": 0, "error": str(e)}
+        logger.exception("Error getting purchases: %s", e)
+        return {"purchases": [], "total": 0, "nextCursor": None, "error": str(e)}
 
 @api_router.get("/metrics")
-async def get_metrics():
+async def get_metrics(
+    from_: Optional[datetime] = Query(None, alias="from"),
+    to: Optional[datetime] = None,
+    granularity: Optional[str] = Query(None, pattern="^(hour|day)$"),
+):
+    """Funnel metrics from the pre-aggregated rollups.
+
+    Without parameters returns all-time totals. With ``from``/``to``/``granularity``
+    returns the totals for that range plus one entry per hour or day bucket.
+    """
     try:
-        # Calculate real metrics from database
-        leads_result = supabase.table('lead_webhooks').select('id', count='exact').execute()
-        purchases_result = supabase.table('purchase_webhooks').select('id', count='exact').execute()
-        
-        total_leads = leads_result.count or 0
-        total_purchases = purchases_result.count or 0
-        
-        # Calculate basic metrics (you can expand this with more logic)
-        estimated_visitors = max(total_leads * 3, 100)  # Estimation based on leads
-        conversion_rate = (total_purchases / max(total_leads, 1)) * 100 if total_leads > 0 else 0
-        
-        metrics = {
-            "totalVisitors": estimated_visitors,
-            "leadsGenerated": total_leads,
-            "purchases": total_purchases,
-            "conversionRate": round(conversion_rate, 1),
-            "quizStarts": int(total_leads * 1.5),  # Estimation
-            "quizCompletions": total_leads,
-            "diagnosisViewed": int(total_leads * 0.8),  # Estimation
-            "checkoutClicks": int(total_leads * 0.4),  # Estimation
-        }
-        
+        if from_ is None and to is None and granularity is None:
+            return funnel.format_metrics(await metric_totals.get())
+
+        granularity = granularity or 'day'
+        try:
+            start, end = funnel.resolve_range(granularity, from_, to)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        buckets = await funnel.funnel_series(db, pg, granularity, start, end)
+        metrics = funnel.format_metrics(funnel.sum_buckets(buckets))
+        metrics.update({
+            "granularity": granularity,
+            "from": start.isoformat(),
+            "to": end.isoformat(),
+            "series": [funnel.format_bucket(bucket) for bucket in buckets],
+        })
         return metrics
+    except HTTPException:
+        raise
     except Exception as e:
-        print(f"Error getting metrics: {e}")
+        logger.exception("Error getting metrics: %s", e)
         return {
             "totalVisitors": 0,
             "leadsGenerated": 0,
@@ -259,295 +575,625 @@ async def get_metrics():
             "error": str(e)
         }
 
-@api_router.get("/export-leads-csv")
-async def export_leads_csv():
-    """Export all leads data to CSV format"""
+@api_router.get("/attribution")
+async def get_attribution(
+    group_by: Optional[str] = Query(None, description="Comma-separated: source, medium, campaign, bucket"),
+    from_: Optional[date] = Query(None, alias="from"),
+    to: Optional[date] = Query(None, description="Exclusive"),
+):
+    """Leads, purchases and revenue per campaign/bucket from the attribution rollups.
+
+    Each purchase is attributed once, when it (or a late lead) is inserted,
+    to the lead it came from; ``conversionRate`` is the share of a group's
+    leads with an attributed purchase. Days are UTC and ``to`` is exclusive.
+    """
     try:
-        import csv
-        from io import StringIO
-        
-        # Get all lead data from Supabase
-        result = supabase.table('lead_webhooks').select('*').order('created_at', desc=True).execute()
-        
-        # Create CSV content
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        headers = [
-            'Nombre', 'Email', 'WhatsApp', 'Tipo Negocio', 'Costo Principal', 'Objetivo', 'Uso IA', 'Etapa', 'Fecha Creacion',
-            'IP', 'User Agent', 'Session ID', 'Referrer', 'URL Actual',
-            'UTM Source', 'UTM Medium', 'UTM Campaign', 'UTM Content', 'UTM Term',
-            'fbclid', '_fbc', '_fbp',
-            'Transaction ID', 'Valor', 'Moneda', 'Timestamp Completo'
-        ]
-        writer.writerow(headers)
-        
-        # Write data rows
-        for lead in result.data:
-            quiz_answers = lead.get("quiz_answers", {}) or {}
-            
-            row = [
-                lead.get("name", ""),
-                lead.get("email", ""),
-                lead.get("whatsapp", "N/A"),
-                quiz_answers.get("1", "N/A") if isinstance(quiz_answers, dict) else "N/A",
-                quiz_answers.get("3", "N/A") if isinstance(quiz_answers, dict) else "N/A",
-                quiz_answers.get("4", "N/A") if isinstance(quiz_answers, dict) else "N/A",
-                quiz_answers.get("5", "N/A") if isinstance(quiz_answers, dict) else "N/A",
-                "Captura de Lead",
-                lead.get("created_at", "N/A"),
-                lead.get("client_ip", "N/A"),
-                lead.get("user_agent", "N/A"),
-                lead.get("session_id", "N/A"),
-                lead.get("referrer", "N/A"),
-                lead.get("current_url", "N/A"),
-                lead.get("utm_source", "N/A"),
-                lead.get("utm_medium", "N/A"),
-                lead.get("utm_campaign", "N/A"),
-                lead.get("utm_content", "N/A"),
-                lead.get("utm_term", "N/A"),
-                lead.get("fbclid", "N/A"),
-                lead.get("_fbc", "N/A"),
-                lead.get("_fbp", "N/A"),
-                "N/A",  # Transaction ID
-                lead.get("value", "N/A"),
-                lead.get("currency", "N/A"),
-                lead.get("timestamp", "N/A")
-            ]
-            writer.writerow(row)
-        
-        csv_content = output.getvalue()
-        output.close()
-        
-        return Response(
-            content=csv_content,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=leads_completo.csv"}
+        group_by_dimensions = attribution.parse_group_by(group_by)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if from_ is not None and to is not None and from_ >= to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    try:
+        rows = await attribution_reports.get(tuple(group_by_dimensions), from_, to)
+        report = attribution.format_report(rows, group_by_dimensions)
+        report.update({
+            "from": from_.isoformat() if from_ else None,
+            "to": to.isoformat() if to else None,
+        })
+        return FastJSONResponse(report)
+    except Exception as e:
+        logger.exception("Error getting attribution: %s", e)
+        return {"groupBy": group_by_dimensions, "totals": None, "groups": [], "error": str(e)}
+
+@api_router.get("/analytics/cube")
+async def get_analytics_cube(
+    group_by: Optional[str] = Query(None, description="Comma-separated: date, source, medium, campaign, bucket"),
+    granularity: str = Query('day', pattern="^(day|week|month)$", description="Bucket for the date dimension"),
+    from_: Optional[date] = Query(None, alias="from"),
+    to: Optional[date] = Query(None, description="Exclusive"),
+    utm_source: Optional[List[str]] = Query(None),
+    utm_medium: Optional[List[str]] = Query(None),
+    utm_campaign: Optional[List[str]] = Query(None),
+    bucket_id: Optional[List[str]] = Query(None),
+    limit: int = Query(1000, ge=1, le=analytics.MAX_LIMIT),
+):
+    """Leads, purchases, revenue and conversion rate sliced by UTM, bucket and date.
+
+    Answers from the daily and monthly attribution rollups. Filters can be
+    repeated to match any of several values; an empty value matches rows
+    without that UTM. Groups are ordered by date, then revenue.
+    """
+    try:
+        group_by_dimensions = attribution.parse_group_by(group_by, analytics.DIMENSIONS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if from_ is not None and to is not None and from_ >= to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    filters = {
+        'utm_source': utm_source, 'utm_medium': utm_medium, 'utm_campaign': utm_campaign, 'bucket_id': bucket_id,
+    }
+    try:
+        rows = await analytics_cubes.get(
+            tuple(group_by_dimensions), granularity, from_, to,
+            tuple((name, tuple(values)) for name, values in filters.items() if values), limit,
         )
-        
+        cube = analytics.format_cube(rows, group_by_dimensions, limit)
+        cube.update({
+            "granularity": granularity,
+            "from": from_.isoformat() if from_ else None,
+            "to": to.isoformat() if to else None,
+        })
+        return FastJSONResponse(cube)
+    except Exception as e:
+        logger.exception("Error getting analytics cube: %s", e)
+        return {"groupBy": group_by_dimensions, "totals": None, "groups": [], "error": str(e)}
+
+@api_router.get("/analytics/quiz")
+async def get_quiz_analytics(
+    from_: Optional[date] = Query(None, alias="from"),
+    to: Optional[date] = Query(None, description="Exclusive"),
+    question: Optional[str] = Query(None, description="Only sessions and leads that gave `answer` to this question"),
+    answer: Optional[str] = Query(None),
+):
+    """Answer histograms, answer-to-purchase conversion and drop-off for each quiz question.
+
+    Sessions come from quiz_tracking and leads from lead_webhooks, both by
+    creation time in ``[from, to)``; purchases are the ones attributed to
+    those leads. Aggregated in the database and cached per window.
+    """
+    if (question is None) != (answer is None):
+        raise HTTPException(status_code=400, detail="'question' and 'answer' go together")
+    if from_ is not None and to is not None and from_ >= to:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    try:
+        rows = await quiz_answer_stats.get(from_, to, question, answer)
+        stats = analytics.format_quiz_answers(rows)
+        stats.update({
+            "from": from_.isoformat() if from_ else None,
+            "to": to.isoformat() if to else None,
+            "segment": {"question": question, "answer": answer} if question is not None else None,
+        })
+        return FastJSONResponse(stats)
+    except Exception as e:
+        logger.exception("Error getting quiz analytics: %s", e)
+        return {"sessions": 0, "questions": [], "error": str(e)}
+
+LEAD_CSV_FORMAT = RowFormat([
+    Column('Nombre', 'name', ""),
+    Column('Email', 'email', ""),
+    Column('WhatsApp', 'whatsapp', "N/A"),
+    Answer('Tipo Negocio', "1", "N/A"),
+    Answer('Costo Principal', "3", "N/A"),
+    Answer('Objetivo', "4", "N/A"),
+    Answer('Uso IA', "5", "N/A"),
+    Constant('Etapa', "Captura de Lead"),
+    Column('Fecha Creacion', 'created_at', "N/A"),
+    Column('IP', 'client_ip', "N/A"),
+    Column('User Agent', 'user_agent', "N/A"),
+    Column('Session ID', 'session_id', "N/A"),
+    Column('Referrer', 'referrer', "N/A"),
+    Column('URL Actual', 'current_url', "N/A"),
+    Column('UTM Source', 'utm_source', "N/A"),
+    Column('UTM Medium', 'utm_medium', "N/A"),
+    Column('UTM Campaign', 'utm_campaign', "N/A"),
+    Column('UTM Content', 'utm_content', "N/A"),
+    Column('UTM Term', 'utm_term', "N/A"),
+    Column('fbclid', 'fbclid', "N/A"),
+    Column('_fbc', '_fbc', "N/A"),
+    Column('_fbp', '_fbp', "N/A"),
+    Constant('Transaction ID', "N/A"),
+    Column('Valor', 'value', "N/A"),
+    Column('Moneda', 'currency', "N/A"),
+    Column('Timestamp Completo', 'timestamp', "N/A"),
+])
+
+# Rows per keyset page when streaming exports
+EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', '1000'))
+
+async def log_stream_errors(chunks, label: str):
+    # Once streaming has started the status code is sent; all we can do is log and abort
+    try:
+        async for chunk in chunks:
+            yield chunk
     except Exception as e:
-        print(f"Error exporting leads CSV: {e}")
-        return {"error": str(e)}
+        logger.error(f"Error exporting {label}: {e}")
+        raise
+
+@api_router.get("/export-leads-csv")
+async def export_leads_csv():
+    """Export all leads data to CSV format, streamed page by page"""
+    pages = export.iter_pages(db, pg, 'lead_webhooks', EXPORT_PAGE_SIZE)
+    return StreamingResponse(
+        log_stream_errors(export.stream_csv(pages, LEAD_CSV_FORMAT.names, LEAD_CSV_FORMAT.to_tuples), 'leads CSV'),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=leads_completo.csv"}
+    )
+
+EXPORT_TABLES = {
+    'leads': 'lead_webhooks',
+    'purchases': 'purchase_webhooks',
+}
+
+# Rows per Parquet row group / Arrow batch for columnar exports
+COLUMNAR_ROW_GROUP_SIZE = int(os.environ.get('COLUMNAR_ROW_GROUP_SIZE', '20000'))
+
+@api_router.get("/export/{dataset}")
+async def export_columnar(
+    dataset: str,
+    format: str = Query('parquet', pattern="^(parquet|arrow|ndjson\\.gz)$"),
+):
+    """Typed export of leads or purchases as Parquet, Arrow IPC stream or gzipped NDJSON"""
+    table = EXPORT_TABLES.get(dataset)
+    if table is None:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset '{dataset}'")
+
+    media_type, extension = columnar.FORMATS[format]
+    pages = export.iter_pages(db, pg, table, EXPORT_PAGE_SIZE)
+    return StreamingResponse(
+        log_stream_errors(columnar.stream_export(pages, table, format, COLUMNAR_ROW_GROUP_SIZE), f'{dataset} {format}'),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={dataset}.{extension}"}
+    )
 
 @api_router.post("/proxy-webhook")
 async def proxy_webhook(request: Request):
-    """Proxy webhook requests to external URLs to avoid CORS issues"""
+    """Proxy webhook requests to external URLs to avoid CORS issues
+
+    With ``_target_url`` the payload goes to that URL. Without it, it is
+    delivered concurrently to every target in ``PROXY_WEBHOOK_TARGETS`` and
+    the per-target results are returned together.
+    """
     try:
-        import httpx
-        
         # Get request data
         webhook_data = await request.json()
         target_url = webhook_data.pop('_target_url', None)
         
+        if delivery_queue is not None:
+            return enqueue_proxy_deliveries(target_url, webhook_data)
+        
         if not target_url:
+            if PROXY_FANOUT_TARGETS:
+                with stage('proxy'):
+                    results = await proxy_client.fan_out(PROXY_FANOUT_TARGETS, webhook_data)
+                delivered = sum(1 for result in results if result["success"])
+                return {
+                    "success": delivered == len(results),
+                    "message": f"Webhook delivered to {delivered} of {len(results)} targets",
+                    "delivered": delivered,
+                    "failed": len(results) - delivered,
+                    "results": results,
+                }
             return {"success": False, "error": "Missing _target_url parameter"}
         
         # Validate target URL
-        if not (target_url.startswith('http://') or target_url.startswith('https://')):
+        if not valid_target(target_url):
             return {"success": False, "error": "Invalid target URL"}
         
-        # Send webhook to external URL
-        async with httpx.AsyncClient(timeout=10.0) as client:
-            response = await client.post(
-                target_url,
-                json=webhook_data,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            return {
-                "success": True,
-                "message": "Webhook proxied successfully",
-                "target_url": target_url,
-                "status_code": response.status_code,
-                "response_text": response.text[:200] if response.text else None
-            }
+        # Send webhook to external URL over the shared connection pool
+        with stage('proxy'):
+            response = await proxy_client.post(target_url, webhook_data)
+        
+        return {
+            "success": True,
+            "message": "Webhook proxied successfully",
+            "target_url": target_url,
+            "status_code": response.status_code,
+            "response_text": response.text[:200] if response.text else None
+        }
             
+    except QueueFull as e:
+        webhook_errors.labels('proxy', 'queue_full').inc()
+        raise queue_full_error(e)
     except Exception as e:
-        print(f"Error proxying webhook: {e}")
+        webhook_errors.labels('proxy', 'error').inc()
+        logger.exception("Error proxying webhook: %s", e)
         return {"success": False, "error": f"Proxy error: {str(e)}"}
 
+def enqueue_proxy_deliveries(target_url: Optional[str], webhook_data: Dict[str, Any]):
+    if target_url:
+        if not valid_target(target_url):
+            return {"success": False, "error": "Invalid target URL"}
+        targets = [{'url': target_url, 'timeout': PROXY_TIMEOUT}]
+    elif PROXY_FANOUT_TARGETS:
+        targets = PROXY_FANOUT_TARGETS
+    else:
+        return {"success": False, "error": "Missing _target_url parameter"}
+    deliveries = delivery_queue.submit_all([(target['url'], target['timeout']) for target in targets], webhook_data)
+    # Pending deliveries live in this worker's memory: the status URL names it
+    worker = os.getpid()
+    content = {
+        "success": True,
+        "queued": True,
+        "message": "Webhook queued for delivery",
+        "deliveries": [
+            {"id": d['id'], "target_url": d['target_url'], "statusUrl": f"/api/proxy-webhook/{d['id']}?worker={worker}"}
+            for d in deliveries
+        ],
+    }
+    if target_url:
+        content["deliveryId"] = deliveries[0]['id']
+    return JSONResponse(status_code=202, content=content)
+
+@api_router.get("/proxy-webhook/{delivery_id}")
+async def proxy_delivery_status(delivery_id: str, worker: Optional[int] = None):
+    """Status of a queued proxy delivery; given-up deliveries are looked up in the dead-letter table.
+
+    Deliveries that are not dead-lettered are only known to the worker that
+    queued them (``worker``); asked on another one, the status is ``unknown``
+    rather than a 404.
+    """
+    delivery = delivery_queue.get(delivery_id) if delivery_queue is not None else None
+    if delivery is not None:
+        return delivery_queue.describe(delivery)
+    try:
+        uuid.UUID(delivery_id)
+    except ValueError:
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    result = await db.execute(
+        db.table('proxy_dead_letters')
+        .select('id,target_url,attempts,last_status_code,last_error,created_at,failed_at')
+        .eq('id', delivery_id)
+    )
+    if not result.data:
+        if worker is not None and worker != os.getpid():
+            return {
+                "id": delivery_id,
+                "status": "unknown",
+                "worker": worker,
+                "message": f"Delivery is tracked by worker {worker}, not this one ({os.getpid()}); retry the request",
+            }
+        raise HTTPException(status_code=404, detail="Delivery not found")
+    row = result.data[0]
+    return {
+        "id": row['id'],
+        "targetUrl": row['target_url'],
+        "status": "dead",
+        "attempts": row['attempts'],
+        "lastStatusCode": row['last_status_code'],
+        "lastError": row['last_error'],
+        "nextAttemptAt": None,
+        "createdAt": row['created_at'],
+        "updatedAt": row['failed_at'],
+    }
+
+PURCHASE_CSV_FORMAT = RowFormat([
+    Column('Nombre', 'name', ""),
+    Column('Email', 'email', ""),
+    Column('WhatsApp', 'whatsapp', "N/A"),
+    Column('Transaction ID', 'transaction_id', "N/A"),
+    Column('Fecha', 'created_at', "N/A"),
+    Column('Valor', 'value', 15.0, lambda value: f"${value}"),
+    Column('Moneda', 'currency', "USD"),
+    Answer('Tipo Negocio', "1", "N/A"),
+    Answer('Costo Principal', "3", "N/A"),
+    Answer('Objetivo', "4", "N/A"),
+    Answer('Uso IA', "5", "N/A"),
+    Column('IP', 'client_ip', "N/A"),
+    Column('User Agent', 'user_agent', "N/A"),
+    Column('Session ID', 'session_id', "N/A"),
+    Column('UTM Source', 'utm_source', "N/A"),
+    Column('UTM Medium', 'utm_medium', "N/A"),
+    Column('UTM Campaign', 'utm_campaign', "N/A"),
+    Column('UTM Content', 'utm_content', "N/A"),
+    Column('UTM Term', 'utm_term', "N/A"),
+    Column('fbclid', 'fbclid', "N/A"),
+    Column('_fbc', '_fbc', "N/A"),
+    Column('_fbp', '_fbp', "N/A"),
+    Column('Referrer', 'referrer', "N/A"),
+    Column('URL Actual', 'current_url', "N/A"),
+    Column('Timestamp Completo', 'timestamp', "N/A"),
+])
+
 @api_router.get("/export-purchases-csv")
 async def export_purchases_csv():
-    """Export all purchases data to CSV format"""
+    """Export all purchases data to CSV format, streamed page by page"""
+    pages = export.iter_pages(db, pg, 'purchase_webhooks', EXPORT_PAGE_SIZE)
+    return StreamingResponse(
+        log_stream_errors(export.stream_csv(pages, PURCHASE_CSV_FORMAT.names, PURCHASE_CSV_FORMAT.to_tuples), 'purchases CSV'),
+        media_type="text/csv",
+        headers={"Content-Disposition": "attachment; filename=purchases_completo.csv"}
+    )
+
+def lead_idempotency_key(webhook_data: LeadCaptureWebhook, header_value: str) -> str:
+    # Same header + email + bucket inside one time window is the same lead
+    window = int(time.time() // LEAD_DEDUPE_WINDOW_SECONDS)
+    raw = f"{header_value}|{webhook_data.email.strip().lower()}|{webhook_data.bucketId or ''}|{window}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+# Unique columns that make webhook inserts idempotent (see the idempotent_webhooks migration)
+CONFLICT_KEYS = {
+    'lead_webhooks': 'idempotency_key',
+    'purchase_webhooks': 'transaction_id',
+}
+
+def upsert_query(table: str, rows, **kwargs):
+    return db.table(table).upsert(rows, on_conflict=CONFLICT_KEYS[table], ignore_duplicates=True, **kwargs)
+
+# Multi-row insert used by the write-behind queue and the spool replayer
+async def insert_rows(table: str, rows: List[Dict[str, Any]]):
+    await db.execute(upsert_query(table, rows, returning='minimal'))
+    invalidations.publish('metric_totals')
+
+async def save_webhook_row(table: str, row: Dict[str, Any], dedupe_key: Optional[str] = None) -> str:
+    """Insert a webhook row, or queue it when batched/spool ingestion is enabled.
+
+    Returns "inserted", "queued" or "duplicate". Keys found in the dedupe
+    cache are rejected without touching the database.
+    """
+    if dedupe_key is not None and not dedupe_cache.add(dedupe_key):
+        return "duplicate"
+
     try:
-        import csv
-        from io import StringIO
-        
-        # Get all purchase data from Supabase
-        result = supabase.table('purchase_webhooks').select('*').order('created_at', desc=True).execute()
-        
-        # Create CSV content
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        # Write headers
-        headers = [
-            'Nombre', 'Email', 'WhatsApp', 'Transaction ID', 'Fecha', 'Valor', 'Moneda',
-            'Tipo Negocio', 'Costo Principal', 'Objetivo', 'Uso IA',
-            'IP', 'User Agent', 'Session ID',
-            'UTM Source', 'UTM Medium', 'UTM Campaign', 'UTM Content', 'UTM Term',
-            'fbclid', '_fbc', '_fbp',
-            'Referrer', 'URL Actual', 'Timestamp Completo'
-        ]
-        writer.writerow(headers)
-        
-        # Write data rows
-        for purchase in result.data:
-            quiz_answers = purchase.get("quiz_answers", {}) or {}
-            
-            row = [
-                purchase.get("name", ""),
-                purchase.get("email", ""),
-                purchase.get("whatsapp", "N/A"),
-                purchase.get("transaction_id", "N/A"),
-                purchase.get("created_at", "N/A"),
-                f"${purchase.get('value', 15.0)}",
-                purchase.get("currency", "USD"),
-                quiz_answers.get("1", "N/A") if isinstance_answers, dict) else "N/A",
-                quiz_answers.get("3", "N/A") if isinstance_answers, dict) else "N/A",
-                quiz_answers.get("4", "N/A") if isinstance_answers, dict) else "N/A",
-                quiz_answers.get("5", "N/A") if isinstance_answers, dict) else "N/A",
-                purchase.get("client_ip", "N/A"),
-                purchase.get("user_agent", "N/A"),
-                purchase.get("session_id", "N/A"),
-                purchase.get("utm_source", "N/A"),
-                purchase.get("utm_medium", "N/A"),
-                purchase.get("utm_campaign", "N/A"),
-                purchase.get("utm_content", "N/A"),
-                purchase.get("utm_term", "N/A"),
-                purchase.get("fbclid", "N/A"),
-                purchase.get("_fbc", "N/A"),
-                purchase.get("_fbp", "N/A"),
-                purchase.get("referrer", "N/A"),
-                purchase.get("current_url", "N/A"),
-                purchase.get("timestamp", "N/A")
-            ]
-            writer.writerow(row)
-        
-        csv_content = output.getvalue()
-        output.close()
-        
-        return Response(
-            content=csv_content,
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=purchases_completo.csv"}
-        )
-        
-    except Exception as e:
-        print(f"Error exporting purchases CSV: {e}")
-        return {"error": str(e)}
+        if spool is not None:
+            await spool.append(table, row)
+            return "queued"
+
+        if batch_writer is not None:
+            batch_writer.submit(table, row)
+            return "queued"
+
+        result = await db.execute(upsert_query(table, row))
+    except Exception:
+        # Not stored, so a retry must not be treated as a duplicate
+        if dedupe_key is not None:
+            dedupe_cache.discard(dedupe_key)
+        raise
+    if not result.data:
+        return "duplicate"
+    invalidations.publish('metric_totals')
+    return "inserted"
+
+webhook_errors = telemetry.registry.counter(
+    'webhook_errors_total', 'Webhooks that were not processed', ('webhook', 'reason')
+)
+
+def queue_full_error(e: QueueFull) -> HTTPException:
+    return HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
 
 # Webhook for Lead Capture (InitiateCheckout)
 async def lead_capture_webhook(webhook_data: LeadCaptureWebhook, request: Request):
     try:
-        # Prioritize client_ip from webhook data
-        client_ip = webhook_data.client_ip
-
-        # Prepare data for Supabase
-        webhook_dict = {
-            "session_id": str(uuid.uuid4()),
-            "name": webhook_data.name,
-            "email": webhook_data.email,
-            "whatsapp": webhook_data.whatsapp,
-            "user_agent": webhook_data.userAgent,
-            "fbclid": webhook_data.fbclid,
-            "_fbc": webhook_data._fbc,
-            "_fbp": webhook_data._fbp,
-            "utm_source": webhook_data.utmSource,
-            "utm_medium": webhook_data.utmMedium,
-            "utm_campaign": webhook_data.utmCampaign,
-            "utmContent": webhook_data.utmContent,
-            "utmTerm": webhook_data.utmTerm,
-            "referrer": webhook_data.referrer,
-            "quiz_answers": webhook_data.quizAnswers or {},
-            "bucket_id": webhook_data.bucketId,
-            "event_type": webhook_data.eventType,
-            "value": webhook_data.value,
-            "currency": webhook_data.currency,
-            "client_ip": client_ip,
-            "timestamp": datetime.utcnow().isoformat(),
-        }
+        idempotency_header = request.headers.get('Idempotency-Key')
+        idempotency_key = lead_idempotency_key(webhook_data, idempotency_header) if idempotency_header else None
+        webhook_dict = build_lead_row(webhook_data, idempotency_key)
 
         # Save to Supabase
-        result = supabase.table('lead_webhooks').insert(webhook_dict).execute()
-
-        if not result.data:
-            raise Exception("Failed to insert lead webhook data")
+        with stage('db_insert'):
+            status = await save_webhook_row(
+                'lead_webhooks', webhook_dict,
+                dedupe_key=f"lead:{idempotency_key}" if idempotency_key else None,
+            )
+        if status != "duplicate":
+            submit_conversion(webhook_dict, f"lead:{idempotency_key or webhook_dict['session_id']}")
 
-        logger.info(f"Lead capture webhook received: {webhook_data.email}")
-        logger.info(f"Lead capture webhook data: {webhook_data}")
+        logger.info("Lead capture webhook received", extra={
+            "sampled": True,
+            "email": webhook_data.email,
+            "eventType": webhook_data.eventType,
+            "bucketId": webhook_data.bucketId,
+            "utmSource": webhook_data.utmSource,
+            "status": status,
+        })
+        logger.debug("Lead capture webhook data: %r", webhook_data)
 
         return {
             "success": True,
-            "message": "Lead capture webhook processed successfully",
+            "message": "Duplicate lead capture webhook ignored" if status == "duplicate" else "Lead capture webhook processed successfully",
+            "queued": status == "queued",
+            "duplicate": status == "duplicate",
             "data": {
                 "email": webhook_data.email,
                 "eventType": webhook_data.eventType,
-                "clientIP": client_ip
+                "clientIP": webhook_dict["client_ip"]
             }
         }
 
+    except QueueFull as e:
+        webhook_errors.labels('lead_capture', 'queue_full').inc()
+        raise queue_full_error(e)
     except Exception as e:
-        logger.error(f"Error processing lead capture webhook: {str(e)}")
+        webhook_errors.labels('lead_capture', 'error').inc()
+        logger.exception("Error processing lead capture webhook: %s", e)
         return {"success": False, "error": str(e)}
 
 # Webhook for Purchase
 async def purchase_webhook(webhook_data: PurchaseWebhook, request: Request):
     try:
-        # Prioritize client_ip from webhook data
-        client_ip = webhook_data.client_ip
-
-        # Prepare data for Supabase
-        webhook_dict = {
-            "session_id": str(uuid.uuid4()),
-            "name": webhook_data.name,
-            "email": webhook_data.email,
-            "whatsapp": webhook_data.whatsapp,
-            "transaction_id": webhook_data.transactionId,
-            "order_id": webhook_data.orderId,
-            "user_agent": webhook_data.userAgent,
-            "fbclid": webhook_data.fbclid,
-            "_fbc": webhook_data._fbc,
-            "_fbp": webhook_data._fbp,
-            "utm_source": webhook_data.utmSource,
-            "utm_medium": webhook_data.utmMedium,
-            "utm_campaign": webhook_data.utmCampaign,
-            "utmContent": webhook_data.utmContent,
-            "utmTerm": webhook_data.utmTerm,
-            "referrer": webhook_data.referrer,
-            "event_type": webhook_data.eventType,
-            "value": webhook_data.value,
-            "currency": webhook_data.currency,
-            "payment_method": webhook_data.paymentMethod,
-            "client_ip": client_ip,
-            "timestamp": datetime.utcnow().isoformat(),
-        }
-
-        # Save to Supabase
-        result = supabase.table('purchase_webhooks').insert(webhook_dict).execute()
+        webhook_dict = build_purchase_row(webhook_data)
 
-        if not result.data:
-            raise Exception("Failed to insert purchase webhook data")
+        # Save to Supabase; Hotmart retries carry the same transactionId
+        with stage('db_insert'):
+            status = await save_webhook_row(
+                'purchase_webhooks', webhook_dict,
+                dedupe_key=f"purchase:{webhook_data.transactionId}",
+            )
+        if status != "duplicate":
+            submit_conversion(webhook_dict, f"purchase:{webhook_data.transactionId}")
 
-        logger.info(f"Purchase webhook received: {webhook_data.email} - Transaction: {webhook_data.transactionId}")
-        logger.info(f"Purchase webhook data: {webhook_data}")
+        logger.info("Purchase webhook received", extra={
+            "sampled": True,
+            "email": webhook_data.email,
+            "transactionId": webhook_data.transactionId,
+            "eventType": webhook_data.eventType,
+            "utmSource": webhook_data.utmSource,
+            "status": status,
+        })
+        logger.debug("Purchase webhook data: %r", webhook_data)
 
         return {
             "success": True,
-            "message": "Purchase webhook processed successfully",
+            "message": "Duplicate purchase webhook ignored" if status == "duplicate" else "Purchase webhook processed successfully",
+            "queued": status == "queued",
+            "duplicate": status == "duplicate",
             "data": {
                 "email": webhook_data.email,
                 "transactionId": webhook_data.transactionId,
                 "eventType": webhook_data.eventType,
-                "clientIP": client_ip
+                "clientIP": webhook_dict["client_ip"]
             }
         }
 
+    except QueueFull as e:
+        webhook_errors.labels('purchase', 'queue_full').inc()
+        raise queue_full_error(e)
     except Exception as e:
-        logger.error(f"Error processing purchase webhook: {str(e)}")
+        webhook_errors.labels('purchase', 'error').inc()
+        logger.exception("Error processing purchase webhook: %s", e)
         return {"success": False, "error": str(e)}
 
+# Bulk ingestion: a JSON array, or NDJSON (Content-Type: application/x-ndjson)
+# processed as it streams in, of the same payloads as the single-event webhooks.
+# Rows are written directly in chunks, whatever WEBHOOK_INGESTION_MODE is.
+BULK_MAX_ITEMS = int(os.environ.get('BULK_MAX_ITEMS', '10000'))
+BULK_MAX_BYTES = int(os.environ.get('BULK_MAX_BYTES', str(32 * 1024 * 1024)))
+BULK_CHUNK_SIZE = int(os.environ.get('BULK_CHUNK_SIZE', '2000'))
+
+def bulk_lead_row(webhook_data: LeadCaptureWebhook, index: int, idempotency_header: Optional[str]):
+    # The batch's Idempotency-Key plus the item's position identifies each lead
+    idempotency_key = lead_idempotency_key(webhook_data, f"{idempotency_header}:{index}") if idempotency_header else None
+    row = build_lead_row(webhook_data, idempotency_key)
+    return row, f"lead:{idempotency_key}" if idempotency_key else None, f"lead:{idempotency_key or row['session_id']}"
+
+def bulk_purchase_row(webhook_data: PurchaseWebhook, index: int, idempotency_header: Optional[str]):
+    row = build_purchase_row(webhook_data)
+    key = f"purchase:{webhook_data.transactionId}"
+    return row, key, key
+
+# path -> (metrics label, table, payload model, list adapter, row builder)
+BULK_WEBHOOKS = {
+    'lead-capture': ('lead_capture', 'lead_webhooks', LeadCaptureWebhook,
+                     TypeAdapter(List[LeadCaptureWebhook]), bulk_lead_row),
+    'purchase': ('purchase', 'purchase_webhooks', PurchaseWebhook,
+                 TypeAdapter(List[PurchaseWebhook]), bulk_purchase_row),
+}
+
+async def insert_bulk_rows(table: str, rows: List[Dict[str, Any]]) -> set:
+    """Insert ``rows`` in one statement; returns the session_ids that were new."""
+    if pg.available:
+        columns = list(rows[0])
+        inserted = await pg.copy_upsert(
+            table, columns, bulk.copy_records(rows, columns), CONFLICT_KEYS[table], 'session_id'
+        )
+    else:
+        result = await db.execute(upsert_query(table, rows))
+        inserted = [row['session_id'] for row in result.data]
+    if inserted:
+        invalidations.publish('metric_totals')
+    return set(inserted)
+
+async def bulk_webhook(request: Request, path: str):
+    webhook, table, model, adapter, build_row = BULK_WEBHOOKS[path]
+    content_length = request.headers.get('content-length', '')
+    if content_length.isdigit() and int(content_length) > BULK_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_BYTES} bytes per batch")
+    idempotency_header = request.headers.get('Idempotency-Key')
+    results: List[Optional[Dict[str, Any]]] = []
+    counts = {"inserted": 0, "duplicate": 0, "invalid": 0, "error": 0}
+    pending: List[tuple] = []
+
+    def finish(index: int, status: str, **extra):
+        counts[status] += 1
+        results[index] = {"index": index, "status": status, **extra}
+
+    def accept(item: bulk.Item):
+        index = len(results)
+        results.append(None)
+        if isinstance(item, list):
+            finish(index, "invalid", errors=item)
+            return
+        row, dedupe_key, event_id = build_row(item, index, idempotency_header)
+        if dedupe_key is not None and not dedupe_cache.add(dedupe_key):
+            finish(index, "duplicate")
+            return
+        pending.append((index, row, dedupe_key, event_id))
+
+    async def flush():
+        if not pending:
+            return
+        chunk = pending[:]
+        pending.clear()
+        try:
+            with stage('db_insert'):
+                inserted = await insert_bulk_rows(table, [row for _, row, _, _ in chunk])
+        except Exception as e:
+            logger.exception("Error inserting %d %s rows: %s", len(chunk), table, e)
+            for index, _, dedupe_key, _ in chunk:
+                # Not stored, so a retry must not be treated as a duplicate
+                if dedupe_key is not None:
+                    dedupe_cache.discard(dedupe_key)
+                finish(index, "error", error=str(e))
+            return
+        for index, row, _, event_id in chunk:
+            if row['session_id'] in inserted:
+                finish(index, "inserted")
+                submit_conversion(row, event_id)
+            else:
+                finish(index, "duplicate")
+
+    status_code = 200
+    error = None
+    try:
+        if bulk.is_ndjson(request.headers.get('content-type', '')):
+            chunks = bulk.limit_body(request.stream(), BULK_MAX_BYTES)
+            async for item in bulk.iter_ndjson(chunks, model, BULK_MAX_ITEMS):
+                accept(item)
+                if len(pending) >= BULK_CHUNK_SIZE:
+                    await flush()
+        else:
+            body = await bulk.read_body(request.stream(), BULK_MAX_BYTES)
+            for item in bulk.validate_array(model, adapter, body, BULK_MAX_ITEMS):
+                accept(item)
+                if len(pending) >= BULK_CHUNK_SIZE:
+                    await flush()
+    except bulk.MalformedBody as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except (bulk.TooManyItems, bulk.BodyTooLarge) as e:
+        # NDJSON items before the limit have been processed; they are reported below
+        status_code, error = 413, str(e)
+    await flush()
+
+    if counts["invalid"]:
+        webhook_errors.labels(f'{webhook}_batch', 'invalid').inc(counts["invalid"])
+    if counts["error"]:
+        webhook_errors.labels(f'{webhook}_batch', 'error').inc(counts["error"])
+    logger.info(f"{webhook} batch processed", extra={
+        "received": len(results),
+        **counts,
+        "truncated": status_code == 413,
+    })
+    content = {
+        "success": status_code == 200 and counts["error"] == 0,
+        "received": len(results),
+        "inserted": counts["inserted"],
+        "duplicates": counts["duplicate"],
+        "invalid": counts["invalid"],
+        "errors": counts["error"],
+        "results": results,
+    }
+    if error is not None:
+        content["error"] = error
+    return FastJSONResponse(content, status_code=status_code)
+
 # Webhook endpoints
 @api_router.post("/webhooks/lead-capture")
 async def webhook_lead_capture(webhook_data: LeadCaptureWebhook, request: Request):
@@ -557,6 +1203,14 @@ async def webhook_lead_capture(webhook_data: LeadCaptureWebhook, request: Reques
 async def webhook_purchase(webhook_data: PurchaseWebhook, request: Request):
     return await purchase_webhook(webhook_data, request)
 
+@api_router.post("/webhooks/lead-capture/batch")
+async def webhook_lead_capture_batch(request: Request):
+    return await bulk_webhook(request, 'lead-capture')
+
+@api_router.post("/webhooks/purchase/batch")
+async def webhook_purchase_batch(request: Request):
+    return await bulk_webhook(request, 'purchase')
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -567,10 +1221,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Added last so it wraps CORS too and times the whole request
+app.add_middleware(MetricsMiddleware)
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+# Configure logging: records are formatted (as JSON, PII redacted) and written
+# by a background thread, so a log call on the request path only enqueues
+log_handler = setup_logging(
+    level=os.environ.get('LOG_LEVEL', 'INFO'),
+    json_output=os.environ.get('LOG_FORMAT', 'json') == 'json',
+    sample_rate=float(os.environ.get('LOG_SAMPLE_RATE', '1')),
+    queue_size=int(os.environ.get('LOG_QUEUE_SIZE', '10000')),
+)
+telemetry.registry.gauge_callback(
+    'log_records_dropped', 'Log records dropped because the log queue was full', lambda: log_handler.dropped
 )
 logger = logging.getLogger(__name__)
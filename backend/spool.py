@@ -0,0 +1,396 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import struct
+import time
+import uuid
+import zlib
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+InsertBatch = Callable[[str, List[Dict[str, Any]]], Awaitable[None]]
+
+# Every record is: payload length, crc32 of payload, JSON payload
+HEADER = struct.Struct('>II')
+
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class Spool:
+    """Append-only on-disk spool for accepted webhook rows.
+
+    ``append()`` writes the row to the active segment file and only returns
+    once it is on disk according to the fsync policy:
+
+    - ``always``: fsync before acknowledging (concurrent appends share one
+      write + fsync, so throughput does not collapse under load)
+    - ``interval``: fsync at most every ``fsync_interval`` seconds
+    - ``never``: leave flushing to the OS
+
+    A replayer task reads segments oldest-first and writes their rows to the
+    database in bulk through ``insert_batch``. Progress is kept in a
+    ``.ckpt`` file next to each segment, and fully replayed segments are
+    deleted. Replay is at-least-once: a crash between an insert and its
+    checkpoint replays that batch again. While the database is down the
+    replayer backs off and the spool keeps growing.
+
+    Several worker processes can share one directory. Each spool writes
+    and replays only its own segments (named after a random writer id) and
+    holds an ``flock`` on ``writer-<id>.lock`` while it is open. Segments
+    whose writer is gone (crashed, or stopped before replaying everything)
+    are adopted by taking that lock, but only while ``may_adopt()`` is
+    true, so one elected worker picks them up.
+    """
+
+    def __init__(
+        self,
+        directory,
+        insert_batch: InsertBatch,
+        fsync: str = 'always',
+        fsync_interval: float = 0.1,
+        segment_bytes: int = 16 * 1024 * 1024,
+        segment_max_age: float = 60.0,
+        replay_batch: int = 500,
+        replay_interval: float = 0.2,
+        may_adopt: Optional[Callable[[], bool]] = None,
+        adopt_interval: float = 5.0,
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy {fsync!r}, expected one of {FSYNC_POLICIES}")
+        self.directory = Path(directory)
+        self.insert_batch = insert_batch
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+        self.segment_bytes = segment_bytes
+        self.segment_max_age = segment_max_age
+        self.replay_batch = replay_batch
+        self.replay_interval = replay_interval
+        self.may_adopt = may_adopt or (lambda: True)
+        self.adopt_interval = adopt_interval
+        self.writer_id = uuid.uuid4().hex[:12]
+
+        self._owner_lock = None
+        self._adopted: Dict[str, Any] = {}
+        self._last_adopt_check = 0.0
+        self._pending: List[Tuple[bytes, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._writer_task = None
+        self._replay_task = None
+        self._file = None
+        self._active: Optional[Path] = None
+        self._next_seq = 0
+        self._segment_size = 0
+        self._segment_opened_at = 0.0
+        self._dirty = False
+        self._writing = False
+        self._last_fsync = 0.0
+
+        self.appended = 0
+        self.replayed = 0
+        self.pending_records = 0
+        self.replay_errors = 0
+        self.last_replay_at: Optional[float] = None
+        self._oldest_pending_ts: Optional[float] = None
+
+    # Segment files
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.directory.glob('segment-*.log'))
+
+    @staticmethod
+    def _owner(segment: Path) -> str:
+        # segment-<seq>-<writer id>.log; segments from before writer ids have no owner
+        parts = segment.stem.split('-')
+        return parts[2] if len(parts) > 2 else 'legacy'
+
+    def _lock_path(self, owner: str) -> Path:
+        return self.directory / f'writer-{owner}.lock'
+
+    def _try_lock(self, owner: str):
+        lock_file = open(self._lock_path(owner), 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        return lock_file
+
+    def _release(self, owner: str, lock_file, segments: List[Path]):
+        # Only remove the lock file once nothing refers to it, so two
+        # processes never end up holding locks on different files for one owner
+        if not any(self._owner(segment) == owner for segment in segments):
+            self._lock_path(owner).unlink(missing_ok=True)
+        lock_file.close()
+
+    def _checkpoint_path(self, segment: Path) -> Path:
+        return segment.with_suffix('.ckpt')
+
+    def _read_checkpoint(self, segment: Path) -> int:
+        try:
+            return int(self._checkpoint_path(segment).read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_checkpoint(self, segment: Path, offset: int):
+        path = self._checkpoint_path(segment)
+        tmp = path.with_suffix('.ckpt.tmp')
+        tmp.write_text(str(offset))
+        os.replace(tmp, path)
+
+    def _remove_segment(self, segment: Path):
+        segment.unlink(missing_ok=True)
+        self._checkpoint_path(segment).unlink(missing_ok=True)
+
+    def _read_records(self, segment: Path, offset: int, limit: int):
+        """Read up to ``limit`` consecutive records for a single table.
+
+        Returns (table, records, next_offset, corrupt). Stops early at a
+        partially written record, which is expected at the tail of the
+        active segment.
+        """
+        table = None
+        records = []
+        corrupt = False
+        with open(segment, 'rb') as f:
+            f.seek(offset)
+            while len(records) < limit:
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    break
+                length, crc = HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length:
+                    break
+                if zlib.crc32(payload) != crc:
+                    corrupt = True
+                    break
+                record = json.loads(payload)
+                if table is not None and record['table'] != table:
+                    break
+                table = record['table']
+                records.append(record)
+                offset += HEADER.size + length
+        return table, records, offset, corrupt
+
+    def _count_records(self, segment: Path, offset: int) -> int:
+        count = 0
+        while True:
+            _, records, offset, _ = self._read_records(segment, offset, 10000)
+            if not records:
+                return count
+            count += len(records)
+
+    # Appending
+
+    def _rotate(self):
+        if self._file is not None:
+            self._file.flush()
+            if self.fsync != 'never':
+                os.fsync(self._file.fileno())
+            self._file.close()
+        self._active = self.directory / f'segment-{self._next_seq:012d}-{self.writer_id}.log'
+        self._next_seq += 1
+        self._file = open(self._active, 'ab')
+        self._segment_size = 0
+        self._segment_opened_at = time.monotonic()
+        if self.fsync == 'always':
+            # Make the new directory entry durable too
+            dir_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+    def _write_records(self, records: List[bytes]):
+        if (
+            self._file is None
+            or self._segment_size >= self.segment_bytes
+            or time.monotonic() - self._segment_opened_at >= self.segment_max_age
+        ):
+            self._rotate()
+        data = b''.join(records)
+        self._file.write(data)
+        self._file.flush()
+        self._segment_size += len(data)
+        self._dirty = True
+        now = time.monotonic()
+        if self.fsync == 'always' or (self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval):
+            self._sync()
+
+    def _sync(self):
+        if self._file is not None and self._dirty:
+            os.fsync(self._file.fileno())
+            self._dirty = False
+            self._last_fsync = time.monotonic()
+
+    async def append(self, table: str, row: Dict[str, Any]):
+        payload = json.dumps(
+            {'table': table, 'row': row, 'ts': time.time()},
+            separators=(',', ':'),
+            default=str,
+        ).encode()
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((HEADER.pack(len(payload), zlib.crc32(payload)) + payload, future))
+        self._wakeup.set()
+        await future
+
+    async def _writer(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.fsync_interval)
+            except asyncio.TimeoutError:
+                if self.fsync == 'interval' and self._dirty:
+                    await asyncio.to_thread(self._sync)
+                continue
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            if not batch:
+                continue
+            self._writing = True
+            try:
+                await asyncio.to_thread(self._write_records, [record for record, _ in batch])
+            except Exception as e:
+                logger.error(f"Spool write of {len(batch)} records failed: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            finally:
+                self._writing = False
+            self.appended += len(batch)
+            self.pending_records += len(batch)
+            for _, future in batch:
+                if not future.done():
+                    future.set_result(None)
+
+    # Replaying
+
+    async def _adopt_orphans(self):
+        segments = self._segments()
+        owners = {self._owner(segment) for segment in segments}
+        for owner in owners - {self.writer_id} - set(self._adopted):
+            lock_file = self._try_lock(owner)
+            if lock_file is None:
+                continue
+            self._adopted[owner] = lock_file
+            for segment in segments:
+                if self._owner(segment) == owner:
+                    self.pending_records += await asyncio.to_thread(
+                        self._count_records, segment, self._read_checkpoint(segment)
+                    )
+            logger.info(f"Adopted spool segments of writer {owner}")
+        for owner in set(self._adopted) - owners:
+            self._release(owner, self._adopted.pop(owner), segments)
+
+    async def _replay_once(self) -> bool:
+        now = time.monotonic()
+        if now - self._last_adopt_check >= self.adopt_interval and self.may_adopt():
+            self._last_adopt_check = now
+            await self._adopt_orphans()
+        for segment in self._segments():
+            owner = self._owner(segment)
+            if owner != self.writer_id and owner not in self._adopted:
+                continue
+            offset = self._read_checkpoint(segment)
+            table, records, next_offset, corrupt = await asyncio.to_thread(
+                self._read_records, segment, offset, self.replay_batch
+            )
+            active = segment == self._active
+            if not records:
+                if corrupt and not active:
+                    logger.error(f"Corrupt record in {segment.name} at offset {offset}, quarantining segment")
+                    segment.rename(segment.with_suffix('.corrupt'))
+                    self._checkpoint_path(segment).unlink(missing_ok=True)
+                    continue
+                if active:
+                    # Drained for now; adopted segments may sort after it
+                    continue
+                # Sealed and fully replayed
+                self._remove_segment(segment)
+                continue
+
+            self._oldest_pending_ts = records[0]['ts']
+            await self.insert_batch(table, [record['row'] for record in records])
+            self._write_checkpoint(segment, next_offset)
+            self.replayed += len(records)
+            self.pending_records = max(self.pending_records - len(records), 0)
+            self.last_replay_at = time.time()
+            self._oldest_pending_ts = None
+            return True
+        return False
+
+    async def _replayer(self):
+        delay = self.replay_interval
+        while True:
+            try:
+                progressed = await self._replay_once()
+                delay = self.replay_interval
+            except Exception as e:
+                self.replay_errors += 1
+                logger.error(f"Spool replay failed, retrying in {delay}s: {e}")
+                progressed = False
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            if not progressed:
+                await asyncio.sleep(self.replay_interval)
+
+    # Lifecycle
+
+    async def open(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        segments = self._segments()
+        if segments:
+            self._next_seq = max(int(segment.stem.split('-')[1]) for segment in segments) + 1
+        self._owner_lock = self._try_lock(self.writer_id)
+        if self.may_adopt():
+            self._last_adopt_check = time.monotonic()
+            await self._adopt_orphans()
+        self._writer_task = asyncio.create_task(self._writer())
+        self._replay_task = asyncio.create_task(self._replayer())
+
+    async def close(self):
+        # Let queued appends reach the file, then stop; anything not yet
+        # replayed stays on disk for the next start.
+        while self._pending or self._writing:
+            await asyncio.sleep(0.01)
+        for task in (self._replay_task, self._writer_task):
+            if task is not None:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._file is not None:
+            self._file.flush()
+            if self.fsync != 'never':
+                os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+        # Whatever is left unreplayed can now be adopted by another worker
+        segments = self._segments()
+        for owner, lock_file in list(self._adopted.items()):
+            self._release(owner, lock_file, segments)
+        self._adopted = {}
+        if self._owner_lock is not None:
+            self._release(self.writer_id, self._owner_lock, segments)
+            self._owner_lock = None
+
+    def stats(self) -> Dict[str, Any]:
+        lag = time.time() - self._oldest_pending_ts if self._oldest_pending_ts else 0.0
+        segments = self._segments()
+        return {
+            "depth": self.pending_records,
+            "segments": len(segments),
+            "bytes": sum(segment.stat().st_size for segment in segments),
+            "appended": self.appended,
+            "replayed": self.replayed,
+            "replayErrors": self.replay_errors,
+            "replayLagSeconds": round(lag, 3),
+            "lastReplayAt": self.last_replay_at,
+            "writer": self.writer_id,
+            "adoptedWriters": sorted(self._adopted),
+        }
@@ -0,0 +1,340 @@
+import asyncio
+import math
+import time
+from bisect import bisect_left
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from fastapi.routing import APIRoute
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def log_linear_bounds(low_exp: int = -16, high_exp: int = 6, steps: Tuple[float, ...] = (1.0, 1.5)) -> List[float]:
+    """HDR-style bucket bounds: each power of two split into ``steps``.
+
+    The defaults go from ~15us to 64s with at most 50% between bounds, so
+    quantiles read from the buckets are within that relative error at any
+    scale, with a fixed 45 buckets.
+    """
+    return [step * 2.0 ** exp for exp in range(low_exp, high_exp) for step in steps] + [2.0 ** high_exp]
+
+
+BUCKET_BOUNDS = log_linear_bounds()
+
+
+class Counter:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+
+class Gauge:
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class Timer:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram: 'Histogram'):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Histogram:
+    """Fixed-bucket histogram of durations in seconds.
+
+    Recording is one bisect and two additions, no allocation and no lock:
+    everything that records runs on the event loop.
+    """
+
+    __slots__ = ('bounds', 'counts', 'sum')
+
+    def __init__(self, bounds: List[float] = BUCKET_BOUNDS):
+        self.bounds = bounds
+        # One extra slot for values above the last bound (+Inf)
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+
+    def time(self) -> Timer:
+        return Timer(self)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile (0 when empty)."""
+        total = self.count
+        if not total:
+            return 0.0
+        rank = max(math.ceil(q * total), 1)
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else math.inf
+        return math.inf
+
+
+def escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = '') -> str:
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class Family:
+    """A metric and its children, one per combination of label values."""
+
+    def __init__(self, kind: str, name: str, help: str, label_names: Tuple[str, ...], factory: Callable[[], Any]):
+        self.kind = kind
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.factory = factory
+        self.children: Dict[Tuple[str, ...], Any] = {}
+
+    def labels(self, *values: str):
+        child = self.children.get(values)
+        if child is None:
+            if len(values) != len(self.label_names):
+                raise ValueError(f"{self.name} expects labels {self.label_names}, got {values}")
+            child = self.children[values] = self.factory()
+        return child
+
+    def render(self) -> Iterable[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for values, child in sorted(self.children.items()):
+            if self.kind != 'histogram':
+                yield f'{self.name}{format_labels(self.label_names, values)} {format_value(child.value)}'
+                continue
+            if not any(child.counts):
+                # Stages a route has never run (e.g. validation on a 422) would only add noise
+                continue
+            cumulative = 0
+            for bound, count in zip(child.bounds + [math.inf], child.counts):
+                cumulative += count
+                le = f'le="{format_value(bound)}"'
+                yield f'{self.name}_bucket{format_labels(self.label_names, values, le)} {cumulative}'
+            yield f'{self.name}_sum{format_labels(self.label_names, values)} {format_value(child.sum)}'
+            yield f'{self.name}_count{format_labels(self.label_names, values)} {cumulative}'
+
+
+class CallbackGauge:
+    """Gauge read from a callback at scrape time; skipped when it returns None."""
+
+    def __init__(self, name: str, help: str, read: Callable[[], Optional[float]]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> Iterable[str]:
+        value = self.read()
+        if value is None:
+            return
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} gauge'
+        yield f'{self.name} {format_value(value)}'
+
+
+class Registry:
+    """In-process metrics rendered in the Prometheus text format.
+
+    Children are created on first use of a label combination and live for
+    the life of the process, so label values must come from a small fixed
+    set (route templates, stage names), never from request data.
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+
+    def _family(self, kind: str, name: str, help: str, labels: Tuple[str, ...], factory) -> Family:
+        family = self._metrics.get(name)
+        if family is None:
+            family = self._metrics[name] = Family(kind, name, help, tuple(labels), factory)
+        elif family.kind != kind:
+            raise ValueError(f"{name} is already registered as a {family.kind}")
+        return family
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Family:
+        return self._family('counter', name, help, labels, Counter)
+
+    def gauge(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Family:
+        return self._family('gauge', name, help, labels, Gauge)
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Family:
+        return self._family('histogram', name, help, labels, Histogram)
+
+    def gauge_callback(self, name: str, help: str, read: Callable[[], Optional[float]]):
+        self._metrics[name] = CallbackGauge(name, help, read)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+# Process-wide registry served by /api/internal/metrics
+registry = Registry()
+
+http_requests = registry.counter('http_requests_total', 'HTTP requests by route and status', ('method', 'route', 'status'))
+http_duration = registry.histogram('http_request_duration_seconds', 'HTTP request duration until the response is sent', ('method', 'route'))
+http_in_flight = registry.gauge('http_requests_in_flight', 'HTTP requests being handled').labels()
+stage_duration = registry.histogram('http_stage_duration_seconds', 'Time spent in each stage of a request', ('route', 'stage'))
+
+
+class RequestTiming:
+    __slots__ = ('route', 'started', 'handler_done')
+
+    def __init__(self, route: str):
+        self.route = route
+        self.started = time.perf_counter()
+        self.handler_done = None
+
+
+_current_request: ContextVar[Optional[RequestTiming]] = ContextVar('current_request', default=None)
+
+
+def stage(name: str):
+    """Time a block as stage ``name`` of the current request.
+
+    ``with stage('db'): ...`` inside a route handler; a no-op outside one.
+    """
+    timing = _current_request.get()
+    if timing is None:
+        return nullcontext()
+    return Timer(stage_duration.labels(timing.route, name))
+
+
+class TimedRoute(APIRoute):
+    """APIRoute that records the validation, handler and serialization stages.
+
+    validation: from the start of the request (body read included) until the
+    endpoint is called; handler: the endpoint itself; serialization: from
+    the endpoint's return until the response object is ready.
+    """
+
+    def get_route_handler(self):
+        validation = stage_duration.labels(self.path, 'validation')
+        handler_time = stage_duration.labels(self.path, 'handler')
+        serialization = stage_duration.labels(self.path, 'serialization')
+        call = self.dependant.call
+        if asyncio.iscoroutinefunction(call) and not getattr(call, 'timed', False):
+            async def timed_call(**values):
+                timing = _current_request.get()
+                started = time.perf_counter()
+                if timing is not None:
+                    validation.observe(started - timing.started)
+                try:
+                    return await call(**values)
+                finally:
+                    done = time.perf_counter()
+                    handler_time.observe(done - started)
+                    if timing is not None:
+                        timing.handler_done = done
+
+            timed_call.timed = True
+            self.dependant.call = timed_call
+
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def timed_handler(request):
+            timing = RequestTiming(path)
+            token = _current_request.set(timing)
+            try:
+                response = await handler(request)
+            finally:
+                _current_request.reset(token)
+            if timing.handler_done is not None:
+                serialization.observe(time.perf_counter() - timing.handler_done)
+            return response
+
+        return timed_handler
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests and timing them per route template.
+
+    Requests that match no route are grouped under "unmatched" so scanners
+    can't create a label per path. Each (method, route) keeps its histogram
+    and per-status counters together, so a request costs one lookup.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._series: Dict[Tuple[str, str], Tuple[Histogram, Dict[int, Counter]]] = {}
+
+    def _series_for(self, method: str, path: str):
+        series = self._series.get((method, path))
+        if series is None:
+            series = self._series[(method, path)] = (http_duration.labels(method, path), {})
+        return series
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        http_in_flight.value += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.value -= 1
+            route = scope.get('route')
+            path = route.path if route is not None else 'unmatched'
+            histogram, by_status = self._series_for(scope['method'], path)
+            histogram.observe(elapsed)
+            counter = by_status.get(status)
+            if counter is None:
+                counter = by_status[status] = http_requests.labels(scope['method'], path, str(status))
+            counter.value += 1
@@ -0,0 +1,115 @@
+import uuid
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel, Field
+
+
+# Payloads the lead-capture and purchase webhooks accept; the batch endpoints
+# and importer.py take the same fields
+class LeadCaptureWebhook(BaseModel):
+    name: str
+    email: str
+    whatsapp: Optional[str] = None
+    userAgent: Optional[str] = None
+    fbclid: Optional[str] = None
+    # Sent as _fbc/_fbp (the cookie names); Pydantic ignores fields starting with "_"
+    fbc: Optional[str] = Field(None, alias='_fbc')
+    fbp: Optional[str] = Field(None, alias='_fbp')
+    utmSource: Optional[str] = None
+    utmMedium: Optional[str] = None
+    utmCampaign: Optional[str] = None
+    utmContent: Optional[str] = None
+    utmTerm: Optional[str] = None
+    referrer: Optional[str] = None
+    currentUrl: Optional[str] = None
+    quizAnswers: Optional[Dict[str, Any]] = None
+    bucketId: Optional[str] = None
+    eventType: str = "InitiateCheckout"
+    value: float = 15.0
+    currency: str = "USD"
+    client_ip: Optional[str] = None
+
+
+class PurchaseWebhook(BaseModel):
+    name: str
+    email: str
+    whatsapp: Optional[str] = None
+    transactionId: str
+    orderId: Optional[str] = None
+    userAgent: Optional[str] = None
+    fbclid: Optional[str] = None
+    # Sent as _fbc/_fbp (the cookie names); Pydantic ignores fields starting with "_"
+    fbc: Optional[str] = Field(None, alias='_fbc')
+    fbp: Optional[str] = Field(None, alias='_fbp')
+    utmSource: Optional[str] = None
+    utmMedium: Optional[str] = None
+    utmCampaign: Optional[str] = None
+    utmContent: Optional[str] = None
+    utmTerm: Optional[str] = None
+    referrer: Optional[str] = None
+    currentUrl: Optional[str] = None
+    eventType: str = "Purchase"
+    value: float = 15.0
+    currency: str = "USD"
+    paymentMethod: str = "hotmart"
+    client_ip: Optional[str] = None
+
+
+# Map webhook payloads to table rows
+def build_lead_row(webhook_data: LeadCaptureWebhook, idempotency_key: Optional[str] = None) -> Dict[str, Any]:
+    return {
+        "session_id": str(uuid.uuid4()),
+        "idempotency_key": idempotency_key,
+        "name": webhook_data.name,
+        "email": webhook_data.email,
+        "whatsapp": webhook_data.whatsapp,
+        "user_agent": webhook_data.userAgent,
+        "fbclid": webhook_data.fbclid,
+        "_fbc": webhook_data.fbc,
+        "_fbp": webhook_data.fbp,
+        "utm_source": webhook_data.utmSource,
+        "utm_medium": webhook_data.utmMedium,
+        "utm_campaign": webhook_data.utmCampaign,
+        "utm_content": webhook_data.utmContent,
+        "utm_term": webhook_data.utmTerm,
+        "referrer": webhook_data.referrer,
+        "current_url": webhook_data.currentUrl,
+        "quiz_answers": webhook_data.quizAnswers or {},
+        "bucket_id": webhook_data.bucketId,
+        "event_type": webhook_data.eventType,
+        "value": webhook_data.value,
+        "currency": webhook_data.currency,
+        # Prioritize client_ip from webhook data
+        "client_ip": webhook_data.client_ip,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
+
+def build_purchase_row(webhook_data: PurchaseWebhook) -> Dict[str, Any]:
+    return {
+        "session_id": str(uuid.uuid4()),
+        "name": webhook_data.name,
+        "email": webhook_data.email,
+        "whatsapp": webhook_data.whatsapp,
+        "transaction_id": webhook_data.transactionId,
+        "order_id": webhook_data.orderId,
+        "user_agent": webhook_data.userAgent,
+        "fbclid": webhook_data.fbclid,
+        "_fbc": webhook_data.fbc,
+        "_fbp": webhook_data.fbp,
+        "utm_source": webhook_data.utmSource,
+        "utm_medium": webhook_data.utmMedium,
+        "utm_campaign": webhook_data.utmCampaign,
+        "utm_content": webhook_data.utmContent,
+        "utm_term": webhook_data.utmTerm,
+        "referrer": webhook_data.referrer,
+        "current_url": webhook_data.currentUrl,
+        "event_type": webhook_data.eventType,
+        "value": webhook_data.value,
+        "currency": webhook_data.currency,
+        "payment_method": webhook_data.paymentMethod,
+        # Prioritize client_ip from webhook data
+        "client_ip": webhook_data.client_ip,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
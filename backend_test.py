@@ -4,6 +4,7 @@ Backend API Testing Script for Webhook Configuration System
 Tests webhook endpoints and configuration system functionality
 """
 
+import os
 import requests
 import json
 import sys
@@ -13,7 +14,8 @@ from datetime import datetime
 import uuid
 
 # Use the production backend URL from frontend/.env
-BACKEND_URL = "https://7eadbe52-edd5-43c9-b30b-93260710090a.preview.emergentagent.com"
+# Set BACKEND_URL=http://localhost:8001 to test a local server
+BACKEND_URL = os.environ.get('BACKEND_URL', "https://7eadbe52-edd5-43c9-b30b-93260710090a.preview.emergentagent.com")
 
 def test_webhook_lead_capture():
     """Test POST /api/webhooks/lead-capture endpoint"""
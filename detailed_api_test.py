@@ -3,10 +3,12 @@
 Detailed API Testing - Verify data structure and content
 """
 
+import os
 import requests
 import json
 
-BACKEND_URL = "https://aura-fashion-quiz.preview.emergentagent.com"
+# Set BACKEND_URL=http://localhost:8001 to test a local server
+BACKEND_URL = os.environ.get('BACKEND_URL', "https://aura-fashion-quiz.preview.emergentagent.com")
 
 def detailed_test():
     print("🔍 DETAILED API STRUCTURE VERIFICATION")
@@ -0,0 +1,24 @@
+/*
+  # Idempotent webhook ingestion
+
+  1. Changes
+    - `purchase_webhooks.transaction_id` becomes unique so retried purchase
+      webhooks are ignored by the upsert (existing duplicates are removed,
+      keeping the earliest row)
+    - `lead_webhooks.idempotency_key` (text, unique) for leads sent with an
+      `Idempotency-Key` header
+*/
+
+DELETE FROM purchase_webhooks p
+USING purchase_webhooks d
+WHERE p.transaction_id = d.transaction_id
+  AND (p.created_at, p.id) > (d.created_at, d.id);
+
+-- The unique constraint's index replaces the plain lookup index
+DROP INDEX IF EXISTS idx_purchase_webhooks_transaction_id;
+ALTER TABLE purchase_webhooks
+  ADD CONSTRAINT purchase_webhooks_transaction_id_key UNIQUE (transaction_id);
+
+ALTER TABLE lead_webhooks ADD COLUMN IF NOT EXISTS idempotency_key text;
+ALTER TABLE lead_webhooks
+  ADD CONSTRAINT lead_webhooks_idempotency_key_key UNIQUE (idempotency_key);
@@ -0,0 +1,103 @@
+/*
+  # Maintained webhook counters
+
+  1. New Tables
+    - `webhook_counters`
+      - `name` (text, primary key): `leads` or `purchases`
+      - `value` (bigint): current row count
+      - `updated_at` (timestamptz)
+
+  2. Triggers
+    - Statement-level insert/delete triggers on `lead_webhooks` and
+      `purchase_webhooks` add the number of affected rows, so a multi-row
+      insert costs a single counter update.
+
+  3. Functions
+    - `reconcile_webhook_counters()` recounts both tables and fixes any
+      drift; returns the corrected counters.
+
+  4. Security
+    - Enable RLS on `webhook_counters` table
+    - Add policy for service role access
+*/
+
+CREATE TABLE IF NOT EXISTS webhook_counters (
+  name text PRIMARY KEY,
+  value bigint NOT NULL DEFAULT 0,
+  updated_at timestamptz DEFAULT now()
+);
+
+ALTER TABLE webhook_counters ENABLE ROW LEVEL SECURITY;
+
+-- Policy for service role access (backend API)
+CREATE POLICY "Service role can manage webhook counters"
+  ON webhook_counters
+  FOR ALL
+  TO service_role
+  USING (true)
+  WITH CHECK (true);
+
+INSERT INTO webhook_counters (name, value)
+SELECT 'leads', count(*) FROM lead_webhooks
+UNION ALL
+SELECT 'purchases', count(*) FROM purchase_webhooks
+ON CONFLICT (name) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_webhook_counter()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    UPDATE webhook_counters
+    SET value = value + (SELECT count(*) FROM new_rows), updated_at = now()
+    WHERE name = TG_ARGV[0];
+  ELSE
+    UPDATE webhook_counters
+    SET value = value - (SELECT count(*) FROM old_rows), updated_at = now()
+    WHERE name = TG_ARGV[0];
+  END IF;
+  RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS count_lead_webhooks_insert ON lead_webhooks;
+CREATE TRIGGER count_lead_webhooks_insert
+AFTER INSERT ON lead_webhooks
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_webhook_counter('leads');
+
+DROP TRIGGER IF EXISTS count_lead_webhooks_delete ON lead_webhooks;
+CREATE TRIGGER count_lead_webhooks_delete
+AFTER DELETE ON lead_webhooks
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_webhook_counter('leads');
+
+DROP TRIGGER IF EXISTS count_purchase_webhooks_insert ON purchase_webhooks;
+CREATE TRIGGER count_purchase_webhooks_insert
+AFTER INSERT ON purchase_webhooks
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_webhook_counter('purchases');
+
+DROP TRIGGER IF EXISTS count_purchase_webhooks_delete ON purchase_webhooks;
+CREATE TRIGGER count_purchase_webhooks_delete
+AFTER DELETE ON purchase_webhooks
+REFERENCING OLD TABLE AS old_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION bump_webhook_counter('purchases');
+
+-- Inserts that commit while the recount runs can leave a small drift;
+-- the next reconciliation picks it up.
+CREATE OR REPLACE FUNCTION reconcile_webhook_counters()
+RETURNS SETOF webhook_counters AS $$
+  UPDATE webhook_counters c
+  SET value = actual.value, updated_at = now()
+  FROM (
+    SELECT 'leads' AS name, count(*) AS value FROM lead_webhooks
+    UNION ALL
+    SELECT 'purchases', count(*) FROM purchase_webhooks
+  ) actual
+  WHERE c.name = actual.name AND c.value <> actual.value
+  RETURNING c.*;
+$$ language 'sql';
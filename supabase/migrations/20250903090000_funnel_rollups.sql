@@ -0,0 +1,204 @@
+/*
+  # Funnel rollups
+
+  1. New Tables
+    - `funnel_rollups`
+      - `granularity` (text): `hour` or `day`
+      - `bucket_start` (timestamptz): start of the UTC hour/day
+      - `visitors`, `quiz_started`, `quiz_completed`, `leads`, `purchases`
+        (bigint): events that happened in the bucket
+
+  2. Triggers
+    - Statement-level triggers add new events to both the hourly and the
+      daily bucket:
+      - `visitors` insert (first visit of a session)
+      - `quiz_tracking` insert/update (quiz_started / quiz_completed
+        turning true)
+      - `lead_webhooks` / `purchase_webhooks` insert
+
+  3. Functions
+    - `add_to_funnel_rollups(metric, event_times)` upserts a set of events
+    - `funnel_rollup_totals(granularity, from, to)` sums buckets in a range
+      (NULL bounds are open)
+
+  4. Security
+    - Enable RLS on `funnel_rollups` table
+    - Add policy for service role access
+    - The frontend writes `visitors` and `quiz_tracking` with the anon key,
+      so the trigger functions are SECURITY DEFINER (with a fixed
+      `search_path`) to update `funnel_rollups` past its RLS; EXECUTE on
+      them and on `add_to_funnel_rollups` is revoked from PUBLIC, `anon`
+      and `authenticated`
+*/
+
+CREATE TABLE IF NOT EXISTS funnel_rollups (
+  granularity text NOT NULL CHECK (granularity IN ('hour', 'day')),
+  bucket_start timestamptz NOT NULL,
+  visitors bigint NOT NULL DEFAULT 0,
+  quiz_started bigint NOT NULL DEFAULT 0,
+  quiz_completed bigint NOT NULL DEFAULT 0,
+  leads bigint NOT NULL DEFAULT 0,
+  purchases bigint NOT NULL DEFAULT 0,
+  PRIMARY KEY (granularity, bucket_start)
+);
+
+ALTER TABLE funnel_rollups ENABLE ROW LEVEL SECURITY;
+
+-- Policy for service role access (backend API)
+CREATE POLICY "Service role can manage funnel rollups"
+  ON funnel_rollups
+  FOR ALL
+  TO service_role
+  USING (true)
+  WITH CHECK (true);
+
+CREATE OR REPLACE FUNCTION add_to_funnel_rollups(metric text, event_times timestamptz[])
+RETURNS void AS $$
+  INSERT INTO funnel_rollups AS r
+    (granularity, bucket_start, visitors, quiz_started, quiz_completed, leads, purchases)
+  SELECT
+    g.granularity,
+    date_trunc(g.granularity, t, 'UTC'),
+    count(*) FILTER (WHERE metric = 'visitors'),
+    count(*) FILTER (WHERE metric = 'quiz_started'),
+    count(*) FILTER (WHERE metric = 'quiz_completed'),
+    count(*) FILTER (WHERE metric = 'leads'),
+    count(*) FILTER (WHERE metric = 'purchases')
+  FROM unnest(event_times) AS t
+  CROSS JOIN (VALUES ('hour'), ('day')) AS g(granularity)
+  GROUP BY 1, 2
+  ON CONFLICT (granularity, bucket_start) DO UPDATE SET
+    visitors = r.visitors + EXCLUDED.visitors,
+    quiz_started = r.quiz_started + EXCLUDED.quiz_started,
+    quiz_completed = r.quiz_completed + EXCLUDED.quiz_completed,
+    leads = r.leads + EXCLUDED.leads,
+    purchases = r.purchases + EXCLUDED.purchases;
+$$ language 'sql';
+
+CREATE OR REPLACE FUNCTION funnel_rollup_totals(
+  p_granularity text DEFAULT 'day',
+  p_from timestamptz DEFAULT NULL,
+  p_to timestamptz DEFAULT NULL
+)
+RETURNS TABLE (
+  visitors bigint,
+  quiz_started bigint,
+  quiz_completed bigint,
+  leads bigint,
+  purchases bigint
+) AS $$
+  SELECT
+    coalesce(sum(visitors), 0)::bigint,
+    coalesce(sum(quiz_started), 0)::bigint,
+    coalesce(sum(quiz_completed), 0)::bigint,
+    coalesce(sum(leads), 0)::bigint,
+    coalesce(sum(purchases), 0)::bigint
+  FROM funnel_rollups
+  WHERE granularity = p_granularity
+    AND (p_from IS NULL OR bucket_start >= p_from)
+    AND (p_to IS NULL OR bucket_start < p_to);
+$$ language 'sql' STABLE;
+
+-- Trigger functions
+
+CREATE OR REPLACE FUNCTION rollup_visitors_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM add_to_funnel_rollups('visitors', ARRAY(SELECT coalesce(first_visit, now()) FROM new_rows));
+  RETURN NULL;
+END;
+$$ language 'plpgsql' SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION rollup_webhooks_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM add_to_funnel_rollups(TG_ARGV[0], ARRAY(SELECT coalesce(created_at, now()) FROM new_rows));
+  RETURN NULL;
+END;
+$$ language 'plpgsql' SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION rollup_quiz_tracking_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM add_to_funnel_rollups('quiz_started', ARRAY(
+    SELECT coalesce(start_timestamp, now()) FROM new_rows WHERE quiz_started
+  ));
+  PERFORM add_to_funnel_rollups('quiz_completed', ARRAY(
+    SELECT coalesce(completion_timestamp, now()) FROM new_rows WHERE quiz_completed
+  ));
+  RETURN NULL;
+END;
+$$ language 'plpgsql' SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION rollup_quiz_tracking_update()
+RETURNS TRIGGER AS $$
+BEGIN
+  -- Only count the transition to true, not every later update of the session
+  PERFORM add_to_funnel_rollups('quiz_started', ARRAY(
+    SELECT coalesce(n.start_timestamp, now())
+    FROM new_rows n JOIN old_rows o USING (session_id)
+    WHERE n.quiz_started AND o.quiz_started IS NOT TRUE
+  ));
+  PERFORM add_to_funnel_rollups('quiz_completed', ARRAY(
+    SELECT coalesce(n.completion_timestamp, now())
+    FROM new_rows n JOIN old_rows o USING (session_id)
+    WHERE n.quiz_completed AND o.quiz_completed IS NOT TRUE
+  ));
+  RETURN NULL;
+END;
+$$ language 'plpgsql' SECURITY DEFINER SET search_path = public;
+
+-- Only the triggers (and the service role) update the rollups
+REVOKE EXECUTE ON FUNCTION
+  add_to_funnel_rollups(text, timestamptz[]),
+  rollup_visitors_insert(),
+  rollup_webhooks_insert(),
+  rollup_quiz_tracking_insert(),
+  rollup_quiz_tracking_update()
+FROM PUBLIC, anon, authenticated;
+
+DROP TRIGGER IF EXISTS rollup_visitors_insert ON visitors;
+CREATE TRIGGER rollup_visitors_insert
+AFTER INSERT ON visitors
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION rollup_visitors_insert();
+
+DROP TRIGGER IF EXISTS rollup_quiz_tracking_insert ON quiz_tracking;
+CREATE TRIGGER rollup_quiz_tracking_insert
+AFTER INSERT ON quiz_tracking
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION rollup_quiz_tracking_insert();
+
+DROP TRIGGER IF EXISTS rollup_quiz_tracking_update ON quiz_tracking;
+CREATE TRIGGER rollup_quiz_tracking_update
+AFTER UPDATE ON quiz_tracking
+REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION rollup_quiz_tracking_update();
+
+DROP TRIGGER IF EXISTS rollup_lead_webhooks_insert ON lead_webhooks;
+CREATE TRIGGER rollup_lead_webhooks_insert
+AFTER INSERT ON lead_webhooks
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION rollup_webhooks_insert('leads');
+
+DROP TRIGGER IF EXISTS rollup_purchase_webhooks_insert ON purchase_webhooks;
+CREATE TRIGGER rollup_purchase_webhooks_insert
+AFTER INSERT ON purchase_webhooks
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION rollup_webhooks_insert('purchases');
+
+-- Backfill from existing rows
+SELECT add_to_funnel_rollups('visitors', ARRAY(SELECT coalesce(first_visit, now()) FROM visitors));
+SELECT add_to_funnel_rollups('quiz_started', ARRAY(
+  SELECT coalesce(start_timestamp, created_at, now()) FROM quiz_tracking WHERE quiz_started
+));
+SELECT add_to_funnel_rollups('quiz_completed', ARRAY(
+  SELECT coalesce(completion_timestamp, updated_at, now()) FROM quiz_tracking WHERE quiz_completed
+));
+SELECT add_to_funnel_rollups('leads', ARRAY(SELECT coalesce(created_at, now()) FROM lead_webhooks));
+SELECT add_to_funnel_rollups('purchases', ARRAY(SELECT coalesce(created_at, now()) FROM purchase_webhooks));
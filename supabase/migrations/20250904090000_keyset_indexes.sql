@@ -0,0 +1,11 @@
+/*
+  # Keyset pagination indexes
+
+  1. Indexes
+    - `(created_at DESC, id DESC)` on `lead_webhooks` and `purchase_webhooks`,
+      matching the order used by the streaming exports, so each page is a
+      single index range scan.
+*/
+
+CREATE INDEX IF NOT EXISTS idx_lead_webhooks_created_at_id ON lead_webhooks(created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_purchase_webhooks_created_at_id ON purchase_webhooks(created_at DESC, id DESC);
@@ -0,0 +1,16 @@
+/*
+  # Listing filter indexes
+
+  1. Indexes
+    - `(utm_source | utm_campaign, created_at DESC, id DESC)` on `lead_webhooks`
+      and `purchase_webhooks`, and `(bucket_id, created_at DESC, id DESC)` on
+      `lead_webhooks`, so a filtered /api/leads or /api/purchases page is still
+      a single index range scan in keyset order instead of walking the whole
+      `created_at` index looking for matches.
+*/
+
+CREATE INDEX IF NOT EXISTS idx_lead_webhooks_utm_source_created_at_id ON lead_webhooks(utm_source, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_lead_webhooks_utm_campaign_created_at_id ON lead_webhooks(utm_campaign, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_lead_webhooks_bucket_id_created_at_id ON lead_webhooks(bucket_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_purchase_webhooks_utm_source_created_at_id ON purchase_webhooks(utm_source, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_purchase_webhooks_utm_campaign_created_at_id ON purchase_webhooks(utm_campaign, created_at DESC, id DESC);
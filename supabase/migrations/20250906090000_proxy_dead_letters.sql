@@ -0,0 +1,41 @@
+/*
+  # Dead letters for proxied webhooks
+
+  1. New Tables
+    - `proxy_dead_letters`
+      - `id` (uuid, primary key): the delivery id returned by /api/proxy-webhook
+      - `target_url` (text)
+      - `payload` (jsonb): the webhook body that could not be delivered
+      - `attempts` (integer)
+      - `last_status_code` (integer, nullable)
+      - `last_error` (text, nullable)
+      - `created_at` (timestamptz): when the delivery was accepted
+      - `failed_at` (timestamptz): when it was given up on
+
+  2. Security
+    - Enable RLS on `proxy_dead_letters` table
+    - Add policy for service role access
+*/
+
+CREATE TABLE IF NOT EXISTS proxy_dead_letters (
+  id uuid PRIMARY KEY,
+  target_url text NOT NULL,
+  payload jsonb NOT NULL DEFAULT '{}',
+  attempts integer NOT NULL DEFAULT 0,
+  last_status_code integer,
+  last_error text,
+  created_at timestamptz NOT NULL,
+  failed_at timestamptz DEFAULT now()
+);
+
+ALTER TABLE proxy_dead_letters ENABLE ROW LEVEL SECURITY;
+
+-- Policy for service role access (backend API)
+CREATE POLICY "Service role can manage proxy dead letters"
+  ON proxy_dead_letters
+  FOR ALL
+  TO service_role
+  USING (true)
+  WITH CHECK (true);
+
+CREATE INDEX IF NOT EXISTS idx_proxy_dead_letters_failed_at ON proxy_dead_letters(failed_at DESC);
@@ -0,0 +1,296 @@
+/*
+  # Lead-to-purchase attribution
+
+  1. New Tables
+    - `purchase_attributions`: the lead each purchase is attributed to,
+      resolved once when the purchase (or a matching lead) is inserted
+      - `purchase_id` (uuid, primary key)
+      - `lead_id` (uuid, nullable): NULL when no lead matched
+      - `matched_by` (text): `fbclid`, `_fbc`, `_fbp`, `email` or `none`
+      - `purchased_at` (timestamptz), `value` (numeric), `currency` (text)
+      - `utm_source`, `utm_medium`, `utm_campaign`, `bucket_id` (text): the
+        lead's, or the purchase's own UTMs when unattributed ('' when unset)
+      - `quiz_answers` (jsonb): the lead's quiz answers
+    - `attribution_rollups`: leads, purchases and revenue per UTC day and
+      `utm_source` × `utm_medium` × `utm_campaign` × `bucket_id`
+      - `leads` (bigint): leads created that day
+      - `purchases`, `attributed_purchases` (bigint), `revenue` (numeric):
+        purchases made that day, and how many of them matched a lead
+
+  2. Matching
+    - The latest lead created within `attribution_window()` (30 days) before
+      the purchase, matched by the first of `fbclid`, `_fbc`, `_fbp` (the
+      browser id) and email (case-insensitive) that finds one. `session_id`
+      is generated server-side for every webhook row, so it never links a
+      purchase to a lead.
+    - Each lookup is an index range scan; partial indexes below.
+    - The lead's quiz answers are copied to `purchase_webhooks.quiz_answers`,
+      which the purchase listing and CSV export already show.
+
+  3. Triggers
+    - `purchase_webhooks` insert: attribute the new purchases
+    - `lead_webhooks` insert: count the leads, and re-attribute purchases
+      made after a matching new lead (late lead webhooks, imports)
+
+  4. Functions
+    - `attribute_purchases(purchase_ids, window)` (re)resolves purchases and
+      keeps the rollups in step
+    - `attribution_report(group_by, from, to)` sums the rollups over a range
+      of days, grouped by any of `source`, `medium`, `campaign`, `bucket`
+
+  5. Security
+    - Enable RLS on both tables
+    - Add policies for service role access
+*/
+
+CREATE TABLE IF NOT EXISTS purchase_attributions (
+  purchase_id uuid PRIMARY KEY REFERENCES purchase_webhooks(id) ON DELETE CASCADE,
+  lead_id uuid REFERENCES lead_webhooks(id) ON DELETE SET NULL,
+  matched_by text NOT NULL,
+  purchased_at timestamptz NOT NULL,
+  value numeric NOT NULL DEFAULT 0,
+  currency text,
+  utm_source text NOT NULL DEFAULT '',
+  utm_medium text NOT NULL DEFAULT '',
+  utm_campaign text NOT NULL DEFAULT '',
+  bucket_id text NOT NULL DEFAULT '',
+  quiz_answers jsonb NOT NULL DEFAULT '{}',
+  resolved_at timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE TABLE IF NOT EXISTS attribution_rollups (
+  day date NOT NULL,
+  utm_source text NOT NULL DEFAULT '',
+  utm_medium text NOT NULL DEFAULT '',
+  utm_campaign text NOT NULL DEFAULT '',
+  bucket_id text NOT NULL DEFAULT '',
+  leads bigint NOT NULL DEFAULT 0,
+  purchases bigint NOT NULL DEFAULT 0,
+  attributed_purchases bigint NOT NULL DEFAULT 0,
+  revenue numeric NOT NULL DEFAULT 0,
+  PRIMARY KEY (day, utm_source, utm_medium, utm_campaign, bucket_id)
+);
+
+ALTER TABLE purchase_attributions ENABLE ROW LEVEL SECURITY;
+ALTER TABLE attribution_rollups ENABLE ROW LEVEL SECURITY;
+
+-- Policies for service role access (backend API)
+CREATE POLICY "Service role can manage purchase attributions"
+  ON purchase_attributions
+  FOR ALL
+  TO service_role
+  USING (true)
+  WITH CHECK (true);
+
+CREATE POLICY "Service role can manage attribution rollups"
+  ON attribution_rollups
+  FOR ALL
+  TO service_role
+  USING (true)
+  WITH CHECK (true);
+
+-- Lookups by match key, newest first within the window
+CREATE INDEX IF NOT EXISTS idx_lead_webhooks_fbclid_created_at ON lead_webhooks(fbclid, created_at DESC) WHERE fbclid IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_lead_webhooks_fbc_created_at ON lead_webhooks(_fbc, created_at DESC) WHERE _fbc IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_lead_webhooks_fbp_created_at ON lead_webhooks(_fbp, created_at DESC) WHERE _fbp IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_lead_webhooks_lower_email_created_at ON lead_webhooks(lower(email), created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_purchase_webhooks_fbclid_created_at ON purchase_webhooks(fbclid, created_at) WHERE fbclid IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_purchase_webhooks_fbc_created_at ON purchase_webhooks(_fbc, created_at) WHERE _fbc IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_purchase_webhooks_fbp_created_at ON purchase_webhooks(_fbp, created_at) WHERE _fbp IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_purchase_webhooks_lower_email_created_at ON purchase_webhooks(lower(email), created_at);
+CREATE INDEX IF NOT EXISTS idx_purchase_attributions_lead_id ON purchase_attributions(lead_id);
+
+CREATE OR REPLACE FUNCTION attribution_window()
+RETURNS interval AS $$
+  SELECT interval '30 days';
+$$ language 'sql' IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION attribute_purchases(
+  p_purchase_ids uuid[],
+  p_window interval DEFAULT attribution_window()
+)
+RETURNS void AS $$
+BEGIN
+  -- A purchase and a late lead for it can be resolving the same row at once
+  PERFORM 1 FROM purchase_webhooks WHERE id = ANY(p_purchase_ids) ORDER BY id FOR UPDATE;
+
+  -- Take back what the previous attribution of these purchases added
+  WITH previous AS (
+    DELETE FROM purchase_attributions WHERE purchase_id = ANY(p_purchase_ids) RETURNING *
+  )
+  INSERT INTO attribution_rollups AS r
+    (day, utm_source, utm_medium, utm_campaign, bucket_id, purchases, attributed_purchases, revenue)
+  SELECT
+    (purchased_at AT TIME ZONE 'UTC')::date, utm_source, utm_medium, utm_campaign, bucket_id,
+    -count(*), -count(*) FILTER (WHERE matched_by <> 'none'), -sum(value)
+  FROM previous
+  GROUP BY 1, 2, 3, 4, 5
+  ON CONFLICT (day, utm_source, utm_medium, utm_campaign, bucket_id) DO UPDATE SET
+    purchases = r.purchases + EXCLUDED.purchases,
+    attributed_purchases = r.attributed_purchases + EXCLUDED.attributed_purchases,
+    revenue = r.revenue + EXCLUDED.revenue;
+
+  WITH resolved AS (
+    INSERT INTO purchase_attributions (
+      purchase_id, lead_id, matched_by, purchased_at, value, currency,
+      utm_source, utm_medium, utm_campaign, bucket_id, quiz_answers
+    )
+    SELECT
+      p.id, l.id, coalesce(l.matched_by, 'none'), coalesce(p.created_at, now()), coalesce(p.value, 0), p.currency,
+      coalesce(CASE WHEN l.id IS NULL THEN p.utm_source ELSE l.utm_source END, ''),
+      coalesce(CASE WHEN l.id IS NULL THEN p.utm_medium ELSE l.utm_medium END, ''),
+      coalesce(CASE WHEN l.id IS NULL THEN p.utm_campaign ELSE l.utm_campaign END, ''),
+      coalesce(l.bucket_id, ''),
+      coalesce(l.quiz_answers, '{}')
+    FROM purchase_webhooks p
+    LEFT JOIN LATERAL (
+      SELECT m.*
+      FROM (
+        (SELECT l.*, 1 AS priority, 'fbclid' AS matched_by FROM lead_webhooks l
+          WHERE p.fbclid IS NOT NULL AND l.fbclid = p.fbclid
+            AND l.created_at <= coalesce(p.created_at, now()) AND l.created_at > coalesce(p.created_at, now()) - p_window
+          ORDER BY l.created_at DESC LIMIT 1)
+        UNION ALL
+        (SELECT l.*, 2, '_fbc' FROM lead_webhooks l
+          WHERE p._fbc IS NOT NULL AND l._fbc = p._fbc
+            AND l.created_at <= coalesce(p.created_at, now()) AND l.created_at > coalesce(p.created_at, now()) - p_window
+          ORDER BY l.created_at DESC LIMIT 1)
+        UNION ALL
+        (SELECT l.*, 3, '_fbp' FROM lead_webhooks l
+          WHERE p._fbp IS NOT NULL AND l._fbp = p._fbp
+            AND l.created_at <= coalesce(p.created_at, now()) AND l.created_at > coalesce(p.created_at, now()) - p_window
+          ORDER BY l.created_at DESC LIMIT 1)
+        UNION ALL
+        (SELECT l.*, 4, 'email' FROM lead_webhooks l
+          WHERE lower(l.email) = lower(p.email)
+            AND l.created_at <= coalesce(p.created_at, now()) AND l.created_at > coalesce(p.created_at, now()) - p_window
+          ORDER BY l.created_at DESC LIMIT 1)
+      ) m
+      ORDER BY m.priority
+      LIMIT 1
+    ) l ON true
+    WHERE p.id = ANY(p_purchase_ids)
+    RETURNING *
+  ), counted AS (
+    INSERT INTO attribution_rollups AS r
+      (day, utm_source, utm_medium, utm_campaign, bucket_id, purchases, attributed_purchases, revenue)
+    SELECT
+      (purchased_at AT TIME ZONE 'UTC')::date, utm_source, utm_medium, utm_campaign, bucket_id,
+      count(*), count(*) FILTER (WHERE matched_by <> 'none'), sum(value)
+    FROM resolved
+    GROUP BY 1, 2, 3, 4, 5
+    ON CONFLICT (day, utm_source, utm_medium, utm_campaign, bucket_id) DO UPDATE SET
+      purchases = r.purchases + EXCLUDED.purchases,
+      attributed_purchases = r.attributed_purchases + EXCLUDED.attributed_purchases,
+      revenue = r.revenue + EXCLUDED.revenue
+  )
+  UPDATE purchase_webhooks p
+  SET quiz_answers = resolved.quiz_answers
+  FROM resolved
+  WHERE p.id = resolved.purchase_id
+    AND resolved.matched_by <> 'none'
+    AND p.quiz_answers IS DISTINCT FROM resolved.quiz_answers;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION attribution_report(
+  p_group_by text[],
+  p_from date DEFAULT NULL,
+  p_to date DEFAULT NULL
+)
+RETURNS TABLE (
+  utm_source text,
+  utm_medium text,
+  utm_campaign text,
+  bucket_id text,
+  leads bigint,
+  purchases bigint,
+  attributed_purchases bigint,
+  revenue numeric
+) AS $$
+  SELECT
+    CASE WHEN 'source' = ANY(p_group_by) THEN r.utm_source END,
+    CASE WHEN 'medium' = ANY(p_group_by) THEN r.utm_medium END,
+    CASE WHEN 'campaign' = ANY(p_group_by) THEN r.utm_campaign END,
+    CASE WHEN 'bucket' = ANY(p_group_by) THEN r.bucket_id END,
+    sum(r.leads)::bigint,
+    sum(r.purchases)::bigint,
+    sum(r.attributed_purchases)::bigint,
+    sum(r.revenue)
+  FROM attribution_rollups r
+  WHERE (p_from IS NULL OR r.day >= p_from)
+    AND (p_to IS NULL OR r.day < p_to)
+  GROUP BY 1, 2, 3, 4;
+$$ language 'sql' STABLE;
+
+-- Trigger functions
+
+CREATE OR REPLACE FUNCTION attribution_purchases_insert()
+RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM attribute_purchases(ARRAY(SELECT id FROM new_rows));
+  RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION attribution_leads_insert()
+RETURNS TRIGGER AS $$
+DECLARE
+  purchase_ids uuid[];
+BEGIN
+  INSERT INTO attribution_rollups AS r (day, utm_source, utm_medium, utm_campaign, bucket_id, leads)
+  SELECT
+    (coalesce(created_at, now()) AT TIME ZONE 'UTC')::date,
+    coalesce(utm_source, ''), coalesce(utm_medium, ''), coalesce(utm_campaign, ''), coalesce(bucket_id, ''),
+    count(*)
+  FROM new_rows
+  GROUP BY 1, 2, 3, 4, 5
+  ON CONFLICT (day, utm_source, utm_medium, utm_campaign, bucket_id) DO UPDATE SET
+    leads = r.leads + EXCLUDED.leads;
+
+  -- Leads normally come before their purchase; these are the exceptions
+  purchase_ids := ARRAY(
+    SELECT p.id FROM new_rows l JOIN purchase_webhooks p ON p.fbclid = l.fbclid
+      WHERE l.fbclid IS NOT NULL AND p.created_at >= l.created_at AND p.created_at < l.created_at + attribution_window()
+    UNION
+    SELECT p.id FROM new_rows l JOIN purchase_webhooks p ON p._fbc = l._fbc
+      WHERE l._fbc IS NOT NULL AND p.created_at >= l.created_at AND p.created_at < l.created_at + attribution_window()
+    UNION
+    SELECT p.id FROM new_rows l JOIN purchase_webhooks p ON p._fbp = l._fbp
+      WHERE l._fbp IS NOT NULL AND p.created_at >= l.created_at AND p.created_at < l.created_at + attribution_window()
+    UNION
+    SELECT p.id FROM new_rows l JOIN purchase_webhooks p ON lower(p.email) = lower(l.email)
+      WHERE p.created_at >= l.created_at AND p.created_at < l.created_at + attribution_window()
+  );
+  IF cardinality(purchase_ids) > 0 THEN
+    PERFORM attribute_purchases(purchase_ids);
+  END IF;
+  RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+DROP TRIGGER IF EXISTS attribution_purchase_webhooks_insert ON purchase_webhooks;
+CREATE TRIGGER attribution_purchase_webhooks_insert
+AFTER INSERT ON purchase_webhooks
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION attribution_purchases_insert();
+
+DROP TRIGGER IF EXISTS attribution_lead_webhooks_insert ON lead_webhooks;
+CREATE TRIGGER attribution_lead_webhooks_insert
+AFTER INSERT ON lead_webhooks
+REFERENCING NEW TABLE AS new_rows
+FOR EACH STATEMENT
+EXECUTE FUNCTION attribution_leads_insert();
+
+-- Backfill from existing rows
+INSERT INTO attribution_rollups AS r (day, utm_source, utm_medium, utm_campaign, bucket_id, leads)
+SELECT
+  (coalesce(created_at, now()) AT TIME ZONE 'UTC')::date,
+  coalesce(utm_source, ''), coalesce(utm_medium, ''), coalesce(utm_campaign, ''), coalesce(bucket_id, ''),
+  count(*)
+FROM lead_webhooks
+GROUP BY 1, 2, 3, 4, 5
+ON CONFLICT (day, utm_source, utm_medium, utm_campaign, bucket_id) DO UPDATE SET
+  leads = r.leads + EXCLUDED.leads;
+SELECT attribute_purchases(ARRAY(SELECT id FROM purchase_webhooks));
@@ -0,0 +1,197 @@
+/*
+  # Analytics cube
+
+  1. New Tables
+    - `attribution_rollups_monthly`: `attribution_rollups` summed per UTC
+      month (`month` is the first day), same dimensions and measures
+
+  2. Triggers
+    - Row-level trigger on `attribution_rollups`: every change to a daily
+      cell is added to its month, whatever made it (lead and purchase
+      inserts, re-attributions)
+
+  3. Functions
+    - `analytics_cube(group_by, granularity, from, to, sources, mediums,
+      campaigns, buckets, limit)`: leads, purchases and revenue grouped by
+      any of `date`, `source`, `medium`, `campaign`, `bucket` and filtered
+      by the dimension arrays (NULL = no filter). Whole months in the range
+      are read from the monthly table unless the result is grouped by day
+      or week, so the rows scanned depend on the range and the number of
+      UTM combinations, not on the raw webhook rows. The first row is the
+      grand total (`is_total`), then the groups by date and revenue: at
+      most `limit`, plus one more when the result was cut.
+
+  4. Security
+    - Enable RLS on `attribution_rollups_monthly` table
+    - Add policy for service role access
+*/
+
+CREATE TABLE IF NOT EXISTS attribution_rollups_monthly (
+  month date NOT NULL,
+  utm_source text NOT NULL DEFAULT '',
+  utm_medium text NOT NULL DEFAULT '',
+  utm_campaign text NOT NULL DEFAULT '',
+  bucket_id text NOT NULL DEFAULT '',
+  leads bigint NOT NULL DEFAULT 0,
+  purchases bigint NOT NULL DEFAULT 0,
+  attributed_purchases bigint NOT NULL DEFAULT 0,
+  revenue numeric NOT NULL DEFAULT 0,
+  PRIMARY KEY (month, utm_source, utm_medium, utm_campaign, bucket_id)
+);
+
+ALTER TABLE attribution_rollups_monthly ENABLE ROW LEVEL SECURITY;
+
+-- Policy for service role access (backend API)
+CREATE POLICY "Service role can manage monthly attribution rollups"
+  ON attribution_rollups_monthly
+  FOR ALL
+  TO service_role
+  USING (true)
+  WITH CHECK (true);
+
+CREATE OR REPLACE FUNCTION add_to_attribution_rollups_monthly(
+  p_day date,
+  p_utm_source text,
+  p_utm_medium text,
+  p_utm_campaign text,
+  p_bucket_id text,
+  p_leads bigint,
+  p_purchases bigint,
+  p_attributed_purchases bigint,
+  p_revenue numeric
+)
+RETURNS void AS $$
+  INSERT INTO attribution_rollups_monthly AS m
+    (month, utm_source, utm_medium, utm_campaign, bucket_id, leads, purchases, attributed_purchases, revenue)
+  VALUES (
+    date_trunc('month', p_day::timestamp)::date, p_utm_source, p_utm_medium, p_utm_campaign, p_bucket_id,
+    p_leads, p_purchases, p_attributed_purchases, p_revenue
+  )
+  ON CONFLICT (month, utm_source, utm_medium, utm_campaign, bucket_id) DO UPDATE SET
+    leads = m.leads + EXCLUDED.leads,
+    purchases = m.purchases + EXCLUDED.purchases,
+    attributed_purchases = m.attributed_purchases + EXCLUDED.attributed_purchases,
+    revenue = m.revenue + EXCLUDED.revenue;
+$$ language 'sql';
+
+CREATE OR REPLACE FUNCTION attribution_rollups_to_monthly()
+RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP IN ('UPDATE', 'DELETE') THEN
+    PERFORM add_to_attribution_rollups_monthly(
+      OLD.day, OLD.utm_source, OLD.utm_medium, OLD.utm_campaign, OLD.bucket_id,
+      -OLD.leads, -OLD.purchases, -OLD.attributed_purchases, -OLD.revenue
+    );
+  END IF;
+  IF TG_OP IN ('INSERT', 'UPDATE') THEN
+    PERFORM add_to_attribution_rollups_monthly(
+      NEW.day, NEW.utm_source, NEW.utm_medium, NEW.utm_campaign, NEW.bucket_id,
+      NEW.leads, NEW.purchases, NEW.attributed_purchases, NEW.revenue
+    );
+  END IF;
+  RETURN NULL;
+END;
+$$ language 'plpgsql';
+
+CREATE OR REPLACE FUNCTION analytics_cube(
+  p_group_by text[],
+  p_granularity text DEFAULT 'day',
+  p_from date DEFAULT NULL,
+  p_to date DEFAULT NULL,
+  p_sources text[] DEFAULT NULL,
+  p_mediums text[] DEFAULT NULL,
+  p_campaigns text[] DEFAULT NULL,
+  p_buckets text[] DEFAULT NULL,
+  p_limit integer DEFAULT 1000
+)
+RETURNS TABLE (
+  is_total boolean,
+  period date,
+  utm_source text,
+  utm_medium text,
+  utm_campaign text,
+  bucket_id text,
+  leads bigint,
+  purchases bigint,
+  attributed_purchases bigint,
+  revenue numeric
+) AS $$
+DECLARE
+  day_from date := coalesce(p_from, '-infinity');
+  day_to date := coalesce(p_to, 'infinity');
+  -- First month starting on or after p_from, and the month p_to falls in
+  months_from date := coalesce(date_trunc('month', p_from - 1 + interval '1 month')::date, '-infinity');
+  months_to date := coalesce(date_trunc('month', p_to::timestamp)::date, 'infinity');
+BEGIN
+  -- Day and week buckets don't line up with months; a short range may hold no whole month
+  IF ('date' = ANY(p_group_by) AND p_granularity IN ('day', 'week')) OR months_from >= months_to THEN
+    months_from := day_to;
+    months_to := day_to;
+  END IF;
+
+  -- Days in [day_from, months_from) and [months_to, day_to), whole months in between:
+  -- three index range scans
+  RETURN QUERY
+  WITH cells AS (
+    SELECT r.day, r.utm_source, r.utm_medium, r.utm_campaign, r.bucket_id,
+           r.leads, r.purchases, r.attributed_purchases, r.revenue
+    FROM attribution_rollups r
+    WHERE r.day >= day_from AND r.day < months_from
+    UNION ALL
+    SELECT m.month, m.utm_source, m.utm_medium, m.utm_campaign, m.bucket_id,
+           m.leads, m.purchases, m.attributed_purchases, m.revenue
+    FROM attribution_rollups_monthly m
+    WHERE m.month >= months_from AND m.month < months_to
+    UNION ALL
+    SELECT r.day, r.utm_source, r.utm_medium, r.utm_campaign, r.bucket_id,
+           r.leads, r.purchases, r.attributed_purchases, r.revenue
+    FROM attribution_rollups r
+    WHERE r.day >= months_to AND r.day < day_to
+  ),
+  keyed AS (
+    SELECT
+      CASE WHEN 'date' = ANY(p_group_by) THEN date_trunc(p_granularity, c.day::timestamp)::date END AS k_period,
+      CASE WHEN 'source' = ANY(p_group_by) THEN c.utm_source END AS k_source,
+      CASE WHEN 'medium' = ANY(p_group_by) THEN c.utm_medium END AS k_medium,
+      CASE WHEN 'campaign' = ANY(p_group_by) THEN c.utm_campaign END AS k_campaign,
+      CASE WHEN 'bucket' = ANY(p_group_by) THEN c.bucket_id END AS k_bucket,
+      c.leads AS k_leads, c.purchases AS k_purchases, c.attributed_purchases AS k_attributed, c.revenue AS k_revenue
+    FROM cells c
+    WHERE (p_sources IS NULL OR c.utm_source = ANY(p_sources))
+      AND (p_mediums IS NULL OR c.utm_medium = ANY(p_mediums))
+      AND (p_campaigns IS NULL OR c.utm_campaign = ANY(p_campaigns))
+      AND (p_buckets IS NULL OR c.bucket_id = ANY(p_buckets))
+  )
+  SELECT
+    grouping(k.k_period, k.k_source, k.k_medium, k.k_campaign, k.k_bucket) <> 0,
+    k.k_period, k.k_source, k.k_medium, k.k_campaign, k.k_bucket,
+    coalesce(sum(k.k_leads), 0)::bigint,
+    coalesce(sum(k.k_purchases), 0)::bigint,
+    coalesce(sum(k.k_attributed), 0)::bigint,
+    coalesce(sum(k.k_revenue), 0)
+  FROM keyed k
+  GROUP BY GROUPING SETS ((k.k_period, k.k_source, k.k_medium, k.k_campaign, k.k_bucket), ())
+  ORDER BY 1 DESC, 2, 10 DESC, 7 DESC
+  LIMIT p_limit + 2;
+END;
+$$ language 'plpgsql' STABLE;
+
+-- Backfill from the daily rollups, then keep them in step. The lock holds
+-- rollup writes until the migration commits, so none lands between the
+-- backfill and the trigger.
+LOCK TABLE attribution_rollups IN SHARE ROW EXCLUSIVE MODE;
+
+INSERT INTO attribution_rollups_monthly
+  (month, utm_source, utm_medium, utm_campaign, bucket_id, leads, purchases, attributed_purchases, revenue)
+SELECT
+  date_trunc('month', day::timestamp)::date, utm_source, utm_medium, utm_campaign, bucket_id,
+  sum(leads), sum(purchases), sum(attributed_purchases), sum(revenue)
+FROM attribution_rollups
+GROUP BY 1, 2, 3, 4, 5
+ON CONFLICT (month, utm_source, utm_medium, utm_campaign, bucket_id) DO NOTHING;
+
+DROP TRIGGER IF EXISTS attribution_rollups_monthly ON attribution_rollups;
+CREATE TRIGGER attribution_rollups_monthly
+AFTER INSERT OR UPDATE OR DELETE ON attribution_rollups
+FOR EACH ROW
+EXECUTE FUNCTION attribution_rollups_to_monthly();
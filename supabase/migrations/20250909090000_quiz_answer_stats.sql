@@ -0,0 +1,131 @@
+/*
+  # Quiz answer stats
+
+  1. Indexes
+    - `quiz_tracking (created_at)` for time windows
+    - GIN (`jsonb_path_ops`) on `lead_webhooks.quiz_answers`, so segmenting
+      leads by an answer is an index lookup like on `quiz_tracking.answers`
+
+  2. Functions
+    - `quiz_answer_choices(value)`: the options chosen in the answer to one
+      question, one for single-choice answers and every element of the
+      array for multi-select ones; `is_first` marks one of them
+    - `quiz_answer_stats(from, to, question, answer)`: per question and
+      answer, quiz sessions that chose it (`quiz_tracking`) and how many of
+      them completed the quiz, leads that chose it (`lead_webhooks`) and
+      the purchases attributed to those leads. Rows with a NULL `answer`
+      count each session or lead once per question, the row with a NULL
+      `question` is the whole window. `question` and `answer` restrict
+      everything to sessions and leads that gave that answer.
+*/
+
+CREATE INDEX IF NOT EXISTS idx_quiz_tracking_created_at ON quiz_tracking (created_at);
+
+CREATE INDEX IF NOT EXISTS idx_lead_webhooks_quiz_answers
+  ON lead_webhooks USING GIN (quiz_answers jsonb_path_ops);
+
+CREATE OR REPLACE FUNCTION quiz_answer_choices(p_value jsonb)
+RETURNS TABLE (answer text, is_first boolean) AS $$
+  SELECT x.answer, x.position = 1
+  FROM jsonb_array_elements_text(CASE WHEN jsonb_typeof(p_value) = 'array' THEN p_value ELSE '[]' END)
+    WITH ORDINALITY AS x (answer, position)
+  UNION ALL
+  SELECT p_value #>> '{}', true
+  WHERE jsonb_typeof(p_value) NOT IN ('array', 'object', 'null')
+$$ language 'sql' IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION quiz_answer_stats(
+  p_from date DEFAULT NULL,
+  p_to date DEFAULT NULL,
+  p_question text DEFAULT NULL,
+  p_answer text DEFAULT NULL
+)
+RETURNS TABLE (
+  question text,
+  answer text,
+  sessions bigint,
+  completed bigint,
+  leads bigint,
+  purchases bigint,
+  revenue numeric
+) AS $$
+DECLARE
+  -- The answer is a string for single-choice questions and an array for multi-select ones
+  single jsonb := CASE WHEN p_question IS NOT NULL THEN jsonb_build_object(p_question, p_answer) END;
+  multiple jsonb := CASE WHEN p_question IS NOT NULL THEN jsonb_build_object(p_question, jsonb_build_array(p_answer)) END;
+BEGIN
+  -- EXECUTE plans the query for these arguments: open bounds and a missing
+  -- segment drop out, and a segment is a containment test on the GIN indexes
+  RETURN QUERY EXECUTE $query$
+    WITH
+    -- One pass over each table: sessions and leads per question and answer value, plus
+    -- an extra (NULL, NULL) item per row that counts the row itself for the totals
+    session_values AS (
+      SELECT a.key AS question, a.value, count(*) AS sessions, count(*) FILTER (WHERE t.quiz_completed) AS completed,
+             0 AS leads, 0::bigint AS purchases, 0::numeric AS revenue
+      FROM quiz_tracking t
+      CROSS JOIN LATERAL (
+        SELECT e.key, e.value FROM jsonb_each(CASE WHEN jsonb_typeof(t.answers) = 'object' THEN t.answers END) AS e
+        UNION ALL
+        SELECT NULL, NULL
+      ) AS a
+      WHERE ($1 IS NULL OR t.created_at >= $1::timestamp AT TIME ZONE 'UTC')
+        AND ($2 IS NULL OR t.created_at < $2::timestamp AT TIME ZONE 'UTC')
+        AND ($3 IS NULL OR t.answers @> $3 OR t.answers @> $4)
+      GROUP BY a.key, a.value
+    ),
+    lead_values AS (
+      SELECT a.key AS question, a.value, 0 AS sessions, 0 AS completed,
+             count(*) AS leads, coalesce(sum(p.purchases), 0)::bigint AS purchases, coalesce(sum(p.revenue), 0) AS revenue
+      FROM lead_webhooks l
+      LEFT JOIN (
+        SELECT pa.lead_id, count(*) AS purchases, sum(pa.value) AS revenue
+        FROM purchase_attributions pa
+        WHERE pa.lead_id IS NOT NULL
+        GROUP BY pa.lead_id
+      ) AS p ON p.lead_id = l.id
+      CROSS JOIN LATERAL (
+        SELECT e.key, e.value FROM jsonb_each(CASE WHEN jsonb_typeof(l.quiz_answers) = 'object' THEN l.quiz_answers END) AS e
+        UNION ALL
+        SELECT NULL, NULL
+      ) AS a
+      WHERE ($1 IS NULL OR l.created_at >= $1::timestamp AT TIME ZONE 'UTC')
+        AND ($2 IS NULL OR l.created_at < $2::timestamp AT TIME ZONE 'UTC')
+        AND ($3 IS NULL OR l.quiz_answers @> $3 OR l.quiz_answers @> $4)
+      GROUP BY a.key, a.value
+    ),
+    answer_values AS (
+      SELECT * FROM session_values
+      UNION ALL
+      SELECT * FROM lead_values
+    ),
+    -- Split the few distinct multi-select values into their options
+    answer_counts AS (
+      SELECT v.question, c.answer, c.is_first,
+             sum(v.sessions) AS sessions, sum(v.completed) AS completed, sum(v.leads) AS leads,
+             sum(v.purchases) AS purchases, sum(v.revenue) AS revenue
+      FROM answer_values v CROSS JOIN LATERAL quiz_answer_choices(v.value) AS c
+      WHERE v.question IS NOT NULL
+      GROUP BY v.question, c.answer, c.is_first
+    )
+    SELECT
+      c.question,
+      c.answer,
+      -- Per question, a multi-select session or lead counts once
+      (CASE WHEN grouping(c.answer) = 0 THEN sum(c.sessions) ELSE sum(c.sessions) FILTER (WHERE c.is_first) END)::bigint,
+      (CASE WHEN grouping(c.answer) = 0 THEN sum(c.completed) ELSE sum(c.completed) FILTER (WHERE c.is_first) END)::bigint,
+      (CASE WHEN grouping(c.answer) = 0 THEN sum(c.leads) ELSE sum(c.leads) FILTER (WHERE c.is_first) END)::bigint,
+      (CASE WHEN grouping(c.answer) = 0 THEN sum(c.purchases) ELSE sum(c.purchases) FILTER (WHERE c.is_first) END)::bigint,
+      CASE WHEN grouping(c.answer) = 0 THEN sum(c.revenue) ELSE sum(c.revenue) FILTER (WHERE c.is_first) END
+    FROM answer_counts c
+    GROUP BY GROUPING SETS ((c.question, c.answer), (c.question))
+    UNION ALL
+    SELECT NULL, NULL,
+           coalesce(sum(v.sessions), 0)::bigint, coalesce(sum(v.completed), 0)::bigint,
+           coalesce(sum(v.leads), 0)::bigint, coalesce(sum(v.purchases), 0)::bigint, coalesce(sum(v.revenue), 0)
+    FROM answer_values v
+    WHERE v.question IS NULL
+  $query$
+  USING p_from, p_to, single, multiple;
+END;
+$$ language 'plpgsql' STABLE;